@@ -0,0 +1,153 @@
+import os
+import time
+from collections import Counter
+import deep_whatsapp_analyzer
+import parse_cache
+from heavy_hitters import counter_total
+
+# Name of the cross-chat summary written to the batch output directory
+SUMMARY_NAME = 'batch_summary.txt'
+
+# Number of emojis kept per chat for the cross-chat summary
+SUMMARY_EMOJIS = 50
+
+
+def find_exports(directory):
+    """Return the .txt exports in a directory and in its samples/ folder"""
+    paths = []
+    for folder in (directory, os.path.join(directory, 'samples')):
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, name)
+            if name.endswith('.txt') and os.path.isfile(path):
+                paths.append(path)
+    return paths
+
+
+def output_dir_for(file_path, directory, output_root):
+    """Return the output directory for one export of a batch"""
+    relative = os.path.splitext(os.path.relpath(file_path, directory))[0]
+    return os.path.join(output_root, relative)
+
+
+def analyze_export(file_path, output_dir, plots=True, cache_dir=None,
+                   cache_size=parse_cache.DEFAULT_MAX_BYTES, dialect='auto', **options):
+    """Analyze one export into ``output_dir`` and return a short summary.
+
+    ``cache_dir`` enables the parse cache, ``options`` are passed on to
+    analyze_whatsapp_chat(). Chart failures (e.g. a missing optional
+    package) are ignored; any other error is raised to the caller.
+    """
+    start = time.perf_counter()
+
+    def analyze():
+        return deep_whatsapp_analyzer.analyze_whatsapp_chat(file_path, **options)
+
+    if cache_dir is None:
+        data = analyze()
+    else:
+        cache = parse_cache.ParseCache(cache_dir, cache_size)
+        data = parse_cache.analyze_cached(
+            file_path, analyze, cache, columnar=options.get('columnar', False),
+            dialect=dialect, vocabulary_size=options.get('vocabulary_size'))
+
+    if not data['message_count']:
+        raise ValueError("no messages found or incorrect file format")
+
+    os.makedirs(output_dir, exist_ok=True)
+    deep_whatsapp_analyzer.generate_statistics_report(data, output_dir)
+    if plots:
+        for _ in deep_whatsapp_analyzer.render_charts(data, output_dir):
+            pass
+
+    return {
+        'file': file_path,
+        'output': output_dir,
+        'bytes': os.path.getsize(file_path),
+        'seconds': time.perf_counter() - start,
+        'message_count': Counter(data['message_count']),
+        'media_count': sum(data['media_count'].values()),
+        'words': counter_total(data['word_count']),
+        'emoji_count': Counter(dict(data['emoji_count'].most_common(SUMMARY_EMOJIS))),
+    }
+
+
+def analyze_batch(tasks, jobs=1):
+    """Analyze exports and yield (file path, summary, error) as each one
+    finishes.
+
+    ``tasks`` is a list of (file path, output directory, options) tuples.
+    With ``jobs`` above one the exports are analyzed in a process pool. An
+    export that fails yields its exception instead of a summary and does
+    not stop the others.
+    """
+    if jobs <= 1:
+        for file_path, output_dir, options in tasks:
+            try:
+                yield file_path, analyze_export(file_path, output_dir, **options), None
+            except Exception as exc:
+                yield file_path, None, exc
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+        futures = {executor.submit(analyze_export, file_path, output_dir, **options): file_path
+                   for file_path, output_dir, options in tasks}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as exc:
+                yield futures[future], None, exc
+
+
+def write_batch_summary(summaries, failures, output_root):
+    """Write the cross-chat summary and return its path.
+
+    ``summaries`` are the results of analyze_export() and ``failures`` a
+    list of (file path, exception) pairs.
+    """
+    path = os.path.join(output_root, SUMMARY_NAME)
+    senders = Counter()
+    emojis = Counter()
+    for summary in summaries:
+        senders.update(summary['message_count'])
+        emojis.update(summary['emoji_count'])
+    total_messages = sum(senders.values())
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("===== WhatsApp Batch Analysis Summary =====\n\n")
+        f.write(f"Chats Analyzed: {len(summaries)}\n")
+        f.write(f"Chats Failed: {len(failures)}\n")
+        f.write(f"Total Messages: {total_messages}\n")
+        f.write(f"Total Media Messages: {sum(s['media_count'] for s in summaries)}\n")
+        f.write(f"Total Words: {sum(s['words'] for s in summaries)}\n")
+        f.write(f"Distinct Senders: {len(senders)}\n\n")
+
+        f.write("Chats by Message Count:\n")
+        ranked = sorted(summaries, key=lambda s: sum(s['message_count'].values()), reverse=True)
+        for i, summary in enumerate(ranked, 1):
+            messages = sum(summary['message_count'].values())
+            top_sender, top_count = summary['message_count'].most_common(1)[0]
+            f.write(f"{i}. {summary['file']}: {messages} messages, "
+                    f"{len(summary['message_count'])} members, "
+                    f"most active: {top_sender} ({top_count})\n")
+
+        if senders:
+            f.write("\nTop 10 Senders Across Chats:\n")
+            for i, (sender, count) in enumerate(senders.most_common(10), 1):
+                percentage = (count / total_messages) * 100
+                f.write(f"{i}. {sender}: {count} messages ({percentage:.1f}%)\n")
+
+        if emojis:
+            f.write("\nTop 5 Emojis Across Chats:\n")
+            for i, (emoji_char, count) in enumerate(emojis.most_common(5), 1):
+                f.write(f"{i}. {emoji_char}: {count} times\n")
+
+        if failures:
+            f.write("\nFailed Chats:\n")
+            for file_path, error in failures:
+                f.write(f"- {file_path}: {error}\n")
+
+    return path
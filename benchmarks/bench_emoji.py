@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Compare the emoji matcher with the old per-character EMOJI_DATA loop"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import emoji  # noqa: E402
+from emoji_matcher import get_emoji_matcher  # noqa: E402
+
+WORDS = ["hello", "meeting", "tomorrow", "thanks", "ok", "project", "coffee",
+         "नमस्ते", "café", "12345", "https://example.com"]
+
+
+def make_corpus(messages, emoji_density, seed=0):
+    """Build a list of synthetic messages where a share of tokens are emoji"""
+    rng = random.Random(seed)
+    emojis = sorted(emoji.EMOJI_DATA)
+    corpus = []
+    for _ in range(messages):
+        tokens = [rng.choice(emojis) if rng.random() < emoji_density else rng.choice(WORDS)
+                  for _ in range(rng.randint(1, 15))]
+        corpus.append(' '.join(tokens))
+    return corpus
+
+
+def count_per_character(corpus):
+    counts = Counter()
+    for text in corpus:
+        for char in text:
+            if char in emoji.EMOJI_DATA:
+                counts[char] += 1
+    return counts
+
+
+def count_with_matcher(corpus):
+    counts = Counter()
+    count = get_emoji_matcher().count
+    for text in corpus:
+        count(text, counts)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=500000)
+    parser.add_argument("--emoji-density", type=float, default=0.05,
+                        help="Share of tokens that are emoji")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.messages, args.emoji_density)
+    get_emoji_matcher()  # Build the matcher outside the timed section
+
+    for name, counter in [("per-character loop", count_per_character),
+                          ("emoji matcher", count_with_matcher)]:
+        start = time.perf_counter()
+        counts = counter(corpus)
+        elapsed = time.perf_counter() - start
+        print(f"{name:20s} {elapsed:7.2f}s  {args.messages / elapsed:10.0f} msg/s  "
+              f"{sum(counts.values())} emoji, {len(counts)} distinct")
+
+
+if __name__ == "__main__":
+    main()
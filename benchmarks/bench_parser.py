@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""Measure parser throughput and peak memory stage by stage on a synthetic chat.
+
+Each stage repeats the work of the stages before it and adds one step of
+the deep analyzer's parse engine: reading, splitting into messages,
+matching and decoding them into batches, then each metric collector in
+registry order (senders, media, ..., replies). The difference between
+consecutive stages is the cost of that step.
+The full deep and basic analyzers and chart plotting are measured too.
+Results can be saved as a baseline JSON and compared on later runs.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import deep_whatsapp_analyzer  # noqa: E402
+import whatsapp_analyzer  # noqa: E402
+from chat_formats import get_chat_format  # noqa: E402
+from metrics import metric_names  # noqa: E402
+from synthetic_chat import add_settings_arguments, generate_chat, settings_from_args  # noqa: E402
+
+# Steps of the parse engine before any metric: reading the export,
+# splitting it into messages, and matching and decoding them into batches
+ENGINE_STAGES = ["read", "split", "batch"]
+
+# Engine steps, then every metric collector in registry order
+PIPELINE_STAGES = ENGINE_STAGES + metric_names()
+
+
+def run_pipeline(file_path, stage, chat_format, encoding, chunk_size):
+    """Run the deep analyzer's parse engine up to and including ``stage``.
+
+    Metric stages run parse_messages() and finalize_results() with the
+    metrics up to ``stage`` selected, so a metric's step includes the
+    shared batch columns it is the first to need.
+    """
+    with open(file_path, 'r', encoding=encoding) as file:
+        if stage == "read":
+            while file.read(chunk_size):
+                pass
+            return
+        messages = deep_whatsapp_analyzer.iter_messages(file, chunk_size, chat_format)
+        if stage == "split":
+            for _ in messages:
+                pass
+            return
+        if stage == "batch":
+            for _ in deep_whatsapp_analyzer.iter_batches(messages, chat_format):
+                pass
+            return
+        selected = PIPELINE_STAGES[len(ENGINE_STAGES):PIPELINE_STAGES.index(stage) + 1]
+        deep_whatsapp_analyzer.finalize_results(deep_whatsapp_analyzer.parse_messages(
+            messages, chat_format=chat_format, metrics=selected))
+
+
+def make_stages(file_path, output_dir, chat_format, encoding, chunk_size, plots):
+    """Return (name, function) pairs for every measured stage"""
+    stages = [(stage, lambda stage=stage: run_pipeline(file_path, stage, chat_format, encoding,
+                                                       chunk_size))
+              for stage in PIPELINE_STAGES]
+    stages.append(("deep", lambda: deep_whatsapp_analyzer.analyze_whatsapp_chat(
+        file_path, chunk_size, chat_format=chat_format)))
+    stages.append(("basic", lambda: whatsapp_analyzer.analyze_whatsapp_chat(
+        file_path, chat_format)))
+    if plots:
+        data = deep_whatsapp_analyzer.analyze_whatsapp_chat(file_path, chunk_size,
+                                                            chat_format=chat_format)
+
+        def plot():
+            for name, _, error in deep_whatsapp_analyzer.render_charts(data, output_dir):
+                if error is not None:
+                    raise RuntimeError(f"{name} failed: {error}")
+
+        stages.append(("plotting", plot))
+    return stages
+
+
+def measure(function, repeat, memory):
+    """Return (fastest time in seconds, peak traced memory in bytes or None)"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    peak = None
+    if memory:
+        # Tracing slows allocation down, so memory is measured separately
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return min(timings), peak
+
+
+def compare(results, baseline, tolerance):
+    """Print the change from a baseline and return the regressed stages"""
+    regressions = []
+    print(f"\nCompared with baseline ({baseline['python']}, {baseline['settings']['messages']} "
+          f"messages):")
+    for stage, result in results.items():
+        old = baseline['results'].get(stage)
+        if old is None:
+            continue
+        speed = result['messages_per_s'] / old['messages_per_s'] - 1
+        line = f"{stage:10s} throughput {speed * 100:+6.1f}%"
+        regressed = speed < -tolerance
+        if result['peak_mb'] is not None and old.get('peak_mb'):
+            growth = result['peak_mb'] / old['peak_mb'] - 1
+            line += f"  peak memory {growth * 100:+6.1f}%"
+            regressed = regressed or growth > tolerance
+        if regressed:
+            line += "  REGRESSION"
+            regressions.append(stage)
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", help="Benchmark an existing export instead of a synthetic one")
+    add_settings_arguments(parser)
+    parser.add_argument("--chunk-size", type=int, default=deep_whatsapp_analyzer.CHUNK_SIZE)
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per stage; the fastest one is reported")
+    parser.add_argument("--no-memory", action="store_true", help="Skip peak memory measurement")
+    parser.add_argument("--no-plots", action="store_true", help="Skip the plotting stage")
+    parser.add_argument("--save-baseline", metavar="JSON", help="Write the results to a file")
+    parser.add_argument("--baseline", metavar="JSON", help="Compare with saved results")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Relative slowdown or memory growth reported as a regression")
+    args = parser.parse_args()
+
+    settings = settings_from_args(args)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if args.file:
+            file_path = args.file
+            chat_format = deep_whatsapp_analyzer.detect_file_format(file_path, args.encoding)
+        else:
+            file_path = os.path.join(temp_dir, "chat.txt")
+            generate_chat(file_path, args.encoding, **settings)
+            chat_format = get_chat_format(args.dialect)
+        size = os.path.getsize(file_path)
+        data = deep_whatsapp_analyzer.analyze_whatsapp_chat(file_path, args.chunk_size,
+                                                            chat_format=chat_format)
+        messages = sum(data['message_count'].values())
+        print(f"{file_path}: {messages} messages, {size / (1024 * 1024):.1f} MB, "
+              f"{chat_format.name}, {args.encoding}\n")
+
+        results = {}
+        previous = None
+        print(f"{'stage':10s} {'seconds':>8s} {'step':>8s} {'msg/s':>11s} {'MB/s':>8s} {'peak MB':>8s}")
+        for stage, function in make_stages(file_path, temp_dir, chat_format, args.encoding,
+                                           args.chunk_size, not args.no_plots):
+            seconds, peak = measure(function, args.repeat, not args.no_memory)
+            results[stage] = {
+                'seconds': seconds,
+                'messages_per_s': messages / seconds,
+                'mb_per_s': size / (1024 * 1024) / seconds,
+                'peak_mb': None if peak is None else peak / (1024 * 1024),
+            }
+            step = ""
+            if stage in PIPELINE_STAGES and previous is not None:
+                step = f"{seconds - previous:+8.2f}"
+            previous = seconds if stage in PIPELINE_STAGES else previous
+            peak_text = "" if peak is None else f"{peak / (1024 * 1024):8.1f}"
+            print(f"{stage:10s} {seconds:8.2f} {step:>8s} {messages / seconds:11.0f} "
+                  f"{size / (1024 * 1024) / seconds:8.1f} {peak_text}")
+
+    report = {
+        'python': platform.python_version(),
+        'settings': dict(settings, encoding=args.encoding, file=args.file, messages=messages),
+        'results': results,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Measure CLI start-up time and check that light commands skip heavy imports"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["matplotlib", "numpy", "emoji", "wordcloud"]
+
+# Commands and the heavy modules they must not import
+COMMANDS = [
+    (["basic", "--file", "sample_chat.txt"], HEAVY_MODULES),
+    (["version"], HEAVY_MODULES),
+    (["list-samples"], HEAVY_MODULES),
+]
+
+# Runs the CLI in-process, then reports which heavy modules were loaded
+RUNNER = """
+import runpy, sys
+sys.argv = ['cli.py'] + sys.argv[1:]
+try:
+    runpy.run_path('cli.py', run_name='__main__')
+finally:
+    loaded = [name for name in {modules!r} if name in sys.modules]
+    sys.stderr.write('LOADED:' + ','.join(loaded) + '\\n')
+"""
+
+
+def run_command(arguments):
+    """Run one CLI command and return (seconds, heavy modules loaded)"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", RUNNER.format(modules=HEAVY_MODULES)] + arguments,
+        cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        text=True, check=True)
+    elapsed = time.perf_counter() - start
+    loaded_line = [line for line in result.stderr.splitlines() if line.startswith("LOADED:")][-1]
+    loaded = [name for name in loaded_line[len("LOADED:"):].split(",") if name]
+    return elapsed, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Runs per command; the fastest one is reported")
+    args = parser.parse_args()
+
+    failures = []
+    for arguments, forbidden in COMMANDS:
+        timings = []
+        for _ in range(args.repeat):
+            elapsed, loaded = run_command(arguments)
+            timings.append(elapsed)
+        unexpected = [name for name in loaded if name in forbidden]
+        status = "ok" if not unexpected else "imports " + ", ".join(unexpected)
+        print(f"cli.py {' '.join(arguments):35s} {min(timings) * 1000:7.1f} ms  {status}")
+        if unexpected:
+            failures.append(arguments)
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
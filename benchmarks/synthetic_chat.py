@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Generate deterministic synthetic WhatsApp chat exports for benchmarking"""
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_formats import DEFAULT_FORMAT_NAME, format_names, get_chat_format  # noqa: E402
+
+FIRST_NAMES = ["John", "Jane", "Mike", "Sam", "Ana", "Priya", "Ravi", "Lena", "Omar", "Chen",
+               "Sofia", "Luca", "Amara", "Kenji", "Noah", "Maya", "Ivan", "Zoe", "Arjun", "Ella"]
+LAST_NAMES = ["Doe", "Smith", "Johnson", "Wilson", "Garcia", "Sharma", "Patel", "Muller",
+              "Khan", "Li", "Rossi", "Okafor", "Tanaka", "Brown", "Novak", "Silva"]
+
+WORDS = ["hello", "meeting", "tomorrow", "thanks", "ok", "project", "coffee", "lunch", "today",
+         "great", "see", "you", "later", "the", "and", "is", "on", "at", "what", "time",
+         "नमस्ते", "café", "12345", "https://example.com/link", "lol", "sure", "plan", "weekend"]
+
+EMOJIS = ["😊", "😂", "👍", "👍🏽", "❤️", "🎉", "🙏", "🔥", "☀️", "🇮🇳", "👨‍👩‍👧", "#️⃣"]
+
+MEDIA = {'android': "<Media omitted>", 'ios': "image omitted"}
+
+# Messages formatted before each write
+WRITE_BATCH = 10000
+
+
+def member_names(count):
+    """Return ``count`` distinct member names"""
+    return [f"{FIRST_NAMES[i % len(FIRST_NAMES)]} {LAST_NAMES[i // len(FIRST_NAMES) % len(LAST_NAMES)]}"
+            + (f" {i // (len(FIRST_NAMES) * len(LAST_NAMES)) + 1}"
+               if i >= len(FIRST_NAMES) * len(LAST_NAMES) else "")
+            for i in range(count)]
+
+
+def format_header(moment, sender, chat_format):
+    """Format the date, time and sender that start a message"""
+    if chat_format.order == 'dmy':
+        day_month = f"{moment.day:02d}/{moment.month:02d}"
+    else:
+        day_month = f"{moment.month:02d}/{moment.day:02d}"
+    hour = moment.hour
+    if chat_format.layout == 'android':
+        date_str = f"{day_month}/{moment.year % 100:02d}"
+        if chat_format.clock == '12h':
+            time_str = f"{hour % 12 or 12}:{moment.minute:02d} {'pm' if hour >= 12 else 'am'}"
+        else:
+            time_str = f"{hour:02d}:{moment.minute:02d}"
+        return f"{date_str}, {time_str} - {sender}: "
+    date_str = f"{day_month}/{moment.year}"
+    if chat_format.clock == '12h':
+        time_str = (f"{hour % 12 or 12}:{moment.minute:02d}:{moment.second:02d} "
+                    f"{'PM' if hour >= 12 else 'AM'}")
+    else:
+        time_str = f"{hour:02d}:{moment.minute:02d}:{moment.second:02d}"
+    return f"[{date_str}, {time_str}] {sender}: "
+
+
+def make_text(rng, emoji_density, multiline_ratio):
+    """Return the text of one non-media message"""
+    tokens = [rng.choice(EMOJIS) if rng.random() < emoji_density else rng.choice(WORDS)
+              for _ in range(rng.randint(1, 15))]
+    if multiline_ratio and rng.random() < multiline_ratio:
+        # Continuation lines never start with a date
+        cut = rng.randint(0, len(tokens))
+        return ' '.join(tokens[:cut]) + "\nalso " + ' '.join(tokens[cut:])
+    return ' '.join(tokens)
+
+
+def iter_chat_lines(members=20, messages=100000, days=365, multiline_ratio=0.05,
+                    emoji_density=0.05, media_ratio=0.05, dialect=DEFAULT_FORMAT_NAME,
+                    start=datetime(2022, 1, 1), seed=0):
+    """Yield the messages of a synthetic export, one string per message.
+
+    Messages are spread evenly over ``days`` days from ``start``. The same
+    settings and seed always produce the same chat.
+    """
+    rng = random.Random(seed)
+    chat_format = get_chat_format(dialect)
+    senders = member_names(members)
+    media = MEDIA[chat_format.layout]
+    step = timedelta(days=days) / max(messages, 1)
+    for index in range(messages):
+        moment = start + step * index
+        header = format_header(moment, rng.choice(senders), chat_format)
+        if rng.random() < media_ratio:
+            yield header + media
+        else:
+            yield header + make_text(rng, emoji_density, multiline_ratio)
+
+
+def generate_chat(path, encoding='utf-8', **settings):
+    """Write a synthetic export to ``path`` and return its size in bytes.
+
+    ``settings`` are passed on to iter_chat_lines().
+    """
+    with open(path, 'w', encoding=encoding, newline='\n') as file:
+        batch = []
+        for line in iter_chat_lines(**settings):
+            batch.append(line)
+            if len(batch) == WRITE_BATCH:
+                file.write('\n'.join(batch) + '\n')
+                batch = []
+        if batch:
+            file.write('\n'.join(batch) + '\n')
+    return os.path.getsize(path)
+
+
+def add_settings_arguments(parser):
+    """Add the generator settings as command-line options"""
+    parser.add_argument("--members", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=365, help="Date span of the chat")
+    parser.add_argument("--multiline-ratio", type=float, default=0.05,
+                        help="Share of messages spanning two lines")
+    parser.add_argument("--emoji-density", type=float, default=0.05,
+                        help="Share of tokens that are emoji")
+    parser.add_argument("--media-ratio", type=float, default=0.05,
+                        help="Share of media messages")
+    parser.add_argument("--dialect", choices=format_names(), default=DEFAULT_FORMAT_NAME)
+    parser.add_argument("--encoding", choices=["utf-8", "utf-16"], default="utf-8")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def settings_from_args(args):
+    """Return the iter_chat_lines() settings chosen on the command line"""
+    return {
+        'members': args.members,
+        'messages': args.messages,
+        'days': args.days,
+        'multiline_ratio': args.multiline_ratio,
+        'emoji_density': args.emoji_density,
+        'media_ratio': args.media_ratio,
+        'dialect': args.dialect,
+        'seed': args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("output", help="Path of the export to write")
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    size = generate_chat(args.output, args.encoding, **settings_from_args(args))
+    print(f"Wrote {args.messages} messages ({size / (1024 * 1024):.1f} MB) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+import os
+import sqlite3
+import time
+from collections import Counter, defaultdict
+from datetime import date
+from itertools import repeat
+from chat_formats import EPOCH_ORDINAL, EPOCH_WEEKDAY, MINUTES_PER_DAY, WEEKDAYS, detect_format
+from chat_index import as_timestamp, resolve_bound
+from deep_whatsapp_analyzer import CHUNK_SIZE, PARSER_VERSION, iter_batches, iter_messages
+from length_stats import length_stats
+from replies import DEFAULT_SESSION_GAP, message_times, reply_stats
+from metrics import EmojiCounts, WordCounts, resolve_metrics
+from parse_cache import file_digest
+
+# Timestamps are minutes since 1970-01-01 00:00, as in MessageStore
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    dialect TEXT NOT NULL,
+    parser_version INTEGER NOT NULL,
+    ingested_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    chat_id INTEGER NOT NULL REFERENCES chats (id),
+    timestamp INTEGER NOT NULL,
+    sender TEXT NOT NULL,
+    text TEXT NOT NULL,
+    words INTEGER NOT NULL,
+    media INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_chat_timestamp ON messages (chat_id, timestamp);
+CREATE INDEX IF NOT EXISTS messages_chat_sender ON messages (chat_id, sender);
+CREATE TABLE IF NOT EXISTS word_counts (
+    chat_id INTEGER NOT NULL REFERENCES chats (id),
+    word TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, word)
+);
+CREATE TABLE IF NOT EXISTS emoji_counts (
+    chat_id INTEGER NOT NULL REFERENCES chats (id),
+    emoji TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, emoji)
+);
+"""
+
+# External content table: the text is only stored once, in messages
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts
+USING fts5(text, content='messages', content_rowid='id');
+"""
+
+# Days added to timestamps before dividing, since SQLite's integer
+# division and modulo truncate towards zero for dates before 1970. A
+# multiple of 7, so weekdays stay aligned.
+DAY_SHIFT = 7 * 100000
+
+# SQL expressions for the day number, weekday and minute of the day of a message
+_SHIFTED = f"(timestamp + {DAY_SHIFT * MINUTES_PER_DAY})"
+SQL_DAY = f"({_SHIFTED} / {MINUTES_PER_DAY} - {DAY_SHIFT})"
+SQL_WEEKDAY = f"(({_SHIFTED} / {MINUTES_PER_DAY} + {EPOCH_WEEKDAY}) % 7)"
+SQL_MINUTE = f"({_SHIFTED} % {MINUTES_PER_DAY})"
+
+INSERT_MESSAGE = ("INSERT INTO messages (chat_id, timestamp, sender, text, words, media) "
+                  "VALUES (?, ?, ?, ?, ?, ?)")
+
+
+def chat_name(file_path):
+    """Return the default database name of a chat export"""
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+class ChatDatabase:
+    """Parsed chats persisted in SQLite.
+
+    Each ingested export becomes a row of ``chats`` and one row per message
+    in ``messages``, with its word and emoji counts in ``word_counts`` and
+    ``emoji_counts``. The message text is indexed for full-text search in
+    ``messages_fts`` when SQLite has FTS5. aggregate() computes the deep
+    analyzer's statistics with SQL over any set of chats, so reports do not
+    need the exports again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # Safe with WAL: a crash can lose the last commit but not corrupt the file
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        try:
+            self.connection.executescript(FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5
+            self.fts = False
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _chat_id(self, name):
+        row = self.connection.execute("SELECT id FROM chats WHERE name = ?", (name,)).fetchone()
+        return None if row is None else row[0]
+
+    def chats(self):
+        """Return (name, messages, first timestamp, last timestamp) of every chat"""
+        return self.connection.execute(
+            "SELECT name, COUNT(messages.id), MIN(timestamp), MAX(timestamp) FROM chats "
+            "LEFT JOIN messages ON messages.chat_id = chats.id GROUP BY chats.id "
+            "ORDER BY name").fetchall()
+
+    def remove(self, name):
+        """Delete a chat and its messages; return False if it is not stored"""
+        with self.connection:
+            return self._remove(name)
+
+    def _remove(self, name):
+        chat_id = self._chat_id(name)
+        if chat_id is None:
+            return False
+        execute = self.connection.execute
+        if self.fts:
+            execute("INSERT INTO messages_fts (messages_fts, rowid, text) "
+                    "SELECT 'delete', id, text FROM messages WHERE chat_id = ?", (chat_id,))
+        for table in ('messages', 'word_counts', 'emoji_counts'):
+            execute(f"DELETE FROM {table} WHERE chat_id = ?", (chat_id,))
+        execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+        return True
+
+    def ingest(self, file_path, name=None, chat_format=None, chunk_size=CHUNK_SIZE,
+               vocabulary_size=None, force=False):
+        """Parse an export into the database, replacing an older copy of the chat.
+
+        The chat is stored under ``name`` (the file name without extension
+        by default). Messages are inserted in batches with executemany()
+        inside one transaction, so a failed ingest leaves the database
+        unchanged. Returns the number of messages stored, or None if the
+        chat was already ingested from the same bytes (unless ``force``).
+        """
+        name = name or chat_name(file_path)
+        digest = file_digest(file_path, chunk_size)
+        stored = self.connection.execute(
+            "SELECT digest, parser_version FROM chats WHERE name = ?", (name,)).fetchone()
+        if stored == (digest, PARSER_VERSION) and not force:
+            return None
+        try:
+            return self._ingest(file_path, name, digest, 'utf-8', chat_format, chunk_size,
+                                vocabulary_size)
+        except UnicodeDecodeError:
+            # If UTF-8 fails, start over with another encoding
+            return self._ingest(file_path, name, digest, 'utf-16', chat_format, chunk_size,
+                                vocabulary_size)
+
+    def _ingest(self, file_path, name, digest, encoding, chat_format, chunk_size,
+                vocabulary_size):
+        words = WordCounts(vocabulary_size)
+        emoji = EmojiCounts(vocabulary_size)
+        messages = 0
+        with open(file_path, 'r', encoding=encoding) as file, self.connection:
+            chat_format = chat_format or detect_format(file)
+            self._remove(name)
+            execute = self.connection.execute
+            chat_id = execute(
+                "INSERT INTO chats (name, path, digest, dialect, parser_version, ingested_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (name, os.path.abspath(file_path), digest, chat_format.name, PARSER_VERSION,
+                 time.time())).lastrowid
+            for batch in iter_batches(iter_messages(file, chunk_size, chat_format), chat_format):
+                self.connection.executemany(INSERT_MESSAGE, zip(
+                    repeat(chat_id), batch.timestamps, batch.senders, batch.texts,
+                    batch.word_counts, batch.media))
+                words.add(batch)
+                emoji.add(batch)
+                messages += batch.size
+            self.connection.executemany(
+                "INSERT INTO word_counts (chat_id, word, count) VALUES (?, ?, ?)",
+                zip(repeat(chat_id), words.counts.keys(), words.counts.values()))
+            self.connection.executemany(
+                "INSERT INTO emoji_counts (chat_id, emoji, count) VALUES (?, ?, ?)",
+                zip(repeat(chat_id), emoji.counts.keys(), emoji.counts.values()))
+            if self.fts:
+                execute("INSERT INTO messages_fts (rowid, text) "
+                        "SELECT id, text FROM messages WHERE chat_id = ?", (chat_id,))
+        return messages
+
+    def _filter(self, chats=None, since=None, until=None, senders=None):
+        """Return the WHERE clause and parameters selecting messages.
+
+        ``since`` and ``until`` are timestamps, dates or datetimes of the
+        range [since, until).
+        """
+        clauses = []
+        params = []
+        if chats is not None:
+            chats = list(chats)
+            clauses.append(f"chat_id IN (SELECT id FROM chats WHERE name IN "
+                           f"({', '.join('?' * len(chats))}))")
+            params.extend(chats)
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(as_timestamp(since))
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(as_timestamp(until))
+        if senders is not None:
+            senders = list(senders)
+            clauses.append(f"sender IN ({', '.join('?' * len(senders))})")
+            params.extend(senders)
+        return ' AND '.join(clauses) or '1', params
+
+    def end(self, chats=None):
+        """Return the timestamp just after the last message of some chats"""
+        where, params = self._filter(chats)
+        last = self.connection.execute(
+            f"SELECT MAX(timestamp) FROM messages WHERE {where}", params).fetchone()[0]
+        return None if last is None else last + 1
+
+    def _grouped(self, key, where, params):
+        # Groups are returned in order of first appearance, like the
+        # Counters the parser fills, so ties are reported the same way
+        return self.connection.execute(
+            f"SELECT {key}, COUNT(*) FROM messages WHERE {where} GROUP BY 1 ORDER BY MIN(id)",
+            params).fetchall()
+
+    def _token_counts(self, table, column, chats):
+        where, params = self._filter(chats)
+        return Counter(dict(self.connection.execute(
+            f"SELECT {column}, SUM(count) FROM {table} WHERE {where} "
+            f"GROUP BY {column} ORDER BY MIN(rowid)", params)))
+
+    def _message_times(self, where, params, session_gap):
+        """Return the MessageTimes of the selected messages, one chat after
+        another so no reply or conversation spans two chats"""
+        import numpy as np
+
+        sender_index = {}
+        intern = sender_index.setdefault
+        chat_ids = []
+        sender_ids = []
+        timestamps = []
+        for chat_id, timestamp, sender in self.connection.execute(
+                f"SELECT chat_id, timestamp, sender FROM messages WHERE {where} "
+                f"ORDER BY chat_id, timestamp, id", params):
+            chat_ids.append(chat_id)
+            timestamps.append(timestamp)
+            sender_ids.append(intern(sender, len(sender_index)))
+        chat_ids = np.array(chat_ids, dtype=np.int64)
+        timestamps = np.array(timestamps, dtype=np.int64)
+        # Shift every chat to start more than session_gap after the previous one
+        jumps = np.zeros(len(timestamps), np.int64)
+        starts = np.flatnonzero(chat_ids[1:] != chat_ids[:-1]) + 1
+        jumps[starts] = timestamps[starts - 1] - timestamps[starts] + session_gap + 1
+        return message_times(sender_index, sender_ids, timestamps + np.cumsum(jumps))
+
+    def aggregate(self, chats=None, since=None, until=None, senders=None,
+                  session_gap=DEFAULT_SESSION_GAP, metrics=None):
+        """Compute the deep analyzer's statistics in SQL.
+
+        ``chats`` selects chats by name (all by default); ``since``,
+        ``until`` and ``senders`` restrict the messages as in
+        ChatIndex.query(). ``metrics`` selects metric names as
+        metrics.resolve_metrics() does, so replies are only computed when
+        asked for. Word and emoji counts come from the per-chat tables,
+        or from the text of the selected messages when the messages are
+        restricted. Replies are found within each chat, with
+        conversations split after ``session_gap`` idle minutes.
+        """
+        selected = resolve_metrics(metrics)
+        where, params = self._filter(chats, since, until, senders)
+        grouped = self._grouped
+        data = {'message_count': Counter(dict(grouped("sender", where, params)))}
+        if 'media' in selected:
+            data['media_count'] = Counter(dict(grouped("sender", where + " AND media", params)))
+        if 'hourly' in selected:
+            data['hourly_activity'] = Counter(dict(grouped(f"{SQL_MINUTE} / 60", where, params)))
+        if 'weekday' in selected:
+            data['weekday_activity'] = Counter({WEEKDAYS[day]: count for day, count in grouped(
+                SQL_WEEKDAY, where, params)})
+        if 'date' in selected:
+            date_activity = data['date_activity'] = defaultdict(int)
+            for day, count in grouped(SQL_DAY, where, params):
+                date_activity[date.fromordinal(day + EPOCH_ORDINAL).isoformat()] = count
+        if 'lengths' in selected:
+            data['avg_message_length'] = dict(self.connection.execute(
+                f"SELECT sender, AVG(words) FROM messages "
+                f"WHERE {where} AND NOT media AND text != '' GROUP BY 1 ORDER BY MIN(id)",
+                params))
+            histograms = defaultdict(dict)
+            for sender, words, count in self.connection.execute(
+                    f"SELECT sender, words, COUNT(*) FROM messages "
+                    f"WHERE {where} AND NOT media AND text != '' GROUP BY 1, 2 ORDER BY MIN(id)",
+                    params):
+                histograms[sender][words] = count
+            data['length_stats'] = length_stats(histograms)
+        if 'replies' in selected:
+            data['replies'] = reply_stats(self._message_times(where, params, session_gap),
+                                          session_gap)
+
+        words = 'words' in selected
+        emoji = 'emoji' in selected
+        if since is None and until is None and senders is None:
+            if words:
+                data['word_count'] = self._token_counts('word_counts', 'word', chats)
+            if emoji:
+                data['emoji_count'] = self._token_counts('emoji_counts', 'emoji', chats)
+        elif words or emoji:
+            from emoji_matcher import get_emoji_matcher
+
+            count_emoji = get_emoji_matcher().count
+            word_count = Counter()
+            emoji_count = Counter()
+            for text, in self.connection.execute(
+                    f"SELECT text FROM messages WHERE {where} AND words > 0 ORDER BY id",
+                    params):
+                if words:
+                    word_count.update(text.split())
+                if emoji:
+                    count_emoji(text, emoji_count)
+            if words:
+                data['word_count'] = word_count
+            if emoji:
+                data['emoji_count'] = emoji_count
+        return data
+
+    def search(self, query, chats=None, limit=20):
+        """Return (chat, timestamp, sender, text) of the messages matching
+        an FTS5 query, best matches first"""
+        if not self.fts:
+            raise RuntimeError("full-text search needs SQLite with FTS5")
+        where, params = self._filter(chats)
+        return self.connection.execute(
+            f"SELECT chats.name, timestamp, sender, messages.text FROM messages_fts "
+            f"JOIN messages ON messages.id = messages_fts.rowid "
+            f"JOIN chats ON chats.id = messages.chat_id "
+            f"WHERE messages_fts MATCH ? AND {where} ORDER BY messages_fts.rank LIMIT ?",
+            [query, *params, limit]).fetchall()
+
+
+def query_database(database, chats=None, since=None, until=None, senders=None,
+                   session_gap=DEFAULT_SESSION_GAP, metrics=None):
+    """Return database.aggregate() for parsed --since/--until bounds.
+
+    ``until`` is inclusive and relative bounds count back from the last
+    message of the selected chats, as with chat_index.query_results().
+    """
+    end = database.end(chats) if since is not None or until is not None else None
+    return database.aggregate(chats, resolve_bound(since, end),
+                              resolve_bound(until, end, inclusive_end=True), senders,
+                              session_gap, metrics)
@@ -0,0 +1,217 @@
+import re
+from collections import Counter
+from datetime import date, datetime, time
+from functools import lru_cache
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday',
+            'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Timestamps are stored as minutes since 1970-01-01 00:00
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+MINUTES_PER_DAY = 24 * 60
+
+# 1970-01-01 was a Thursday
+EPOCH_WEEKDAY = 3
+
+# A chat only has a few thousand distinct dates and a few thousand
+# distinct time strings ("9:05 am" and "09:05 am"), so these caches stay
+# small
+DATE_CACHE_SIZE = 8192
+TIME_CACHE_SIZE = 4096
+
+# Number of lines sampled from the start of an export to detect its format
+DETECT_LINES = 1000
+
+# Export layouts:
+#   android: 13/04/22, 9:15 am - John Doe: Hello
+#   ios:     [13/04/2022, 09:15:30] John Doe: Hello
+LAYOUTS = ('android', 'ios')
+CLOCKS = ('12h', '24h')
+DATE_ORDERS = ('dmy', 'mdy')
+
+# iOS exports often start lines with a left-to-right mark
+LRM = '\u200e'
+
+# Headers used to recognise the layout of sampled lines. Groups are the
+# two day/month fields, the time and the am/pm marker.
+_SAMPLE_HEADERS = {
+    'android': re.compile(
+        r'^(\d{1,2})/(\d{1,2})/\d{2,4},\s(\d{1,2}:\d{2}(?::\d{2})?)(\s?[aApP][mM])?\s-\s'),
+    'ios': re.compile(
+        r'^\u200e?\[(\d{1,2})/(\d{1,2})/\d{2,4},\s(\d{1,2}:\d{2}(?::\d{2})?)(\s?[aApP][mM])?\]\s'),
+}
+
+
+def to_timestamp(ordinal, minute):
+    """Convert a date ordinal and minute of the day into a timestamp"""
+    return (ordinal - EPOCH_ORDINAL) * MINUTES_PER_DAY + minute
+
+
+def from_timestamp(timestamp):
+    """Convert a timestamp back into a datetime"""
+    days, minute = divmod(timestamp, MINUTES_PER_DAY)
+    return datetime.combine(date.fromordinal(days + EPOCH_ORDINAL),
+                            time(minute // 60, minute % 60))
+
+
+def _make_date_decoder(order):
+    day_field, month_field = (0, 1) if order == 'dmy' else (1, 0)
+
+    @lru_cache(maxsize=DATE_CACHE_SIZE)
+    def decode_date(date_str):
+        """Return (ordinal, weekday name, ISO date) for a date string"""
+        fields = date_str.split('/')
+        year = int(fields[2])
+        if year < 100:
+            # Same pivot as strptime's %y
+            year += 2000 if year < 69 else 1900
+        date_obj = date(year, int(fields[month_field]), int(fields[day_field]))
+        return date_obj.toordinal(), WEEKDAYS[date_obj.weekday()], date_obj.isoformat()
+
+    return decode_date
+
+
+def _make_time_decoder(clock):
+    if clock == '12h':
+        @lru_cache(maxsize=TIME_CACHE_SIZE)
+        def decode_time(time_str):
+            """Return the minute of the day for an H:MM[:SS] am/pm time string"""
+            fields = time_str[:-2].strip().split(':')
+            hour, minute = int(fields[0]), int(fields[1])
+            if not 1 <= hour <= 12 or minute > 59:
+                raise ValueError(f"invalid time: {time_str!r}")
+            if time_str[-2:].lower() == 'pm':
+                return (hour % 12 + 12) * 60 + minute
+            return hour % 12 * 60 + minute
+    else:
+        @lru_cache(maxsize=TIME_CACHE_SIZE)
+        def decode_time(time_str):
+            """Return the minute of the day for an HH:MM[:SS] time string"""
+            fields = time_str.split(':')
+            hour, minute = int(fields[0]), int(fields[1])
+            if hour > 23 or minute > 59:
+                raise ValueError(f"invalid time: {time_str!r}")
+            return hour * 60 + minute
+
+    return decode_time
+
+
+class ChatFormat:
+    """Precompiled parser for one export dialect.
+
+    ``pattern`` matches a whole (multi-line) message with the groups date,
+    time, sender and text. ``message_start`` and ``byte_message_start``
+    find the line breaks that start a new message in decoded text and raw
+    bytes. ``decode_date`` and ``decode_time`` are memoized decoders for
+    the date and time groups.
+
+    Instances are shared through get_chat_format() and pickle by name, so
+    their caches survive across analyses and they can be sent to worker
+    processes.
+    """
+
+    def __init__(self, layout, clock, order):
+        if layout not in LAYOUTS or clock not in CLOCKS or order not in DATE_ORDERS:
+            raise ValueError(f"unknown chat format: {layout}-{clock}-{order}")
+        self.layout = layout
+        self.clock = clock
+        self.order = order
+
+        date_part = r'(\d+/\d+/\d+)'
+        if clock == '12h':
+            time_part = r'(\d+:\d+(?::\d+)?\s?[aApP][mM])'
+        else:
+            time_part = r'(\d+:\d+(?::\d+)?)'
+        sender_part = r'([^:]+?)(?:\s\(.*?\))?:\s(.*)$'
+        if layout == 'android':
+            self.pattern = re.compile(
+                rf'^{date_part},\s{time_part}\s-\s{sender_part}', re.DOTALL)
+            self.message_start = re.compile(r'\n(?=\d+/\d+/\d+)')
+            self.byte_message_start = re.compile(rb'\n(?=\d+/\d+/\d+)')
+        else:
+            self.pattern = re.compile(
+                rf'^\u200e?\[{date_part},\s{time_part}\]\s{sender_part}', re.DOTALL)
+            self.message_start = re.compile(r'\n(?=\u200e?\[\d+/\d+/\d+)')
+            self.byte_message_start = re.compile(
+                b'\\n(?=(?:' + re.escape(LRM.encode('utf-8')) + rb')?\[\d+/\d+/\d+)')
+
+        self.decode_date = _make_date_decoder(order)
+        self.decode_time = _make_time_decoder(clock)
+
+    @property
+    def name(self):
+        return f'{self.layout}-{self.clock}-{self.order}'
+
+    def __repr__(self):
+        return f'ChatFormat({self.name!r})'
+
+    def __reduce__(self):
+        return get_chat_format, (self.name,)
+
+
+@lru_cache(maxsize=None)
+def get_chat_format(name):
+    """Return the shared ChatFormat for a name like 'android-12h-dmy'"""
+    try:
+        layout, clock, order = name.split('-')
+    except ValueError:
+        raise ValueError(f"unknown chat format: {name}") from None
+    return ChatFormat(layout, clock, order)
+
+
+# The format the analyzers were originally written for
+DEFAULT_FORMAT_NAME = 'android-12h-dmy'
+
+
+def format_names():
+    """Return the names of all supported formats"""
+    return [f'{layout}-{clock}-{order}'
+            for layout in LAYOUTS for clock in CLOCKS for order in DATE_ORDERS]
+
+
+def detect_format_from_lines(lines):
+    """Resolve the export dialect from a sample of lines.
+
+    The layout is the one whose header matches most lines and the clock is
+    12-hour if those headers carry am/pm. A first date field above 12 means
+    day first and a second field above 12 means month first; if neither
+    occurs the day-first default is kept.
+    """
+    matches = {layout: [] for layout in LAYOUTS}
+    for line in lines:
+        for layout, header in _SAMPLE_HEADERS.items():
+            match = header.match(line)
+            if match:
+                matches[layout].append(match)
+                break
+
+    layout = max(LAYOUTS, key=lambda name: len(matches[name]))
+    found = matches[layout]
+    if not found:
+        return get_chat_format(DEFAULT_FORMAT_NAME)
+
+    clocks = Counter('12h' if match.group(4) else '24h' for match in found)
+    clock = clocks.most_common(1)[0][0]
+
+    order = 'dmy'
+    if not any(int(match.group(1)) > 12 for match in found):
+        if any(int(match.group(2)) > 12 for match in found):
+            order = 'mdy'
+
+    return get_chat_format(f'{layout}-{clock}-{order}')
+
+
+def detect_format(file, max_lines=DETECT_LINES):
+    """Detect the dialect of an open text file from its first lines.
+
+    The file position is restored afterwards.
+    """
+    position = file.tell()
+    lines = []
+    while len(lines) < max_lines:
+        line = file.readline()
+        if not line:
+            break
+        lines.append(line)
+    file.seek(position)
+    return detect_format_from_lines(lines)
@@ -0,0 +1,304 @@
+import re
+from array import array
+from collections import Counter
+from datetime import date, datetime, timedelta
+import numpy as np
+from chat_formats import MINUTES_PER_DAY, to_timestamp
+from message_store import activity_counts, sender_length_stats
+from replies import DEFAULT_SESSION_GAP, MessageTimes, reply_stats
+
+# Relative bounds such as "30d": days before the last message of the chat
+RELATIVE_BOUND = re.compile(r'^(\d+)d$')
+
+
+class TokenColumn:
+    """Words or emoji of every message, as vocabulary ids in one flat array.
+
+    The tokens of message i are ``ids[offsets[i]:offsets[i + 1]]``, so the
+    tokens of consecutive messages form one slice. Built while parsing and
+    merged like the other collectors.
+    """
+
+    def __init__(self):
+        self._index = {}
+        self.ids = array('i')
+        self.offsets = array('q', [0])
+
+    @property
+    def vocabulary(self):
+        return list(self._index)
+
+    def append(self, token_lists):
+        """Add the tokens of consecutive messages, None for no tokens"""
+        index = self._index
+        intern = index.setdefault
+        ids = self.ids
+        offsets = self.offsets
+        for tokens in token_lists:
+            if tokens:
+                ids.extend([intern(token, len(index)) for token in tokens])
+            offsets.append(len(ids))
+
+    def extend(self, other):
+        """Append the messages of another column after the ones in this one"""
+        # Map the other column's token ids onto this column's ids
+        index = self._index
+        intern = index.setdefault
+        remap = np.array([intern(token, len(index)) for token in other._index], dtype=np.intc)
+        base = len(self.ids)
+        if other.ids:
+            self.ids.frombytes(remap[np.frombuffer(other.ids, np.intc)].tobytes())
+        self.offsets.frombytes((np.frombuffer(other.offsets, np.int64)[1:] + base).tobytes())
+
+
+def as_timestamp(value):
+    """Convert a date, datetime or timestamp into minutes since 1970"""
+    if isinstance(value, datetime):
+        return to_timestamp(value.toordinal(), value.hour * 60 + value.minute)
+    if isinstance(value, date):
+        return to_timestamp(value.toordinal(), 0)
+    return int(value)
+
+
+def _gather(offsets, rows):
+    """Return the positions of the tokens of the given rows"""
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - (ends - lengths), lengths) + np.arange(ends[-1] if len(ends) else 0)
+
+
+def _token_counts(vocabulary, ids):
+    """Count token ids, in order of their first occurrence"""
+    values, first, counts = np.unique(ids, return_index=True, return_counts=True)
+    order = np.argsort(first)
+    return Counter(dict(zip([vocabulary[value] for value in values[order].tolist()],
+                            counts[order].tolist())))
+
+
+class ChatIndex:
+    """Messages of a chat sorted by time, for statistics over any range.
+
+    Rows are kept in time order, and ``by_sender`` lists them grouped by
+    sender, each sender's rows in time order starting at
+    ``sender_offsets[id]``. Cumulative sums of the media, text and word
+    columns in that sender order make message, media and length
+    statistics for any sender and time range two binary searches per
+    sender away. Activity, words and emoji are gathered from the rows in
+    the range only, so a query costs O(senders * log n) plus the size of
+    the range instead of a pass over the chat.
+
+    Build it with ``analyze_whatsapp_chat(file_path, index=True)``, which
+    returns it under the 'index' key.
+    """
+
+    def __init__(self, store, words=None, emoji=None):
+        timestamps = store.timestamps
+        order = None
+        if np.any(timestamps[1:] < timestamps[:-1]):
+            # Out of order messages, e.g. from a clock change
+            order = np.argsort(timestamps, kind='stable')
+
+        def rows(values):
+            return values.copy() if order is None else values[order]
+
+        self.senders = list(store.senders)
+        self.timestamps = rows(timestamps)
+        self.sender_ids = rows(store.sender_ids)
+        media = rows(store.media)
+        self.word_counts = word_counts = rows(store.word_counts)
+        self.texts = texts = ~media & (rows(store.char_counts) > 0)
+        self.words = self._tokens(words, order)
+        self.emoji = self._tokens(emoji, order)
+
+        self.by_sender = np.argsort(self.sender_ids, kind='stable')
+        self.sender_offsets = np.zeros(len(self.senders) + 1, np.int64)
+        np.cumsum(np.bincount(self.sender_ids, minlength=len(self.senders)),
+                  out=self.sender_offsets[1:])
+        self.sender_timestamps = self.timestamps[self.by_sender]
+        self._sums = {name: np.concatenate(([0], np.cumsum(values[self.by_sender],
+                                                           dtype=np.int64)))
+                      for name, values in (('media', media), ('texts', texts),
+                                           ('words', word_counts))}
+
+    @staticmethod
+    def _tokens(column, order):
+        """Return (vocabulary, ids, offsets) of a TokenColumn in time order"""
+        if column is None:
+            return None
+        ids = np.frombuffer(column.ids, np.intc)
+        offsets = np.frombuffer(column.offsets, np.int64)
+        if order is not None:
+            ids = ids[_gather(offsets, order)]
+            offsets = np.concatenate(([0], np.cumsum(np.diff(offsets)[order])))
+        return column.vocabulary, ids.copy(), offsets.copy()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def start(self):
+        """Timestamp of the first message, or None for an empty chat"""
+        return int(self.timestamps[0]) if len(self) else None
+
+    @property
+    def end(self):
+        """Timestamp just after the last message, or None for an empty chat"""
+        return int(self.timestamps[-1]) + 1 if len(self) else None
+
+    def _sender_ranges(self, since, until, senders):
+        """Return (sender id, first, end) positions in sender order"""
+        if senders is None:
+            sender_ids = range(len(self.senders))
+        else:
+            wanted = set(senders)
+            sender_ids = [i for i, sender in enumerate(self.senders) if sender in wanted]
+        ranges = []
+        for sender_id in sender_ids:
+            offset = int(self.sender_offsets[sender_id])
+            first, end = self._search(
+                self.sender_timestamps[offset:self.sender_offsets[sender_id + 1]], since, until)
+            if end > first:
+                ranges.append((sender_id, offset + first, offset + end))
+        # Order senders by their first message in the range, like the parser
+        ranges.sort(key=lambda sender_range: self.by_sender[sender_range[1]])
+        return ranges
+
+    @staticmethod
+    def _search(timestamps, since, until):
+        """Return the positions of [since, until) in sorted timestamps"""
+        first = 0 if since is None else int(np.searchsorted(timestamps, since, 'left'))
+        end = len(timestamps) if until is None else int(np.searchsorted(timestamps, until, 'left'))
+        return first, max(first, end)
+
+    def _rows(self, since, until, senders, ranges):
+        """Return the rows in the range, as a slice or an index array"""
+        if senders is None:
+            return slice(*self._search(self.timestamps, since, until))
+        if not ranges:
+            return np.empty(0, np.int64)
+        return np.sort(np.concatenate([self.by_sender[first:end] for _, first, end in ranges]))
+
+    def message_counts(self, since=None, until=None, senders=None):
+        """Return a Counter of messages per sender in [since, until).
+
+        Bounds are dates, datetimes or timestamps; None leaves that side
+        open. ``senders`` restricts the counts to some senders.
+        """
+        since, until = self._bounds(since, until)
+        return Counter({self.senders[sender_id]: end - first
+                        for sender_id, first, end in self._sender_ranges(since, until, senders)})
+
+    @staticmethod
+    def _bounds(since, until):
+        return (None if since is None else as_timestamp(since),
+                None if until is None else as_timestamp(until))
+
+    def _range_sums(self, name, ranges):
+        """Return the nonzero sums of a column per sender, ordered by the
+        first message in the range that adds to each sum"""
+        sums = self._sums[name]
+        found = []
+        for sender_id, first, end in ranges:
+            total = int(sums[end] - sums[first])
+            if total:
+                position = int(np.searchsorted(sums, sums[first] + 1, 'left')) - 1
+                found.append((self.by_sender[position], self.senders[sender_id], total))
+        found.sort()
+        return {sender: total for _, sender, total in found}
+
+    def _range_tokens(self, tokens, rows):
+        vocabulary, ids, offsets = tokens
+        if isinstance(rows, slice):
+            return _token_counts(vocabulary, ids[offsets[rows.start]:offsets[rows.stop]])
+        return _token_counts(vocabulary, ids[_gather(offsets, rows)])
+
+    def query(self, since=None, until=None, senders=None, session_gap=DEFAULT_SESSION_GAP):
+        """Return the deep analyzer's statistics for messages in [since, until).
+
+        The result has the same keys as analyze_whatsapp_chat() (without
+        'store', 'index', 'message_times' and 'all_text'), with exact word
+        and emoji counts; those two are left out if the index was built
+        without them. Replies only count messages of the selected senders,
+        split into conversations after ``session_gap`` idle minutes.
+        """
+        since, until = self._bounds(since, until)
+        ranges = self._sender_ranges(since, until, senders)
+        rows = self._rows(since, until, senders, ranges)
+
+        media = self._range_sums('media', ranges)
+        text_counts = self._range_sums('texts', ranges)
+        words = self._range_sums('words', ranges)
+        hourly_activity, weekday_activity, date_activity = activity_counts(self.timestamps[rows])
+        texts = self.texts[rows]
+        data = {
+            'message_count': Counter({self.senders[sender_id]: end - first
+                                      for sender_id, first, end in ranges}),
+            'media_count': Counter(media),
+            'hourly_activity': hourly_activity,
+            'weekday_activity': weekday_activity,
+            'date_activity': date_activity,
+            'avg_message_length': {sender: words.get(sender, 0) / count
+                                   for sender, count in text_counts.items()},
+            'length_stats': sender_length_stats(self.senders, self.sender_ids[rows][texts],
+                                                self.word_counts[rows][texts]),
+            'replies': reply_stats(MessageTimes(self.senders, self.sender_ids[rows],
+                                                self.timestamps[rows]), session_gap),
+        }
+        if self.words is not None:
+            data['word_count'] = self._range_tokens(self.words, rows)
+        if self.emoji is not None:
+            data['emoji_count'] = self._range_tokens(self.emoji, rows)
+        return data
+
+
+def parse_time_bound(value):
+    """Parse a --since/--until value.
+
+    Accepts an ISO date (2023-03-01), an ISO date and time
+    (2023-03-01T18:30 or "2023-03-01 18:30") or a number of days before
+    the last message ("30d"), returned as a date, datetime or timedelta.
+    """
+    match = RELATIVE_BOUND.match(value.strip())
+    if match:
+        return timedelta(days=int(match.group(1)))
+    try:
+        if len(value.strip()) == 10:
+            return date.fromisoformat(value.strip())
+        return datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise ValueError(f"invalid date {value!r}, expected YYYY-MM-DD, "
+                         "YYYY-MM-DDTHH:MM or a number of days like 30d") from None
+
+
+def resolve_bound(bound, end, inclusive_end=False):
+    """Turn a parsed time bound into a timestamp.
+
+    Relative bounds count back from ``end``, the timestamp just after the
+    last message (None for an empty chat). With
+    ``inclusive_end`` a date covers the whole day and a datetime the
+    whole minute, so "--until 2023-03-31" includes March 31.
+    """
+    if bound is None:
+        return None
+    if isinstance(bound, timedelta):
+        if end is None:
+            return None
+        return end - int(bound.total_seconds()) // 60
+    timestamp = as_timestamp(bound)
+    if inclusive_end:
+        timestamp += 1 if isinstance(bound, datetime) else MINUTES_PER_DAY
+    return timestamp
+
+
+def query_results(data, since=None, until=None, senders=None, session_gap=DEFAULT_SESSION_GAP):
+    """Replace full-chat results by the results for a range of an index.
+
+    ``since`` and ``until`` are parsed bounds (see parse_time_bound());
+    ``until`` is inclusive. Only metrics present in ``data`` are kept.
+    """
+    index = data['index']
+    results = index.query(resolve_bound(since, index.end),
+                          resolve_bound(until, index.end, inclusive_end=True), senders,
+                          session_gap)
+    return {key: value for key, value in results.items() if key in data}
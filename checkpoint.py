@@ -0,0 +1,133 @@
+import hashlib
+import os
+import pickle
+from deep_whatsapp_analyzer import (CHUNK_SIZE, PARSER_VERSION, analyze_whatsapp_chat,
+                                    detect_file_format, finalize_results,
+                                    find_last_message_start, merge_results, parse_messages,
+                                    parse_parallel, parse_shard, skip_line_break)
+from metrics import resolve_metrics
+
+# Name of the checkpoint file kept in the output directory
+CHECKPOINT_NAME = '.analysis_checkpoint.pickle'
+
+
+def checkpoint_path(output_dir):
+    """Return where the checkpoint for an output directory is stored"""
+    return os.path.join(output_dir, CHECKPOINT_NAME)
+
+
+def load_checkpoint(path):
+    """Load a checkpoint, or return None if it is missing or unusable"""
+    try:
+        with open(path, 'rb') as file:
+            checkpoint = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return None
+    if not isinstance(checkpoint, dict) or checkpoint.get('parser_version') != PARSER_VERSION:
+        return None
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    """Atomically write a checkpoint file"""
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as file:
+        pickle.dump(checkpoint, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+
+def hash_range(file, hasher, start, end, chunk_size=CHUNK_SIZE):
+    """Feed the bytes [start, end) of an open binary file to a hasher"""
+    file.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        chunk = file.read(min(chunk_size, remaining))
+        if not chunk:
+            break
+        hasher.update(chunk)
+        remaining -= len(chunk)
+
+
+def parse_range(file_path, start, end, chunk_size=CHUNK_SIZE, columnar=False, jobs=1,
+                chat_format=None, keep_text=False, vocabulary_size=None, metrics=None,
+                index=False):
+    """Parse the byte range [start, end) into partial results"""
+    if jobs > 1:
+        return parse_parallel(file_path, jobs, chunk_size, columnar, start, end, chat_format,
+                              keep_text, vocabulary_size, metrics, index)
+    return parse_shard(file_path, start, end, chunk_size, columnar, chat_format, keep_text,
+                       vocabulary_size, metrics, index)
+
+
+def analyze_incremental(file_path, checkpoint_file, chunk_size=CHUNK_SIZE, columnar=False, jobs=1,
+                        chat_format=None, keep_text=False, vocabulary_size=None,
+                        metrics=None, index=False):
+    """Analyze a chat export, reusing checkpointed results for its prefix.
+
+    Exports of the same chat usually only grow at the end. The checkpoint
+    keeps the partial results for every message except the last one, the
+    byte offset where that last message starts and a hash of the bytes
+    before it. If the export still starts with the same bytes only the new
+    tail is parsed; otherwise the whole file is parsed again. The last
+    message is always re-parsed since later exports may extend it.
+    """
+    try:
+        chat_format = chat_format or detect_file_format(file_path)
+    except UnicodeDecodeError:
+        # Checkpoints work on UTF-8 byte offsets; parse other encodings fully
+        return analyze_whatsapp_chat(file_path, chunk_size, columnar, jobs, keep_text=keep_text,
+                                     vocabulary_size=vocabulary_size, metrics=metrics,
+                                     index=index)
+
+    checkpoint = load_checkpoint(checkpoint_file)
+    size = os.path.getsize(file_path)
+
+    with open(file_path, 'rb') as file:
+        prefix_end = find_last_message_start(file, size, chunk_size, chat_format)
+        resume = 0 if prefix_end is None else skip_line_break(file, prefix_end)
+
+        hasher = hashlib.sha256()
+        parts = []
+        start = 0
+        if (checkpoint is not None and checkpoint['columnar'] == columnar
+                and checkpoint['keep_text'] == keep_text
+                and checkpoint['vocabulary_size'] == vocabulary_size
+                and checkpoint['metrics'] == resolve_metrics(metrics)
+                and checkpoint.get('index', False) == index
+                and checkpoint['chat_format'] == chat_format.name
+                and checkpoint['resume'] <= resume):
+            hash_range(file, hasher, 0, checkpoint['resume'], chunk_size)
+            if hasher.hexdigest() == checkpoint['prefix_hash']:
+                parts.append(checkpoint['results'])
+                start = checkpoint['resume']
+            else:
+                # The export was rewritten, start over
+                hasher = hashlib.sha256()
+        hash_range(file, hasher, start, resume, chunk_size)
+
+    try:
+        if prefix_end is not None and prefix_end > start:
+            parts.append(parse_range(file_path, start, prefix_end, chunk_size, columnar, jobs,
+                                     chat_format, keep_text, vocabulary_size, metrics, index))
+        tail = parse_shard(file_path, resume, size, chunk_size, columnar, chat_format, keep_text,
+                           vocabulary_size, metrics, index)
+    except UnicodeDecodeError:
+        return analyze_whatsapp_chat(file_path, chunk_size, columnar, jobs, chat_format, keep_text,
+                                     vocabulary_size, metrics=metrics, index=index)
+
+    results = (merge_results(parts) if parts
+               else parse_messages([], columnar, chat_format, keep_text, vocabulary_size,
+                                   metrics=metrics, index=index))
+    save_checkpoint(checkpoint_file, {
+        'parser_version': PARSER_VERSION,
+        'columnar': columnar,
+        'keep_text': keep_text,
+        'vocabulary_size': vocabulary_size,
+        'metrics': resolve_metrics(metrics),
+        'index': index,
+        'chat_format': chat_format.name,
+        'resume': resume,
+        'prefix_hash': hasher.hexdigest(),
+        'results': results,
+    })
+    return finalize_results(merge_results([results, tail]))
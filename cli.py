@@ -2,8 +2,19 @@
 import argparse
 import os
 import sys
+import time
+from datetime import timedelta
 import whatsapp_analyzer
+import chat_formats
 import deep_whatsapp_analyzer
+import checkpoint
+import follow
+import parse_cache
+import heavy_hitters
+import batch
+import profiling
+import render_cache
+import metrics
 
 
 def parse_args():
@@ -22,6 +33,9 @@ def parse_args():
         "--file", "-f", help="Path to WhatsApp chat export file")
     basic_parser.add_argument(
         "--plot", "-p", action="store_true", help="Generate visualization")
+    basic_parser.add_argument("--dialect", choices=["auto"] + chat_formats.format_names(),
+                              default="auto", help="Export format (detected by default)")
+    add_profile_arguments(basic_parser)
 
     # Deep analyzer
     deep_parser = subparsers.add_parser(
@@ -34,6 +48,165 @@ def parse_args():
                              help="Image format for visualizations")
     deep_parser.add_argument(
         "--no-plots", action="store_true", help="Skip generating plots")
+    deep_parser.add_argument("--redraw", action="store_true",
+                             help="Draw every chart, even if its data is unchanged since the "
+                                  "last run into the output directory")
+    deep_parser.add_argument("--dialect", choices=["auto"] + chat_formats.format_names(),
+                             default="auto", help="Export format (detected by default)")
+    deep_parser.add_argument("--chunk-size", type=int, default=deep_whatsapp_analyzer.CHUNK_SIZE,
+                             help="Characters read per chunk while streaming the chat file")
+    deep_parser.add_argument("--columnar", action="store_true",
+                             help="Keep parsed messages in a compact NumPy column store")
+    deep_parser.add_argument("--jobs", "-j", type=int, default=1,
+                             help="Number of processes used to parse the chat file and draw charts")
+    deep_parser.add_argument("--incremental", action="store_true",
+                             help="Reuse the checkpoint in the output directory and only parse new messages")
+    deep_parser.add_argument("--no-cache", action="store_true",
+                             help="Parse the chat file even if cached results exist")
+    deep_parser.add_argument("--cache-dir", default=None,
+                             help="Directory for cached parse results (default: ~/.cache/whatsapp-analyzer)")
+    deep_parser.add_argument("--cache-size", type=int, default=parse_cache.DEFAULT_MAX_BYTES // (1024 * 1024),
+                             help="Maximum size of the parse cache in MB")
+    deep_parser.add_argument("--vocabulary-size", type=int, default=None,
+                             help="Keep approximate counts for about this many words and emojis "
+                                  "(0 for exact counts; default: exact below "
+                                  f"{heavy_hitters.APPROXIMATE_MIN_BYTES // (1024 * 1024)} MB, "
+                                  f"{heavy_hitters.DEFAULT_CAPACITY} above)")
+    deep_parser.add_argument("--metrics", type=parse_metrics, default=None,
+                             help="Comma-separated metrics to compute, from: "
+                                  f"{', '.join(metrics.metric_names())} (default: all but "
+                                  "replies, which keeps the time of every message in memory; "
+                                  "sender counts are always computed)")
+    deep_parser.add_argument("--snapshot", metavar="DIR",
+                             help="Analyze a snapshot written by the snapshot command "
+                                  "instead of a chat export")
+    deep_parser.add_argument("--since", type=parse_time_bound, default=None,
+                             help="Only analyze messages from this date on (YYYY-MM-DD, "
+                                  "YYYY-MM-DDTHH:MM, or e.g. 30d for the last 30 days of the chat)")
+    deep_parser.add_argument("--until", type=parse_time_bound, default=None,
+                             help="Only analyze messages up to and including this date")
+    deep_parser.add_argument("--sender", action="append", default=None,
+                             help="Only analyze messages from this sender (can be repeated)")
+    deep_parser.add_argument("--session-gap", type=int, default=None, metavar="MINUTES",
+                             help="Minutes without messages after which a new conversation "
+                                  "starts, for reply times; selects the replies metric "
+                                  "(default: 60)")
+    deep_parser.add_argument("--follow", action="store_true",
+                             help="Keep watching the export and update the report and charts "
+                                  "as messages are appended (Ctrl+C to stop)")
+    deep_parser.add_argument("--follow-interval", type=float, default=5.0,
+                             help="Minimum seconds between updates in --follow mode")
+    add_profile_arguments(deep_parser)
+
+    # Batch analyzer
+    batch_parser = subparsers.add_parser(
+        "batch", help="Analyze every chat export in a directory")
+    batch_parser.add_argument("directory", help="Directory containing chat exports (and optionally samples/)")
+    batch_parser.add_argument(
+        "--output", "-o", default="output", help="Output directory; each chat gets a subdirectory")
+    batch_parser.add_argument(
+        "--no-plots", action="store_true", help="Skip generating plots")
+    batch_parser.add_argument("--dialect", choices=["auto"] + chat_formats.format_names(),
+                              default="auto", help="Export format (detected per file by default)")
+    batch_parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1,
+                              help="Number of chats analyzed at the same time (default: CPU count)")
+    batch_parser.add_argument("--no-cache", action="store_true",
+                              help="Parse the chat files even if cached results exist")
+    batch_parser.add_argument("--cache-dir", default=None,
+                              help="Directory for cached parse results (default: ~/.cache/whatsapp-analyzer)")
+    batch_parser.add_argument("--cache-size", type=int, default=parse_cache.DEFAULT_MAX_BYTES // (1024 * 1024),
+                              help="Maximum size of the parse cache in MB")
+    batch_parser.add_argument("--vocabulary-size", type=int, default=None,
+                              help="Keep approximate counts for about this many words and emojis "
+                                   "(0 for exact counts; default depends on the file size)")
+
+    # Columnar snapshot of a parsed chat
+    snapshot_parser = subparsers.add_parser(
+        "snapshot", help="Save a parsed chat as memory-mappable NumPy columns and text")
+    snapshot_parser.add_argument(
+        "--file", "-f", help="Path to WhatsApp chat export file")
+    snapshot_parser.add_argument("snapshot", help="Directory to write the snapshot to")
+    snapshot_parser.add_argument("--dialect", choices=["auto"] + chat_formats.format_names(),
+                                 default="auto", help="Export format (detected by default)")
+    snapshot_parser.add_argument("--vocabulary-size", type=int, default=None,
+                                 help="Keep approximate counts for about this many words and "
+                                      "emojis (0 for exact counts; default depends on the file size)")
+
+    # SQLite database of parsed chats
+    db_parser = subparsers.add_parser(
+        "db", help="Store parsed chats in SQLite and report or search across them")
+    db_commands = db_parser.add_subparsers(dest="db_command", help="Database command")
+
+    ingest_parser = db_commands.add_parser("ingest", help="Parse chat exports into the database")
+    ingest_parser.add_argument("database", help="Path of the SQLite database (created if missing)")
+    ingest_parser.add_argument("files", nargs="+", help="Chat exports to store")
+    ingest_parser.add_argument("--name", help="Chat name when ingesting one file "
+                                              "(default: the file name without extension)")
+    ingest_parser.add_argument("--dialect", choices=["auto"] + chat_formats.format_names(),
+                               default="auto", help="Export format (detected per file by default)")
+    ingest_parser.add_argument("--force", action="store_true",
+                               help="Re-ingest chats even if the export is unchanged")
+
+    db_report_parser = db_commands.add_parser(
+        "report", help="Write the report and charts for stored chats with SQL aggregations")
+    db_report_parser.add_argument("database", help="Path of the SQLite database")
+    db_report_parser.add_argument("--chat", action="append", default=None,
+                                  help="Only include this chat (can be repeated; default: all)")
+    db_report_parser.add_argument(
+        "--output", "-o", default="output", help="Output directory for visualizations")
+    db_report_parser.add_argument(
+        "--no-plots", action="store_true", help="Skip generating plots")
+    db_report_parser.add_argument("--redraw", action="store_true",
+                                  help="Draw every chart, even if its data is unchanged")
+    db_report_parser.add_argument("--jobs", "-j", type=int, default=1,
+                                  help="Number of processes used to draw charts")
+    db_report_parser.add_argument("--since", type=parse_time_bound, default=None,
+                                  help="Only include messages from this date on")
+    db_report_parser.add_argument("--until", type=parse_time_bound, default=None,
+                                  help="Only include messages up to and including this date")
+    db_report_parser.add_argument("--sender", action="append", default=None,
+                                  help="Only include messages from this sender (can be repeated)")
+    db_report_parser.add_argument("--metrics", type=parse_metrics, default=None,
+                                  help="Comma-separated metrics to compute, as for deep "
+                                       "(default: all but replies)")
+    db_report_parser.add_argument("--session-gap", type=int, default=None, metavar="MINUTES",
+                                  help="Minutes without messages after which a new "
+                                       "conversation starts, for reply times; selects the "
+                                       "replies metric (default: 60)")
+
+    search_parser = db_commands.add_parser("search", help="Full-text search of stored messages")
+    search_parser.add_argument("database", help="Path of the SQLite database")
+    search_parser.add_argument("query", help="FTS5 query, e.g. 'NEAR(lunch tomorrow)'")
+    search_parser.add_argument("--chat", action="append", default=None,
+                               help="Only search this chat (can be repeated)")
+    search_parser.add_argument("--limit", type=int, default=20, help="Maximum number of results")
+
+    list_parser = db_commands.add_parser("list", help="List stored chats")
+    list_parser.add_argument("database", help="Path of the SQLite database")
+
+    # Local HTTP analysis service
+    serve_parser = subparsers.add_parser(
+        "serve", help="Analyze uploaded chat exports over HTTP on this machine")
+    serve_parser.add_argument("--host", default="127.0.0.1",
+                              help="Address to listen on (default: 127.0.0.1, local only)")
+    serve_parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    serve_parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1,
+                              help="Number of worker processes analyzing uploads "
+                                   "(default: CPU count)")
+    serve_parser.add_argument("--max-queue", type=int, default=16,
+                              help="Analyses waiting for a worker before new uploads are "
+                                   "refused with 503")
+    serve_parser.add_argument("--max-upload", type=int, default=512,
+                              help="Largest accepted export in MB")
+    serve_parser.add_argument("--max-uploads", type=int, default=4,
+                              help="Uploads received at the same time before new ones are "
+                                   "refused with 503")
+    serve_parser.add_argument("--cache-entries", type=int, default=64,
+                              help="Number of analysis results (and their charts) kept for "
+                                   "repeated uploads")
+    serve_parser.add_argument("--work-dir", default=None,
+                              help="Directory for uploads and charts (default: a temporary "
+                                   "directory removed on exit)")
 
     # List sample chats
     subparsers.add_parser(
@@ -45,6 +218,86 @@ def parse_args():
     return parser.parse_args()
 
 
+def parse_metrics(value):
+    """Parse a comma-separated --metrics value into metric names"""
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    try:
+        metrics.resolve_metrics(names)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from None
+    return names
+
+
+def parse_time_bound(value):
+    """Parse a --since or --until value"""
+    # chat_index needs NumPy, so it is only imported when a range is given
+    import chat_index
+
+    try:
+        return chat_index.parse_time_bound(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from None
+
+
+def add_profile_arguments(parser):
+    """Add the options that profile a run"""
+    parser.add_argument("--profile", action="store_true",
+                        help="Print wall time, CPU time, message counts and peak memory per stage")
+    parser.add_argument("--profile-json", metavar="PATH",
+                        help="Also write the profile to a JSON file (implies --profile)")
+    parser.add_argument("--profile-stats", metavar="PATH",
+                        help="Dump cProfile stats for the parse loop to a file (implies --profile)")
+    parser.add_argument("--no-trace-memory", action="store_true",
+                        help="Skip peak memory tracing while profiling, which slows parsing down")
+
+
+def get_profiler(args):
+    """Return a Profiler if profiling was requested, otherwise None"""
+    if not (args.profile or args.profile_json or args.profile_stats):
+        return None
+    return profiling.Profiler(trace_memory=not args.no_trace_memory,
+                              stats_path=args.profile_stats)
+
+
+def print_profile(profiler, args):
+    """Print the profile summary and save the requested profile files"""
+    profiler.close()
+    print("\nProfile:")
+    print(profiler.summary())
+    if args.profile_json:
+        profiler.write_json(args.profile_json)
+        print(f"Profile saved to: {args.profile_json}")
+    if args.profile_stats:
+        print(f"cProfile stats for the parse loop saved to: {args.profile_stats} "
+              f"(view with: python -m pstats {args.profile_stats})")
+
+
+def get_chat_format(args):
+    """Return the ChatFormat chosen with --dialect, or None to detect it"""
+    if args.dialect == "auto":
+        return None
+    return chat_formats.get_chat_format(args.dialect)
+
+
+def get_vocabulary_size(args, file_path):
+    """Return the word and emoji counter capacity, or None for exact counts"""
+    if args.vocabulary_size is None:
+        return heavy_hitters.default_capacity(os.path.getsize(file_path))
+    if args.vocabulary_size <= 0:
+        return None
+    return args.vocabulary_size
+
+
+def get_session_gap(args):
+    """Return the idle minutes that split conversations for reply times"""
+    if args.session_gap is None:
+        # NumPy is only loaded when reply times are computed
+        from replies import DEFAULT_SESSION_GAP
+
+        return DEFAULT_SESSION_GAP
+    return args.session_gap
+
+
 def run_basic_analyzer(args):
     """Run the basic analyzer with optional visualization"""
     if not args.file:
@@ -56,7 +309,13 @@ def run_basic_analyzer(args):
         print(f"Error: File not found: {file_path}")
         return
 
-    message_count = whatsapp_analyzer.analyze_whatsapp_chat(file_path)
+    profiler = get_profiler(args)
+    stages = profiler or profiling.NULL_PROFILER
+
+    with stages.stage("parse", cprofile=True) as record:
+        message_count = whatsapp_analyzer.analyze_whatsapp_chat(
+            file_path, get_chat_format(args), profiler=profiler)
+        record['messages'] = sum(message_count.values())
 
     if not message_count:
         print("No messages found or incorrect file format.")
@@ -66,16 +325,85 @@ def run_basic_analyzer(args):
 
     if args.plot:
         try:
-            whatsapp_analyzer.plot_results(message_count)
+            with stages.stage("plot_results"):
+                whatsapp_analyzer.plot_results(message_count)
             print("\nVisualization saved as 'whatsapp_analysis.png'")
         except ImportError:
             print("Error: Matplotlib not installed. Cannot generate chart.")
             print("Install it using: pip install matplotlib")
 
+    if profiler is not None:
+        print_profile(profiler, args)
+
+
+def describe_query(args):
+    """Describe the --since, --until and --sender restrictions"""
+    parts = []
+    if args.sender:
+        parts.append(f"from {', '.join(args.sender)}")
+    if args.since is not None:
+        parts.append(f"since {format_time_bound(args.since)}")
+    if args.until is not None:
+        parts.append(f"until {format_time_bound(args.until)}")
+    return " ".join(parts)
+
+
+def format_time_bound(bound):
+    """Format a parsed --since or --until value for display"""
+    if isinstance(bound, timedelta):
+        return f"{bound.days} days before the last message"
+    return bound.isoformat()
+
+
+def write_report_and_charts(data, output_dir, plots=True, jobs=1, profiler=None,
+                            reuse_charts=True):
+    """Write the statistics report and draw the charts for analysis results.
+
+    With ``reuse_charts`` charts whose data is unchanged since the last
+    run into ``output_dir`` are kept instead of being drawn again.
+    """
+    stages = profiler or profiling.NULL_PROFILER
+
+    def draw_charts(jobs):
+        print("Generating visualizations...")
+        cache = render_cache.RenderCache(output_dir) if reuse_charts else None
+        rendered = 0
+        for name, seconds, error in deep_whatsapp_analyzer.render_charts(
+                data, output_dir, jobs=jobs, profiler=stages, cache=cache):
+            if error is not None:
+                print(f"Warning: {name} skipped ({error})")
+            else:
+                rendered += 1
+                print(f"  {name}: {seconds:.2f}s")
+        if cache is not None:
+            print(f"Rendered {rendered} charts, reused {len(cache.reused)} with unchanged data")
+        print(f"Visualizations saved to: {output_dir}/")
+
+    report_path = os.path.join(output_dir, "statistics_report.txt")
+    if profiler is not None:
+        # Run the stages one after another so their timings do not overlap
+        with profiler.stage("report"):
+            deep_whatsapp_analyzer.generate_statistics_report(data, output_dir)
+        if plots:
+            draw_charts(jobs=1)
+    else:
+        # Write the statistics report while the charts are drawn
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=1) as report_writer:
+            report = report_writer.submit(
+                deep_whatsapp_analyzer.generate_statistics_report, data, output_dir)
+            if plots:
+                draw_charts(jobs)
+            report.result()
+    print(f"Statistics report saved to: {report_path}")
+
 
 def run_deep_analyzer(args):
     """Run the comprehensive analyzer with visualizations"""
-    if not args.file:
+    if args.snapshot:
+        file_path = args.snapshot
+    elif not args.file:
         file_path = input("Enter the path to your WhatsApp chat export: ")
     else:
         file_path = args.file
@@ -88,41 +416,284 @@ def run_deep_analyzer(args):
     if not os.path.exists(args.output):
         os.makedirs(args.output)
 
+    if args.follow:
+        run_follow_mode(args, file_path)
+        return
+
     print(f"Analyzing chat: {file_path}")
     print("This may take a moment for large chats...")
 
+    if args.session_gap is not None:
+        # The session gap is only used by reply times, so it selects them
+        args.metrics = metrics.select_metric(args.metrics, "replies")
+
     # Run the deep analysis
-    data = deep_whatsapp_analyzer.analyze_whatsapp_chat(file_path)
+    chat_format = get_chat_format(args)
+    vocabulary_size = None if args.snapshot else get_vocabulary_size(args, file_path)
+    profiler = get_profiler(args)
+    stages = profiler or profiling.NULL_PROFILER
+    # Range and sender queries run on a ChatIndex, which is cached like the
+    # other results so later queries do not parse the export again
+    query = any(value is not None for value in (args.since, args.until, args.sender))
+
+    def analyze():
+        if args.incremental:
+            return checkpoint.analyze_incremental(
+                file_path, checkpoint.checkpoint_path(args.output),
+                chunk_size=args.chunk_size, columnar=args.columnar, jobs=args.jobs,
+                chat_format=chat_format, vocabulary_size=vocabulary_size, metrics=args.metrics,
+                index=query)
+        return deep_whatsapp_analyzer.analyze_whatsapp_chat(
+            file_path, chunk_size=args.chunk_size, columnar=args.columnar, jobs=args.jobs,
+            chat_format=chat_format, vocabulary_size=vocabulary_size, profiler=profiler,
+            metrics=args.metrics, index=query)
+
+    with stages.stage("parse", cprofile=True) as record:
+        if args.snapshot:
+            # Snapshots are already parsed and are read straight from disk
+            import snapshot
+
+            data = snapshot.Snapshot(file_path).results(index=query, metrics=args.metrics)
+        elif args.no_cache:
+            data = analyze()
+        else:
+            cache = parse_cache.ParseCache(args.cache_dir, args.cache_size * 1024 * 1024)
+            data = parse_cache.analyze_cached(file_path, analyze, cache, columnar=args.columnar,
+                                              dialect=args.dialect,
+                                              vocabulary_size=vocabulary_size,
+                                              metrics=metrics.resolve_metrics(args.metrics),
+                                              index=query)
+        record['messages'] = sum(data['message_count'].values())
 
     if not data['message_count']:
         print("No messages found or incorrect file format.")
         return
 
-    # Generate statistics report
-    report_path = os.path.join(args.output, "statistics_report.txt")
-    deep_whatsapp_analyzer.generate_statistics_report(data, args.output)
-    print(f"Statistics report saved to: {report_path}")
+    if query:
+        import chat_index
 
-    # Generate visualizations
-    if not args.no_plots:
-        print("Generating visualizations...")
-        deep_whatsapp_analyzer.plot_message_count(data, args.output)
-        deep_whatsapp_analyzer.plot_media_count(data, args.output)
-        deep_whatsapp_analyzer.plot_hourly_activity(data, args.output)
-        deep_whatsapp_analyzer.plot_weekday_activity(data, args.output)
-        deep_whatsapp_analyzer.plot_activity_over_time(data, args.output)
-        deep_whatsapp_analyzer.plot_average_message_length(data, args.output)
+        with stages.stage("query") as record:
+            data = chat_index.query_results(data, args.since, args.until, args.sender,
+                                            get_session_gap(args))
+            record['messages'] = sum(data['message_count'].values())
+        if not data['message_count']:
+            print(f"No messages {describe_query(args)}.")
+            return
+        print(f"Analyzing messages {describe_query(args)}")
+    elif args.session_gap is not None and 'replies' in data:
+        import replies
 
-        try:
-            deep_whatsapp_analyzer.generate_word_cloud(data, args.output)
-        except ImportError:
-            print("Warning: WordCloud not installed. Skipping word cloud generation.")
+        # Results are parsed and cached with the default gap
+        data['replies'] = replies.reply_stats(replies.data_message_times(data), args.session_gap)
 
-        deep_whatsapp_analyzer.plot_emoji_usage(data, args.output)
-        print(f"Visualizations saved to: {args.output}/")
+    write_report_and_charts(data, args.output, not args.no_plots, args.jobs, profiler,
+                            reuse_charts=not args.redraw)
 
     print("\nAnalysis complete!")
 
+    if profiler is not None:
+        print_profile(profiler, args)
+
+
+def run_follow_mode(args, file_path):
+    """Update the deep analysis output whenever the export grows"""
+    if args.snapshot or args.incremental or any(
+            value is not None for value in (args.since, args.until, args.sender)):
+        print("Error: --follow cannot be combined with --snapshot, --incremental, "
+              "--since, --until or --sender")
+        return
+    # The export keeps growing, so word and emoji counts are bounded by default
+    vocabulary_size = (heavy_hitters.DEFAULT_CAPACITY if args.vocabulary_size is None
+                       else get_vocabulary_size(args, file_path))
+    follower = follow.ChatFollower(file_path, args.chunk_size, get_chat_format(args),
+                                   vocabulary_size, args.metrics)
+
+    def update_outputs(data, changed):
+        start = time.perf_counter()
+        deep_whatsapp_analyzer.generate_statistics_report(data, args.output)
+        charts = follow.changed_charts(data, changed) if not args.no_plots else []
+        for name, _, error in deep_whatsapp_analyzer.render_charts(
+                data, args.output, jobs=args.jobs, charts=charts):
+            if error is not None:
+                print(f"Warning: {name} skipped ({error})")
+        print(f"{time.strftime('%H:%M:%S')} {sum(data['message_count'].values())} messages, "
+              f"updated the report and {len(charts)} charts in "
+              f"{time.perf_counter() - start:.2f}s")
+
+    print(f"Following chat: {file_path} (Ctrl+C to stop)")
+    try:
+        follow.follow_chat(follower, update_outputs, args.follow_interval,
+                           min(args.follow_interval, 1.0))
+    except UnicodeDecodeError:
+        print("Error: --follow only supports UTF-8 exports")
+    except KeyboardInterrupt:
+        print(f"\nStopped following. Output saved to: {args.output}/")
+
+
+def run_batch_analyzer(args):
+    """Analyze every export in a directory and summarize them together"""
+    if not os.path.isdir(args.directory):
+        print(f"Error: Directory not found: {args.directory}")
+        return
+
+    file_paths = batch.find_exports(args.directory)
+    if not file_paths:
+        print(f"No chat exports (.txt) found in {args.directory}")
+        return
+    os.makedirs(args.output, exist_ok=True)
+
+    chat_format = get_chat_format(args)
+    cache_dir = None
+    if not args.no_cache:
+        cache_dir = args.cache_dir or parse_cache.default_cache_dir()
+    tasks = []
+    for file_path in file_paths:
+        options = {
+            'plots': not args.no_plots,
+            'cache_dir': cache_dir,
+            'cache_size': args.cache_size * 1024 * 1024,
+            'dialect': args.dialect,
+            'chat_format': chat_format,
+            'vocabulary_size': get_vocabulary_size(args, file_path),
+        }
+        tasks.append((file_path, batch.output_dir_for(file_path, args.directory, args.output),
+                      options))
+
+    print(f"Analyzing {len(tasks)} chats with {min(args.jobs, len(tasks))} workers...")
+    start = time.perf_counter()
+    summaries = []
+    failures = []
+    for done, (file_path, summary, error) in enumerate(batch.analyze_batch(tasks, args.jobs), 1):
+        if error is not None:
+            failures.append((file_path, error))
+            print(f"[{done}/{len(tasks)}] {file_path}: FAILED ({error})")
+        else:
+            summaries.append(summary)
+            messages = sum(summary['message_count'].values())
+            print(f"[{done}/{len(tasks)}] {file_path}: {messages} messages "
+                  f"({summary['seconds']:.2f}s)")
+    elapsed = time.perf_counter() - start
+
+    summary_path = batch.write_batch_summary(summaries, failures, args.output)
+    print(f"\nBatch summary saved to: {summary_path}")
+
+    total_bytes = sum(os.path.getsize(file_path) for file_path in file_paths)
+    print(f"Analyzed {len(summaries)} chats ({len(failures)} failed) in {elapsed:.2f}s: "
+          f"{len(tasks) / elapsed:.2f} files/s, "
+          f"{total_bytes / (1024 * 1024) / elapsed:.2f} MB/s")
+
+
+def run_snapshot_writer(args):
+    """Parse a chat export into a snapshot directory"""
+    if not args.file:
+        file_path = input("Enter the path to your WhatsApp chat export: ")
+    else:
+        file_path = args.file
+
+    if not os.path.exists(file_path):
+        print(f"Error: File not found: {file_path}")
+        return
+
+    # NumPy is only loaded when a snapshot is written
+    import snapshot
+
+    start = time.perf_counter()
+    try:
+        messages = snapshot.write_snapshot(file_path, args.snapshot, get_chat_format(args),
+                                           vocabulary_size=get_vocabulary_size(args, file_path))
+    except ValueError as exc:
+        print(f"Error: {exc}")
+        return
+    print(f"Saved {messages} messages to {args.snapshot}/ "
+          f"in {time.perf_counter() - start:.2f}s")
+    print(f"Analyze it with: python cli.py deep --snapshot {args.snapshot}")
+
+
+def run_database_command(args):
+    """Run a db subcommand"""
+    # SQLite and the parser are only loaded for db commands
+    import sqlite3
+    import chat_database
+    from chat_formats import from_timestamp
+
+    if args.db_command is None:
+        print("Use one of: db ingest, db report, db search, db list")
+        return
+    if args.db_command != "ingest" and not os.path.exists(args.database):
+        print(f"Error: Database not found: {args.database}")
+        return
+
+    with chat_database.ChatDatabase(args.database) as database:
+        if args.db_command == "ingest":
+            if args.name and len(args.files) > 1:
+                print("Error: --name can only be used with a single file")
+                return
+            for file_path in args.files:
+                if not os.path.exists(file_path):
+                    print(f"Error: File not found: {file_path}")
+                    continue
+                start = time.perf_counter()
+                messages = database.ingest(file_path, args.name, get_chat_format(args),
+                                           force=args.force)
+                name = args.name or chat_database.chat_name(file_path)
+                if messages is None:
+                    print(f"{name}: unchanged, skipped")
+                else:
+                    print(f"{name}: {messages} messages ({time.perf_counter() - start:.2f}s)")
+
+        elif args.db_command == "report":
+            if args.session_gap is not None:
+                args.metrics = metrics.select_metric(args.metrics, "replies")
+            data = chat_database.query_database(database, args.chat, args.since, args.until,
+                                                args.sender, get_session_gap(args), args.metrics)
+            if not data['message_count']:
+                print("No messages found.")
+                return
+            os.makedirs(args.output, exist_ok=True)
+            write_report_and_charts(data, args.output, not args.no_plots, args.jobs,
+                                    reuse_charts=not args.redraw)
+
+        elif args.db_command == "search":
+            try:
+                matches = database.search(args.query, args.chat, args.limit)
+            except sqlite3.OperationalError as exc:
+                print(f"Error: invalid search query: {exc}")
+                return
+            for chat, timestamp, sender, text in matches:
+                print(f"[{chat}] {from_timestamp(timestamp):%Y-%m-%d %H:%M} {sender}: {text}")
+
+        elif args.db_command == "list":
+            for name, messages, first, last in database.chats():
+                span = ""
+                if messages:
+                    span = (f", {from_timestamp(first):%Y-%m-%d} to "
+                            f"{from_timestamp(last):%Y-%m-%d}")
+                print(f"{name}: {messages} messages{span}")
+
+
+def run_server(args):
+    """Serve analyses of uploaded exports until interrupted"""
+    # asyncio and the server are only loaded for this command
+    import asyncio
+    import server
+
+    if args.jobs < 1:
+        print("Error: --jobs must be at least 1")
+        return
+    print(f"Serving on http://{args.host}:{args.port}/ with {args.jobs} workers (Ctrl+C to stop)")
+    print(f"Analyze an export with: curl --data-binary @chat.txt "
+          f"'http://{args.host}:{args.port}/analyze?charts=1'")
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.work_dir, workers=args.jobs,
+                                 max_queue=args.max_queue,
+                                 max_upload=args.max_upload * 1024 * 1024,
+                                 max_uploads=args.max_uploads,
+                                 cache_entries=args.cache_entries))
+    except OSError as exc:
+        print(f"Error: cannot listen on {args.host}:{args.port} ({exc.strerror})")
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
+
 
 def list_samples():
     """List sample chat files in the repository"""
@@ -149,30 +720,16 @@ def show_version():
     print("https://github.com/yourusername/whatsapp-chat-analyzer")
     print("\nPython version:", sys.version)
 
-    # Check for installed packages
-    try:
-        import matplotlib
-        print("Matplotlib version:", matplotlib.__version__)
-    except ImportError:
-        print("Matplotlib: Not installed")
-
-    try:
-        import numpy
-        print("NumPy version:", numpy.__version__)
-    except ImportError:
-        print("NumPy: Not installed")
-
-    try:
-        import emoji
-        print("Emoji version:", emoji.__version__)
-    except ImportError:
-        print("Emoji: Not installed")
+    # Check for installed packages without importing them, which would
+    # make this command as slow as loading matplotlib
+    from importlib import metadata
 
-    try:
-        import wordcloud
-        print("WordCloud version:", wordcloud.__version__)
-    except ImportError:
-        print("WordCloud: Not installed")
+    for label, package in [("Matplotlib", "matplotlib"), ("NumPy", "numpy"),
+                           ("Emoji", "emoji"), ("WordCloud", "wordcloud")]:
+        try:
+            print(f"{label} version:", metadata.version(package))
+        except metadata.PackageNotFoundError:
+            print(f"{label}: Not installed")
 
 
 def main():
@@ -183,6 +740,14 @@ def main():
         run_basic_analyzer(args)
     elif args.command == "deep":
         run_deep_analyzer(args)
+    elif args.command == "batch":
+        run_batch_analyzer(args)
+    elif args.command == "snapshot":
+        run_snapshot_writer(args)
+    elif args.command == "db":
+        run_database_command(args)
+    elif args.command == "serve":
+        run_server(args)
     elif args.command == "list-samples":
         list_samples()
     elif args.command == "version":
@@ -194,6 +759,10 @@ def main():
         print("\nUse one of the following commands:")
         print("  python cli.py basic  - Run basic message count analysis")
         print("  python cli.py deep   - Run comprehensive analysis with visualizations")
+        print("  python cli.py batch  - Analyze every chat export in a directory")
+        print("  python cli.py snapshot - Save a parsed chat as memory-mappable columns")
+        print("  python cli.py db     - Store chats in SQLite, then report on or search them")
+        print("  python cli.py serve  - Analyze uploaded chat exports over local HTTP")
         print("  python cli.py list-samples - List available sample chat files")
         print("  python cli.py version - Show version information")
         print("\nFor more options, use: python cli.py --help")
@@ -1,143 +1,350 @@
 import re
+import io
+import time
 from collections import Counter, defaultdict
-from datetime import datetime
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from wordcloud import WordCloud
-import numpy as np
-import emoji
+from operator import attrgetter
 import os
-
-
-def analyze_whatsapp_chat(file_path):
-    # Regular expression to match the format in your file
-    pattern = r'^(\d+/\d+/\d+),\s(\d+:\d+\s[ap]m)\s-\s([^:]+?)(?:\s\(.*?\))?:\s(.*)$'
-
-    # Data structures for various analytics
-    message_count = Counter()
-    word_count = Counter()
-    emoji_count = Counter()
-    media_count = Counter()
-    hourly_activity = Counter()
-    weekday_activity = Counter()
-    date_activity = defaultdict(int)
-    message_lengths = defaultdict(list)
-    all_text = []
+from chat_formats import DEFAULT_FORMAT_NAME, WEEKDAYS, detect_format, get_chat_format
+from heavy_hitters import TopKCounter, counter_total
+from metrics import BATCH_SIZE, MessageBatch, batch_columns, make_collectors
+from profiling import NULL_PROFILER
+
+# Plotting, word cloud, emoji, NumPy and process pool modules are imported
+# inside the functions that use them, so importing this module (and
+# running the CLI without plots) stays fast
+
+
+# Bump whenever a change to parsing changes the results, so saved results
+# from older versions are not reused
+PARSER_VERSION = 7
+
+# Number of characters read from the export at a time by the streaming parser
+CHUNK_SIZE = 1024 * 1024
+
+
+def _format_or_default(chat_format):
+    return chat_format or get_chat_format(DEFAULT_FORMAT_NAME)
+
+
+def iter_messages(file, chunk_size=CHUNK_SIZE, chat_format=None):
+    """Yield complete (possibly multi-line) messages from an open text file.
+
+    The file is read in chunks of ``chunk_size`` characters. Only the text
+    after the last message start seen so far is carried over to the next
+    chunk, so memory stays proportional to the chunk size rather than the
+    size of the export.
+    """
+    message_start = _format_or_default(chat_format).message_start
+    pending = ''
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        messages = message_start.split(pending + chunk)
+        # The last piece may continue in the next chunk
+        pending = messages.pop()
+        yield from messages
+    yield pending
+
+
+def parse_messages(messages, columnar=False, chat_format=None, keep_text=False,
+                   vocabulary_size=None, profiler=None, metrics=None, index=False):
+    """Parse raw messages into partial results that can be merged.
+
+    This is the single parse engine behind both analyzers. Each message is
+    matched and its date and time decoded once; the parsed messages are
+    then handed in batches to the collectors of the selected ``metrics``
+    (see metrics.METRIC_COLLECTORS, all by default), so metrics that are
+    not selected cost nothing. Partial results map collector names to
+    collectors: results for consecutive parts of a chat can be combined
+    with merge_results() and turned into the final statistics with
+    finalize_results().
+
+    With ``columnar=True`` the per-message attributes are kept in a
+    MessageStore instead of the sender and activity collectors.
+    ``chat_format`` is the ChatFormat of the export (Android 12-hour
+    day-first by default). The raw message text is only kept (under
+    'all_text') with ``keep_text=True``; the word cloud is drawn from the
+    word counts. With a ``vocabulary_size`` the word and emoji counts are
+    approximate TopKCounters tracking about that many items each, instead
+    of exact Counters. A ``profiler`` (see profiling.Profiler) times
+    matching, decoding, each shared batch column and each collector. With
+    ``index=True`` the messages are also kept in a time-sorted
+    chat_index.ChatIndex for date range and sender queries.
+    """
+    batches = iter_batches(messages, chat_format, profiler)
+    collectors = make_collectors(metrics, columnar, keep_text, vocabulary_size, index)
+    steps = [collector.add for collector in collectors.values()]
+    if profiler is not None:
+        # Shared batch columns are computed as steps of their own first,
+        # so they are not charged to the first collector that reads them
+        steps = [profiler.timed(f'column {name}', attrgetter(name))
+                 for name in batch_columns(collectors.values())]
+        steps.extend(profiler.timed(name, collector.add)
+                     for name, collector in collectors.items())
+
+    for batch in batches:
+        for step in steps:
+            step(batch)
+    return collectors
+
+
+def iter_batches(messages, chat_format=None, profiler=None):
+    """Match raw messages and yield them as MessageBatches of parsed messages.
+
+    Messages that do not match ``chat_format`` or have an invalid date are
+    skipped. A ``profiler`` times reading, matching and decoding.
+    """
+    # Not a generator itself, so the profiler steps are set up right away
+
+    chat_format = _format_or_default(chat_format)
+    match_message = chat_format.pattern.match
+    decode_date = chat_format.decode_date
+    decode_time = chat_format.decode_time
+
+    if profiler is not None:
+        messages = profiler.timed_iter('read+split', messages)
+        match_message = profiler.timed('match', match_message)
+        decode_date = profiler.timed('timestamp', decode_date)
+        decode_time = profiler.timed('timestamp', decode_time)
+    return _iter_batches(messages, match_message, decode_date, decode_time)
+
+
+def _iter_batches(messages, match_message, decode_date, decode_time):
+    rows = []
+    append_row = rows.append
+    for message in messages:
+        match = match_message(message)
+        if not match:
+            continue
+        date_str, time_str, sender, text = match.groups()
+
+        # Decode date and time through the memoized decoders
+        try:
+            append_row((sender, decode_date(date_str), decode_time(time_str), text))
+        except ValueError:
+            # Skip messages with invalid date formats
+            continue
+
+        if len(rows) == BATCH_SIZE:
+            yield MessageBatch(rows)
+            rows.clear()
+
+    if rows:
+        yield MessageBatch(rows)
+
+
+def merge_results(parts):
+    """Combine partial results of consecutive parts of a chat, in order"""
+    merged = None
+    for part in parts:
+        if merged is None:
+            merged = part
+            continue
+        for name, collector in part.items():
+            merged[name].merge(collector)
+    return merged
+
+
+def finalize_results(partial):
+    """Turn partial results into the statistics returned to callers"""
+    data = {}
+    for collector in partial.values():
+        collector.finalize(data)
+    return data
+
+
+def analyze_messages(messages, columnar=False, chat_format=None, keep_text=False,
+                     vocabulary_size=None, profiler=None, metrics=None, index=False):
+    """Compute all chat statistics from an iterable of raw messages.
+
+    With ``columnar=True`` the sender and activity statistics are derived
+    from a MessageStore, which is returned under the 'store' key. With
+    ``index=True`` a ChatIndex is returned under the 'index' key.
+    """
+    return finalize_results(parse_messages(messages, columnar, chat_format, keep_text,
+                                           vocabulary_size, profiler, metrics, index))
+
+
+def analyze_file(file, chunk_size=CHUNK_SIZE, columnar=False, chat_format=None, keep_text=False,
+                 vocabulary_size=None, profiler=None, metrics=None, index=False):
+    """Analyze an open text file, detecting its format unless one is given"""
+    chat_format = chat_format or detect_format(file)
+    return analyze_messages(iter_messages(file, chunk_size, chat_format), columnar, chat_format,
+                            keep_text, vocabulary_size, profiler, metrics, index)
+
+
+def detect_file_format(file_path, encoding='utf-8'):
+    """Detect the ChatFormat of a chat export from its first lines"""
+    with open(file_path, 'r', encoding=encoding) as file:
+        return detect_format(file)
+
+
+class _ByteRange(io.RawIOBase):
+    """Read-only view of the bytes between two offsets of a file"""
+
+    def __init__(self, file_path, start, end):
+        super().__init__()
+        self._file = open(file_path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._remaining)
+        data = self._file.read(size)
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def find_message_start(file, offset, window=CHUNK_SIZE, chat_format=None):
+    """Return the byte offset of the first message start at or after offset.
+
+    The returned offset points at the newline that precedes the message (or
+    at the carriage return of a CRLF pair), or is None if no message starts
+    after ``offset``.
+    """
+    byte_message_start = _format_or_default(chat_format).byte_message_start
+    file.seek(offset)
+    buffer = b''
+    while True:
+        chunk = file.read(window)
+        if not chunk:
+            return None
+        buffer += chunk
+        match = byte_message_start.search(buffer)
+        if match:
+            position = match.start()
+            if position > 0 and buffer[position - 1:position] == b'\r':
+                position -= 1
+            elif position == 0 and offset > 0:
+                file.seek(offset - 1)
+                if file.read(1) == b'\r':
+                    position -= 1
+            return offset + position
+
+
+def find_last_message_start(file, end, window=CHUNK_SIZE, chat_format=None):
+    """Return the offset of the line break before the last message that
+    starts before ``end``, or None if there is only one message"""
+    byte_message_start = _format_or_default(chat_format).byte_message_start
+    buffer = b''
+    position = end
+    while position > 0:
+        block_start = max(0, position - window)
+        file.seek(block_start)
+        buffer = file.read(position - block_start) + buffer
+        position = block_start
+        matches = list(byte_message_start.finditer(buffer))
+        if matches:
+            return find_message_start(file, position + matches[-1].start(), window, chat_format)
+    return None
+
+
+def skip_line_break(file, offset):
+    """Return the offset just after the (CR)LF line break at ``offset``"""
+    file.seek(offset)
+    return offset + (2 if file.read(1) == b'\r' else 1)
+
+
+def shard_boundaries(file_path, jobs, chunk_size=CHUNK_SIZE, start=0, end=None,
+                     chat_format=None):
+    """Split a file into up to ``jobs`` byte ranges that start on a message.
+
+    Each range is returned as (start, end) where start is the first byte of
+    a message and end is the offset of the line break before the next
+    shard, so the shards parse to exactly the same messages as the whole
+    file does. ``start`` and ``end`` restrict the split to part of the file
+    and must themselves lie on message boundaries.
+    """
+    if end is None:
+        end = os.path.getsize(file_path)
+    shards = []
+    first = start
+    with open(file_path, 'rb') as file:
+        for shard in range(1, jobs):
+            target = max(first + (end - first) * shard // jobs, start)
+            shard_end = find_message_start(file, target, chunk_size, chat_format)
+            if shard_end is None or shard_end >= end:
+                break
+            if shard_end <= start:
+                continue
+            shards.append((start, shard_end))
+            # Skip the line break that separates the shards
+            start = skip_line_break(file, shard_end)
+    shards.append((start, end))
+    return shards
+
+
+def parse_shard(file_path, start, end, chunk_size=CHUNK_SIZE, columnar=False, chat_format=None,
+                keep_text=False, vocabulary_size=None, metrics=None, index=False):
+    """Parse the UTF-8 encoded byte range [start, end) of a chat export"""
+    with io.TextIOWrapper(io.BufferedReader(_ByteRange(file_path, start, end)),
+                          encoding='utf-8') as file:
+        return parse_messages(iter_messages(file, chunk_size, chat_format), columnar, chat_format,
+                              keep_text, vocabulary_size, metrics=metrics, index=index)
+
+
+def parse_parallel(file_path, jobs, chunk_size=CHUNK_SIZE, columnar=False, start=0, end=None,
+                   chat_format=None, keep_text=False, vocabulary_size=None, metrics=None,
+                   index=False):
+    """Parse a chat export (or a byte range of it) in ``jobs`` processes
+    and merge the shards"""
+    from concurrent.futures import ProcessPoolExecutor
+
+    shards = shard_boundaries(file_path, jobs, chunk_size, start, end, chat_format)
+    with ProcessPoolExecutor(max_workers=min(jobs, len(shards))) as executor:
+        futures = [executor.submit(parse_shard, file_path, start, end, chunk_size, columnar,
+                                   chat_format, keep_text, vocabulary_size, metrics, index)
+                   for start, end in shards]
+        return merge_results(future.result() for future in futures)
+
+
+def analyze_whatsapp_chat(file_path, chunk_size=CHUNK_SIZE, columnar=False, jobs=1,
+                          chat_format=None, keep_text=False, vocabulary_size=None,
+                          profiler=None, metrics=None, index=False):
+    """Analyze a chat export.
+
+    The export dialect is detected from the first lines of the file unless
+    a ChatFormat is given. Pass ``keep_text=True`` to also get the raw text
+    of all non-media messages under 'all_text'. ``vocabulary_size`` bounds
+    the memory used for word and emoji counts by switching them to
+    approximate TopKCounters (see heavy_hitters); by default they are exact.
+    A ``profiler`` times the steps of the parse loop when parsing serially.
+    ``metrics`` selects the metrics to compute by name (see
+    metrics.metric_names()); by default all but replies are computed
+    (see metrics.default_metrics()). ``index=True``
+    also returns a chat_index.ChatIndex under 'index', which answers date
+    range and sender queries without parsing the export again.
+    """
+    if jobs > 1:
+        try:
+            shard_format = chat_format or detect_file_format(file_path)
+            return finalize_results(parse_parallel(file_path, jobs, chunk_size, columnar,
+                                                   chat_format=shard_format,
+                                                   keep_text=keep_text,
+                                                   vocabulary_size=vocabulary_size,
+                                                   metrics=metrics, index=index))
+        except UnicodeDecodeError:
+            # Shards are split on UTF-8 bytes; parse other encodings serially
+            pass
 
     try:
         with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-            # Split by new message pattern (date at beginning of line)
-            messages = re.split(r'\n(?=\d+/\d+/\d+)', content)
-
-            for message in messages:
-                match = re.match(pattern, message, re.DOTALL)
-                if match:
-                    date_str, time_str, sender, text = match.groups()
-
-                    # Parse date and time
-                    try:
-                        date_obj = datetime.strptime(
-                            f"{date_str}, {time_str}", "%d/%m/%y, %I:%M %p")
-
-                        # Count messages by sender
-                        message_count[sender.strip()] += 1
-
-                        # Count messages by hour
-                        hour = date_obj.hour
-                        hourly_activity[hour] += 1
-
-                        # Count messages by weekday
-                        weekday = date_obj.strftime('%A')
-                        weekday_activity[weekday] += 1
-
-                        # Count messages by date
-                        date_only = date_obj.strftime('%Y-%m-%d')
-                        date_activity[date_only] += 1
-
-                        # Word analysis
-                        if text:
-                            # Check for media messages
-                            if "<Media omitted>" in text or "image omitted" in text or "video omitted" in text:
-                                media_count[sender.strip()] += 1
-                            else:
-                                # Count words
-                                words = text.split()
-                                word_count.update(words)
-
-                                # Store message length
-                                message_lengths[sender.strip()].append(
-                                    len(words))
-
-                                # Store text for word cloud
-                                all_text.append(text)
-
-                                # Count emojis
-                                for char in text:
-                                    if char in emoji.EMOJI_DATA:
-                                        emoji_count[char] += 1
-                    except ValueError:
-                        # Skip messages with invalid date formats
-                        pass
+            return analyze_file(file, chunk_size, columnar, chat_format, keep_text,
+                                vocabulary_size, profiler, metrics, index)
     except UnicodeDecodeError:
-        # If UTF-8 fails, try with another encoding
+        # If UTF-8 fails, start over with another encoding
         with open(file_path, 'r', encoding='utf-16') as file:
-            # Repeat the same analysis...
-            content = file.read()
-            # Split by new message pattern
-            messages = re.split(r'\n(?=\d+/\d+/\d+)', content)
-
-            for message in messages:
-                match = re.match(pattern, message, re.DOTALL)
-                if match:
-                    # Same processing as above...
-                    date_str, time_str, sender, text = match.groups()
-
-                    try:
-                        date_obj = datetime.strptime(
-                            f"{date_str}, {time_str}", "%d/%m/%y, %I:%M %p")
-                        message_count[sender.strip()] += 1
-                        hour = date_obj.hour
-                        hourly_activity[hour] += 1
-                        weekday = date_obj.strftime('%A')
-                        weekday_activity[weekday] += 1
-                        date_only = date_obj.strftime('%Y-%m-%d')
-                        date_activity[date_only] += 1
-
-                        if text:
-                            if "<Media omitted>" in text or "image omitted" in text or "video omitted" in text:
-                                media_count[sender.strip()] += 1
-                            else:
-                                words = text.split()
-                                word_count.update(words)
-                                message_lengths[sender.strip()].append(
-                                    len(words))
-                                all_text.append(text)
-
-                                for char in text:
-                                    if char in emoji.EMOJI_DATA:
-                                        emoji_count[char] += 1
-                    except ValueError:
-                        pass
-
-    # Calculate average message length by sender
-    avg_message_lengths = {sender: sum(lengths)/len(lengths) if lengths else 0
-                           for sender, lengths in message_lengths.items()}
-
-    # Combine all text for word cloud
-    all_text_combined = ' '.join(all_text)
-
-    return {
-        'message_count': message_count,
-        'word_count': word_count,
-        'emoji_count': emoji_count,
-        'media_count': media_count,
-        'hourly_activity': hourly_activity,
-        'weekday_activity': weekday_activity,
-        'date_activity': date_activity,
-        'avg_message_length': avg_message_lengths,
-        'all_text': all_text_combined
-    }
+            return analyze_file(file, chunk_size, columnar, chat_format, keep_text,
+                                vocabulary_size, profiler, metrics, index)
 
 
 def create_output_directory():
@@ -148,6 +355,7 @@ def create_output_directory():
 
 
 def plot_message_count(data, output_dir):
+    import matplotlib.pyplot as plt
     sorted_counts = sorted(
         data['message_count'].items(), key=lambda x: x[1], reverse=True)
 
@@ -180,6 +388,7 @@ def plot_message_count(data, output_dir):
 
 
 def plot_media_count(data, output_dir):
+    import matplotlib.pyplot as plt
     sorted_counts = sorted(data['media_count'].items(),
                            key=lambda x: x[1], reverse=True)
 
@@ -209,6 +418,7 @@ def plot_media_count(data, output_dir):
 
 
 def plot_hourly_activity(data, output_dir):
+    import matplotlib.pyplot as plt
     hours = range(24)
     counts = [data['hourly_activity'][hour] for hour in hours]
 
@@ -225,9 +435,9 @@ def plot_hourly_activity(data, output_dir):
 
 
 def plot_weekday_activity(data, output_dir):
+    import matplotlib.pyplot as plt
     # Get weekday order right
-    days = ['Monday', 'Tuesday', 'Wednesday',
-            'Thursday', 'Friday', 'Saturday', 'Sunday']
+    days = WEEKDAYS
     counts = [data['weekday_activity'][day] for day in days]
 
     plt.figure(figsize=(12, 6))
@@ -242,17 +452,24 @@ def plot_weekday_activity(data, output_dir):
 
 
 def plot_activity_over_time(data, output_dir):
-    dates = sorted(data['date_activity'].keys())
-    counts = [data['date_activity'][date] for date in dates]
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    from timeline import activity_timeline
 
-    # Convert string dates to datetime objects
-    date_objects = [datetime.strptime(date, '%Y-%m-%d') for date in dates]
+    # Days, weeks or months, whichever keeps the number of points readable
+    timeline = activity_timeline(data)
+    dates = timeline.starts
 
     plt.figure(figsize=(14, 6))
-    plt.plot(date_objects, counts, marker='o',
-             linestyle='-', color='royalblue')
+    plt.plot(dates, timeline.counts, marker='o' if len(dates) <= 60 else None,
+             linestyle='-', color='royalblue', linewidth=1,
+             label=f'Messages per {timeline.granularity}')
+    if len(dates) > timeline.window:
+        plt.plot(dates, timeline.rolling, color='darkorange', linewidth=2,
+                 label=f'{timeline.window}-{timeline.granularity} average')
+        plt.legend()
     plt.xlabel('Date')
-    plt.ylabel('Number of Messages')
+    plt.ylabel(f'Messages per {timeline.granularity}')
     plt.title('Group Activity Over Time')
 
     # Format x-axis to show dates nicely
@@ -267,6 +484,7 @@ def plot_activity_over_time(data, output_dir):
 
 
 def plot_average_message_length(data, output_dir):
+    import matplotlib.pyplot as plt
     sorted_lengths = sorted(
         data['avg_message_length'].items(), key=lambda x: x[1], reverse=True)
 
@@ -276,15 +494,31 @@ def plot_average_message_length(data, output_dir):
 
     senders = [sender for sender, _ in sorted_lengths]
     lengths = [length for _, length in sorted_lengths]
+    stats = data.get('length_stats')
 
     plt.figure(figsize=(12, 8))
-    bars = plt.bar(senders, lengths, color='mediumpurple')
+    if stats:
+        # Standard deviation as error bars, median and 90th percentile as markers
+        bars = plt.bar(senders, lengths, color='mediumpurple', label='Mean',
+                       yerr=[stats[sender]['std'] for sender in senders],
+                       error_kw={'ecolor': 'gray', 'capsize': 4})
+        plt.scatter(senders, [stats[sender]['median'] for sender in senders],
+                    marker='D', color='black', zorder=3, label='Median')
+        plt.scatter(senders, [stats[sender]['p90'] for sender in senders],
+                    marker='^', color='crimson', zorder=3, label='90th percentile')
+        plt.legend()
+    else:
+        bars = plt.bar(senders, lengths, color='mediumpurple')
 
-    # Add length labels
+    # Add length labels, inside the bars when markers are drawn above them
     for bar in bars:
         height = bar.get_height()
-        plt.text(bar.get_x() + bar.get_width()/2., height + 0.1,
-                 f'{height:.1f}', ha='center', va='bottom')
+        if stats:
+            plt.text(bar.get_x() + bar.get_width()/2., height / 2,
+                     f'{height:.1f}', ha='center', va='center', color='white')
+        else:
+            plt.text(bar.get_x() + bar.get_width()/2., height + 0.1,
+                     f'{height:.1f}', ha='center', va='bottom')
 
     plt.xlabel('Group Members')
     plt.ylabel('Average Words per Message')
@@ -295,22 +529,58 @@ def plot_average_message_length(data, output_dir):
     plt.close()
 
 
+# List of common words to exclude from the word cloud
+WORD_CLOUD_STOPWORDS = {
+    "the", "and", "to", "of", "in", "a", "is", "that", "for", "on", "with",
+    "as", "this", "by", "an", "are", "at", "be", "but", "or", "have", "it",
+    "from", "you", "was", "not", "what", "all", "they", "when", "we", "there",
+    "can", "no", "yes", "Media", "omitted", "hai", "he", "che", "ne", "ma"
+}
+
+# Same word pattern WordCloud uses to tokenize text
+WORD_TOKEN = re.compile(r"\w[\w']*")
+
+
+def word_frequencies(word_count, stopwords=WORD_CLOUD_STOPWORDS):
+    """Turn the word counts into word cloud frequencies.
+
+    This gives the same frequencies WordCloud.generate() would compute from
+    the full chat text: tokens are split like WordCloud does, a trailing
+    's is dropped, numbers and stopwords are removed, plurals are merged
+    into their singular and each word is shown in its most common case.
+    """
+    stopwords = {word.lower() for word in stopwords}
+    cases = defaultdict(Counter)
+    for token, count in word_count.items():
+        for word in WORD_TOKEN.findall(token):
+            if word.lower().endswith("'s"):
+                word = word[:-2]
+            if word.isdigit() or word.lower() in stopwords:
+                continue
+            cases[word.lower()][word] += count
+
+    # Merge plurals into the singular count (simple cases only)
+    for key in list(cases):
+        if key.endswith('s') and not key.endswith('ss') and key[:-1] in cases:
+            for word, count in cases.pop(key).items():
+                cases[key[:-1]][word[:-1]] += count
+
+    return {case_counts.most_common(1)[0][0]: sum(case_counts.values())
+            for case_counts in cases.values()}
+
+
 def generate_word_cloud(data, output_dir):
-    # Filter out common WhatsApp and common words
-    text = data['all_text']
+    import matplotlib.pyplot as plt
+    from wordcloud import WordCloud
 
-    # List of common words to exclude
-    stopwords = set([
-        "the", "and", "to", "of", "in", "a", "is", "that", "for", "on", "with",
-        "as", "this", "by", "an", "are", "at", "be", "but", "or", "have", "it",
-        "from", "you", "was", "not", "what", "all", "they", "when", "we", "there",
-        "can", "no", "yes", "Media", "omitted", "hai", "he", "che", "ne", "ma"
-    ])
+    # Filter out common WhatsApp and common words from the word counts
+    frequencies = word_frequencies(data['word_count'])
+    if not frequencies:
+        return  # Skip if there are no words left
 
     # Create and generate the word cloud
     wordcloud = WordCloud(width=800, height=400, background_color='white',
-                          stopwords=stopwords, max_words=100,
-                          collocations=False).generate(text)
+                          max_words=100).generate_from_frequencies(frequencies)
 
     # Display the word cloud
     plt.figure(figsize=(10, 5))
@@ -322,6 +592,7 @@ def generate_word_cloud(data, output_dir):
 
 
 def plot_emoji_usage(data, output_dir):
+    import matplotlib.pyplot as plt
     emoji_counts = data['emoji_count']
 
     if not emoji_counts:
@@ -350,6 +621,62 @@ def plot_emoji_usage(data, output_dir):
     plt.close()
 
 
+def plot_reply_latency(data, output_dir):
+    import matplotlib.pyplot as plt
+    import numpy as np
+    pair_latency = data['replies']['pair_latency']
+
+    if not pair_latency:
+        return  # Skip if nobody replied to anyone
+
+    # Take the 15 members involved in the most replies
+    involved = Counter()
+    for (member, replied_to), stats in pair_latency.items():
+        involved[member] += stats['replies']
+        involved[replied_to] += stats['replies']
+    members = [member for member, _ in involved.most_common(15)]
+    positions = {member: i for i, member in enumerate(members)}
+
+    medians = np.full((len(members), len(members)), np.nan)
+    for (member, replied_to), stats in pair_latency.items():
+        if member in positions and replied_to in positions:
+            medians[positions[member], positions[replied_to]] = stats['median']
+
+    plt.figure(figsize=(12, 10))
+    plt.imshow(np.ma.masked_invalid(medians), cmap='viridis_r')
+    plt.colorbar(label='Median Reply Time (minutes)')
+
+    # Add the median in each cell, in white on the darker (slower) cells
+    middle = (np.nanmin(medians) + np.nanmax(medians)) / 2
+    for row, column in zip(*np.nonzero(~np.isnan(medians))):
+        value = medians[row, column]
+        plt.text(column, row, f'{value:.0f}', ha='center', va='center',
+                 color='white' if value > middle else 'black')
+
+    plt.xticks(range(len(members)), members, rotation=45, ha='right')
+    plt.yticks(range(len(members)), members)
+    plt.xlabel('Replying To')
+    plt.ylabel('Member Replying')
+    plt.title('Median Reply Time Between Members')
+    plt.tight_layout()
+    plt.savefig(f'{output_dir}/reply_latency.png')
+    plt.close()
+
+
+def write_count_accuracy(f, counts, item):
+    """Describe the error bound of approximate word or emoji counts"""
+    if not isinstance(counts, TopKCounter):
+        return
+    if not counts.error:
+        # Nothing has been forgotten yet
+        return
+    bound = counts.total() / (counts.capacity + 1)
+    f.write(f"Note: {item} counts are approximate (tracking up to {counts.capacity} "
+            f"distinct {item}s). Each count may be up to {counts.error} below its true "
+            f"value (guaranteed at most {bound:.0f}), and every {item} used more than "
+            f"{counts.error} times is included.\n")
+
+
 def generate_statistics_report(data, output_dir):
     with open(f'{output_dir}/statistics_report.txt', 'w', encoding='utf-8') as f:
         # General statistics
@@ -371,34 +698,37 @@ def generate_statistics_report(data, output_dir):
         f.write("\n")
 
         # Media statistics
-        total_media = sum(data['media_count'].values())
-        f.write(f"Total Media Messages: {total_media}\n")
-        if total_media > 0:
-            media_percentage = (total_media / total_messages) * 100
-            f.write(f"Media Messages Percentage: {media_percentage:.1f}%\n")
-
-            f.write("\nTop 3 Media Senders:\n")
-            sorted_media = sorted(
-                data['media_count'].items(), key=lambda x: x[1], reverse=True)[:3]
-            for i, (member, count) in enumerate(sorted_media, 1):
-                percentage = (count / total_media) * 100
-                f.write(
-                    f"{i}. {member}: {count} media messages ({percentage:.1f}%)\n")
-
-        f.write("\n")
+        if 'media_count' in data:
+            total_media = sum(data['media_count'].values())
+            f.write(f"Total Media Messages: {total_media}\n")
+            if total_media > 0:
+                media_percentage = (total_media / total_messages) * 100
+                f.write(f"Media Messages Percentage: {media_percentage:.1f}%\n")
+
+                f.write("\nTop 3 Media Senders:\n")
+                sorted_media = sorted(
+                    data['media_count'].items(), key=lambda x: x[1], reverse=True)[:3]
+                for i, (member, count) in enumerate(sorted_media, 1):
+                    percentage = (count / total_media) * 100
+                    f.write(
+                        f"{i}. {member}: {count} media messages ({percentage:.1f}%)\n")
+
+            f.write("\n")
 
         # Activity patterns
-        most_active_hour = max(
-            data['hourly_activity'].items(), key=lambda x: x[1])[0]
-        most_active_day = max(
-            data['weekday_activity'].items(), key=lambda x: x[1])[0]
-
-        f.write(
-            f"Most Active Hour: {most_active_hour}:00 - {most_active_hour+1}:00\n")
-        f.write(f"Most Active Day: {most_active_day}\n\n")
+        if 'hourly_activity' in data:
+            most_active_hour = max(
+                data['hourly_activity'].items(), key=lambda x: x[1])[0]
+            f.write(
+                f"Most Active Hour: {most_active_hour}:00 - {most_active_hour+1}:00\n")
+        if 'weekday_activity' in data:
+            most_active_day = max(
+                data['weekday_activity'].items(), key=lambda x: x[1])[0]
+            f.write(f"Most Active Day: {most_active_day}\n")
+        f.write("\n")
 
         # Message length statistics
-        if data['avg_message_length']:
+        if data.get('avg_message_length'):
             avg_lengths = data['avg_message_length']
             overall_avg = sum(avg_lengths.values()) / len(avg_lengths)
             max_avg = max(avg_lengths.items(), key=lambda x: x[1])
@@ -408,10 +738,47 @@ def generate_statistics_report(data, output_dir):
             f.write(
                 f"Member with Longest Messages: {max_avg[0]} ({max_avg[1]:.1f} words on average)\n\n")
 
+        if data.get('length_stats'):
+            f.write("Message Length of the Most Active Members (words):\n")
+            active = [member for member, _ in sorted_members if member in data['length_stats']]
+            for i, member in enumerate(active, 1):
+                stats = data['length_stats'][member]
+                f.write(f"{i}. {member}: mean {stats['mean']:.1f}, median {stats['median']}, "
+                        f"90th percentile {stats['p90']}, std dev {stats['std']:.1f}\n")
+            f.write("\n")
+
+        # Reply times and conversations
+        if data.get('replies') and data['replies']['conversations']['sessions']:
+            replies = data['replies']
+            conversations = replies['conversations']
+            f.write(f"Conversations: {conversations['sessions']} (a new one starts after "
+                    f"{replies['session_gap']} minutes without messages)\n")
+            f.write(f"Median Conversation: {conversations['messages']['median']} messages "
+                    f"over {conversations['minutes']['median']} minutes\n")
+            starter, started = max(replies['session_starters'].items(), key=lambda x: x[1])
+            f.write(f"Starts the Most Conversations: {starter} ({started} conversations)\n\n")
+
+            if replies['sender_latency']:
+                f.write("Reply Times of the Most Active Repliers:\n")
+                top_repliers = sorted(replies['sender_latency'].items(),
+                                      key=lambda x: x[1]['replies'], reverse=True)[:5]
+                for i, (member, stats) in enumerate(top_repliers, 1):
+                    f.write(f"{i}. {member}: median {stats['median']} min, 90th percentile "
+                            f"{stats['p90']} min ({stats['replies']} replies)\n")
+
+                f.write("\nMost Frequent Reply Pairs:\n")
+                top_pairs = sorted(replies['pair_latency'].items(),
+                                   key=lambda x: x[1]['replies'], reverse=True)[:5]
+                for i, ((member, replied_to), stats) in enumerate(top_pairs, 1):
+                    f.write(f"{i}. {member} to {replied_to}: {stats['replies']} replies, "
+                            f"median {stats['median']} min, 90th percentile {stats['p90']} min\n")
+                f.write("\n")
+
         # Word statistics
-        if data['word_count']:
-            total_words = sum(data['word_count'].values())
+        if data.get('word_count'):
+            total_words = counter_total(data['word_count'])
             f.write(f"Total Words: {total_words}\n")
+            write_count_accuracy(f, data['word_count'], "word")
 
             f.write("\nTop 10 Most Used Words:\n")
             # Filter out very short words
@@ -425,9 +792,10 @@ def generate_statistics_report(data, output_dir):
         f.write("\n")
 
         # Emoji statistics
-        if data['emoji_count']:
-            total_emojis = sum(data['emoji_count'].values())
+        if data.get('emoji_count'):
+            total_emojis = counter_total(data['emoji_count'])
             f.write(f"Total Emojis: {total_emojis}\n")
+            write_count_accuracy(f, data['emoji_count'], "emoji")
 
             f.write("\nTop 5 Most Used Emojis:\n")
             top_emojis = sorted(data['emoji_count'].items(
@@ -436,6 +804,136 @@ def generate_statistics_report(data, output_dir):
                 f.write(f"{i}. {emoji_char}: {count} times\n")
 
 
+# Chart functions run by render_charts(), in the order they are drawn
+CHARTS = [
+    plot_message_count,
+    plot_media_count,
+    plot_hourly_activity,
+    plot_weekday_activity,
+    plot_activity_over_time,
+    plot_average_message_length,
+    generate_word_cloud,
+    plot_emoji_usage,
+    plot_reply_latency,
+]
+
+# Results key each chart is drawn from
+CHART_DATA = {
+    'plot_message_count': 'message_count',
+    'plot_media_count': 'media_count',
+    'plot_hourly_activity': 'hourly_activity',
+    'plot_weekday_activity': 'weekday_activity',
+    'plot_activity_over_time': 'date_activity',
+    'plot_average_message_length': 'avg_message_length',
+    'generate_word_cloud': 'word_count',
+    'plot_emoji_usage': 'emoji_count',
+    'plot_reply_latency': 'replies',
+}
+
+# Further results keys a chart draws from when they are present
+CHART_EXTRA_DATA = {
+    'plot_average_message_length': ('length_stats',),
+}
+
+# Image file each chart writes to the output directory
+CHART_FILES = {
+    'plot_message_count': 'message_count.png',
+    'plot_media_count': 'media_count.png',
+    'plot_hourly_activity': 'hourly_activity.png',
+    'plot_weekday_activity': 'weekday_activity.png',
+    'plot_activity_over_time': 'activity_timeline.png',
+    'plot_average_message_length': 'avg_message_length.png',
+    'generate_word_cloud': 'wordcloud.png',
+    'plot_emoji_usage': 'emoji_usage.png',
+    'plot_reply_latency': 'reply_latency.png',
+}
+
+
+def available_charts(data, charts=CHARTS):
+    """Return the charts whose metric was computed"""
+    return [chart for chart in charts if CHART_DATA.get(chart.__name__, 'message_count') in data]
+
+
+def chart_inputs(chart_name, data):
+    """Return the results values a chart is drawn from, None for missing ones"""
+    return [data[CHART_DATA.get(chart_name, 'message_count')]] + [
+        data.get(key) for key in CHART_EXTRA_DATA.get(chart_name, ())]
+
+
+# Analysis results shared with chart worker processes
+_chart_data = None
+
+
+def _init_chart_worker(data):
+    import matplotlib.pyplot as plt
+
+    global _chart_data
+    _chart_data = data
+    # Workers only save files, never show windows
+    plt.switch_backend('agg')
+
+
+def render_chart(chart, data, output_dir):
+    """Draw one chart and return (name, seconds taken, error or None)"""
+    start = time.perf_counter()
+    try:
+        chart(data, output_dir)
+        error = None
+    except ImportError as exc:
+        error = exc
+    return chart.__name__, time.perf_counter() - start, error
+
+
+def _render_chart_in_worker(chart, output_dir):
+    return render_chart(chart, _chart_data, output_dir)
+
+
+def render_charts(data, output_dir, jobs=1, charts=None, profiler=NULL_PROFILER, cache=None):
+    """Draw charts, in ``jobs`` processes if more than one, and yield
+    (name, seconds taken, error or None) as each chart finishes.
+
+    By default every chart whose metric is in ``data`` is drawn. Each chart
+    is a separate ``profiler`` stage when drawn serially. With a
+    render_cache.RenderCache, charts whose input is unchanged since they
+    were last drawn into ``output_dir`` are skipped and listed in
+    ``cache.reused`` instead.
+    """
+    if charts is None:
+        charts = available_charts(data)
+    if cache is not None:
+        charts = cache.stale_charts(charts, data, chart_inputs, CHART_FILES)
+        try:
+            for result in _render_charts(data, output_dir, jobs, charts, profiler):
+                name, _, error = result
+                if error is None:
+                    cache.rendered(name)
+                yield result
+        finally:
+            cache.save()
+        return
+    yield from _render_charts(data, output_dir, jobs, charts, profiler)
+
+
+def _render_charts(data, output_dir, jobs, charts, profiler):
+    if not charts:
+        return
+    if jobs <= 1:
+        for chart in charts:
+            with profiler.stage(chart.__name__):
+                result = render_chart(chart, data, output_dir)
+            yield result
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(charts)),
+                             initializer=_init_chart_worker, initargs=(data,)) as executor:
+        futures = [executor.submit(_render_chart_in_worker, chart, output_dir)
+                   for chart in charts]
+        for future in as_completed(futures):
+            yield future.result()
+
+
 def main():
     file_path = os.getenv("FILE_PATH")
 
@@ -470,7 +968,7 @@ def main():
         plot_average_message_length(data, output_dir)
 
     # Word analysis
-    if data['all_text']:
+    if data['word_count']:
         try:
             generate_word_cloud(data, output_dir)
         except ImportError:
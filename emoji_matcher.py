@@ -0,0 +1,142 @@
+import re
+from functools import lru_cache
+import emoji
+
+# Characters that can follow an emoji inside one sequence: variation
+# selectors, the combining keycap, skin tone modifiers and tag characters
+MODIFIERS = '\ufe0f\ufe0e\u20e3\U0001F3FB-\U0001F3FF\U000E0020-\U000E007F'
+
+REGIONAL_INDICATORS = '\U0001F1E6-\U0001F1FF'
+
+# Gap between code points outside the BMP that is still merged into one
+# character class range
+ASTRAL_RANGE_GAP = 256
+
+
+def _char_ranges(chars):
+    """Build a regex character class body from a set of characters.
+
+    Consecutive BMP code points are collapsed into ranges. The regex engine
+    checks class items outside the BMP one at a time, so those are merged
+    into a few coarse ranges instead; the matches are validated against
+    the emoji set afterwards anyway.
+    """
+    ranges = []
+    for code_point in sorted(set(map(ord, chars))):
+        gap = ASTRAL_RANGE_GAP if code_point > 0xFFFF else 1
+        if ranges and code_point - ranges[-1][1] <= gap:
+            ranges[-1][1] = code_point
+        else:
+            ranges.append([code_point, code_point])
+    return ''.join(re.escape(chr(first)) if first == last
+                   else f'{re.escape(chr(first))}-{re.escape(chr(last))}'
+                   for first, last in ranges)
+
+
+class EmojiMatcher:
+    """Find complete emoji sequences (ZWJ sequences, skin tones, flags, keycaps).
+
+    One compiled regex splits a message into candidate clusters (a base
+    character with its modifiers and ZWJ continuations, a regional
+    indicator pair or a keycap). A cluster found in emoji.EMOJI_DATA is
+    counted as a whole; anything else falls back to a longest-match scan
+    of the cluster. ASCII-only text is skipped entirely, and other text
+    is only split from its first possible emoji character on.
+
+    The results match emoji.emoji_list() except for ZWJ chains that are
+    not an emoji as a whole: the scan keeps the longest emoji at the start
+    of the chain (🧎🏿‍♀️ in 🧎🏿‍♀️‍🧑🏼‍🦯‍➡️), where emoji_list() may split that
+    emoji into its parts.
+    """
+
+    def __init__(self, emojis):
+        self._emojis = frozenset(emojis)
+
+        lengths = {}
+        for sequence in self._emojis:
+            lengths.setdefault(sequence[0], set()).add(len(sequence))
+        # Try the longest sequences first
+        self._lengths = {char: sorted(sizes, reverse=True)
+                         for char, sizes in lengths.items()}
+
+        # ASCII starters ('#', '*', digits) only begin keycap sequences
+        keycaps = _char_ranges(char for char in lengths if char.isascii())
+        bases = _char_ranges(
+            char for char in lengths
+            if not char.isascii() and not '\U0001F1E6' <= char <= '\U0001F1FF')
+        # Only pairs that form a flag, so a stray indicator does not take
+        # the first half of the flag after it
+        second_indicators = {}
+        for sequence in self._emojis:
+            if len(sequence) == 2 and all(
+                    '\U0001F1E6' <= char <= '\U0001F1FF' for char in sequence):
+                second_indicators.setdefault(sequence[0], []).append(sequence[1])
+        flags = '|'.join(f'{first}[{"".join(sorted(seconds))}]'
+                         for first, seconds in sorted(second_indicators.items()))
+        self._clusters = re.compile(
+            f'(?=[{REGIONAL_INDICATORS}])(?:{flags}|.)'
+            f'|[{keycaps}]\\ufe0f?\\u20e3'
+            f'|[{bases}][{MODIFIERS}]*(?:\\u200d[{bases}][{MODIFIERS}]*)*')
+        # Characters one of which every cluster contains; keycaps are found
+        # by their combining mark, since their digits are everywhere
+        self._starters = re.compile(f'[{REGIONAL_INDICATORS}{bases}\\u20e3]')
+
+    def _start(self, text):
+        """Return where clusters can start in text, or -1 if it has none"""
+        if text.isascii():
+            return -1
+        match = self._starters.search(text)
+        if match is None:
+            return -1
+        # A keycap's digit and variation selector come before its mark
+        return max(0, match.start() - 2)
+
+    def _longest_matches(self, text):
+        position = 0
+        while position < len(text):
+            for length in self._lengths.get(text[position], ()):
+                candidate = text[position:position + length]
+                if candidate in self._emojis:
+                    yield candidate
+                    position += length
+                    break
+            else:
+                position += 1
+
+    def finditer(self, text):
+        """Yield every emoji sequence in text, left to right"""
+        start = self._start(text)
+        if start < 0:
+            return
+        for cluster in self._clusters.findall(text, start):
+            if cluster in self._emojis:
+                yield cluster
+            else:
+                yield from self._longest_matches(cluster)
+
+    def findall(self, text):
+        """Return a list of every emoji sequence in text, left to right"""
+        found = []
+        start = self._start(text)
+        if start < 0:
+            return found
+        emojis = self._emojis
+        for cluster in self._clusters.findall(text, start):
+            if cluster in emojis:
+                found.append(cluster)
+            else:
+                found.extend(self._longest_matches(cluster))
+        return found
+
+    def count(self, text, counter):
+        """Add the emoji sequences found in text to a Counter"""
+        found = self.findall(text)
+        # One update() call, so bounded counters can trim themselves
+        if found:
+            counter.update(found)
+
+
+@lru_cache(maxsize=None)
+def get_emoji_matcher():
+    """Return the shared matcher, built once from emoji.EMOJI_DATA"""
+    return EmojiMatcher(emoji.EMOJI_DATA)
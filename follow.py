@@ -0,0 +1,112 @@
+import os
+import time
+from deep_whatsapp_analyzer import (CHART_DATA, CHUNK_SIZE, available_charts, detect_file_format,
+                                    finalize_results, find_last_message_start, merge_results,
+                                    parse_shard, skip_line_break)
+
+# Bytes at the start of the export compared on every update to notice rewrites
+HEAD_SIZE = 4096
+
+
+class ChatFollower:
+    """Keeps the statistics of a chat export that grows at the end up to date.
+
+    Every update() parses only the messages completed since the previous
+    one and merges them into the running collectors, so an update costs
+    time proportional to the new bytes and memory stays bounded by the
+    collectors (pass ``vocabulary_size`` to bound word and emoji counts).
+    The last message of the file is held back until another message
+    starts after it, since the writer may still be appending its text.
+    By default the default metrics are computed, which leave out those
+    that keep data per message. Exports are read as UTF-8, like
+    checkpoints.
+    """
+
+    def __init__(self, file_path, chunk_size=CHUNK_SIZE, chat_format=None,
+                 vocabulary_size=None, metrics=None):
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.chat_format = chat_format
+        self.vocabulary_size = vocabulary_size
+        self.metrics = metrics
+        self.reset()
+
+    def reset(self):
+        """Forget everything parsed so far"""
+        self.partial = None
+        # Start of the first message that has not been parsed yet
+        self.offset = 0
+        self.size = 0
+        self.head = b''
+        # Whether the export was replaced since the last reported change
+        self.replaced = False
+
+    @property
+    def results(self):
+        """Statistics of every complete message parsed so far, or None"""
+        return None if self.partial is None else finalize_results(self.partial)
+
+    def update(self):
+        """Parse newly completed messages and return the results keys they changed.
+
+        If the export shrank or its first bytes changed, it was replaced
+        and is parsed again from the start; every key then counts as
+        changed.
+        """
+        size = os.path.getsize(self.file_path)
+        with open(self.file_path, 'rb') as file:
+            head = file.read(min(size, HEAD_SIZE))
+            if size < self.size or head[:len(self.head)] != self.head:
+                self.reset()
+                self.replaced = True
+            if size == self.size:
+                return set()
+            self.size = size
+            self.head = head
+            if self.chat_format is None:
+                self.chat_format = detect_file_format(self.file_path)
+
+            last = find_last_message_start(file, size, self.chunk_size, self.chat_format)
+            if last is None or last < self.offset:
+                # Nothing but the held back message
+                return set()
+            resume = skip_line_break(file, last)
+
+        part = parse_shard(self.file_path, self.offset, last, self.chunk_size,
+                           chat_format=self.chat_format, vocabulary_size=self.vocabulary_size,
+                           metrics=self.metrics)
+        self.offset = resume
+        data = finalize_results(part)
+        if self.replaced:
+            changed = set(data)
+            self.replaced = False
+        else:
+            changed = {key for key, value in data.items() if value}
+        self.partial = part if self.partial is None else merge_results([self.partial, part])
+        return changed
+
+
+def changed_charts(data, changed):
+    """Return the charts drawn from any of the ``changed`` results keys"""
+    return [chart for chart in available_charts(data)
+            if CHART_DATA.get(chart.__name__, 'message_count') in changed]
+
+
+def follow_chat(follower, on_change, interval=5.0, poll_interval=1.0, stop=None):
+    """Poll a ChatFollower and call ``on_change(data, changed keys)``.
+
+    Changes are collected between calls, so ``on_change`` runs at most
+    once per ``interval`` seconds however often the export grows. Runs
+    until ``stop()`` returns true (forever by default) or the caller
+    interrupts it.
+    """
+    pending = set()
+    last_change = None
+    while stop is None or not stop():
+        pending |= follower.update()
+        now = time.monotonic()
+        if pending and (last_change is None or now - last_change >= interval):
+            on_change(follower.results, pending)
+            pending = set()
+            last_change = now
+        time.sleep(poll_interval)
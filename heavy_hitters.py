@@ -0,0 +1,99 @@
+import heapq
+from collections import Counter
+from collections.abc import Mapping
+
+# Counters kept per vocabulary when approximate counting is chosen
+# automatically
+DEFAULT_CAPACITY = 100000
+
+# Exports smaller than this are always counted exactly by default
+APPROXIMATE_MIN_BYTES = 256 * 1024 * 1024
+
+
+def default_capacity(file_size):
+    """Return the vocabulary capacity used by default for an export of
+    ``file_size`` bytes, or None for exact counts"""
+    if file_size < APPROXIMATE_MIN_BYTES:
+        return None
+    return DEFAULT_CAPACITY
+
+
+class TopKCounter(Counter):
+    """Counter that keeps memory bounded by only tracking frequent items.
+
+    This is the mergeable Misra-Gries summary (the counter-based twin of
+    Space-Saving). Once more than ``2 * capacity`` items are tracked, the
+    (capacity + 1)-th largest count is subtracted from every item and
+    items that drop to zero are forgotten. ``error`` is the total amount
+    subtracted so far, which bounds how far any count is below its true
+    value, and never exceeds ``total() / (capacity + 1)``. Every item
+    seen more than ``error`` times is still tracked, so the most common
+    items and their order are reliable whenever their counts clearly
+    exceed the error.
+
+    Summaries of different parts of a chat are combined with update(),
+    which adds their errors.
+    """
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.error = 0
+        self.observed = 0
+        super().__init__()
+
+    def update(self, iterable=None, **kwds):
+        """Count the items of an iterable, or merge another mapping of counts"""
+        if isinstance(iterable, TopKCounter):
+            self.error += iterable.error
+            self.observed += iterable.observed
+        elif isinstance(iterable, Mapping):
+            self.observed += sum(iterable.values())
+        elif iterable is not None:
+            if not isinstance(iterable, (list, tuple)):
+                iterable = list(iterable)
+            self.observed += len(iterable)
+        super().update(iterable, **kwds)
+        if len(self) > 2 * self.capacity:
+            self.trim()
+
+    def trim(self):
+        """Shrink the summary to at most ``capacity`` items"""
+        if len(self) <= self.capacity:
+            return
+        threshold = heapq.nlargest(self.capacity + 1, self.values())[-1]
+        kept = {item: count - threshold for item, count in self.items() if count > threshold}
+        self.clear()
+        dict.update(self, kept)
+        self.error += threshold
+
+    def total(self):
+        """Return the number of items counted, including forgotten ones"""
+        return self.observed
+
+    def copy(self):
+        duplicate = self.__class__(self.capacity)
+        duplicate.update(self)
+        return duplicate
+
+    def __reduce__(self):
+        return (self.__class__, (self.capacity,),
+                {'error': self.error, 'observed': self.observed},
+                None, iter(self.items()))
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(capacity={self.capacity}, '
+                f'error={self.error}, items={len(self)})')
+
+
+def make_counter(capacity=None):
+    """Return a Counter, or a TopKCounter when a capacity is given"""
+    return Counter() if capacity is None else TopKCounter(capacity)
+
+
+def counter_total(counter):
+    """Return the number of items counted by a Counter or TopKCounter"""
+    if isinstance(counter, TopKCounter):
+        return counter.total()
+    return sum(counter.values())
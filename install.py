@@ -5,9 +5,9 @@ import os
 
 
 def check_python_version():
-    """Check if Python version is at least 3.6"""
-    if sys.version_info < (3, 6):
-        print("Error: Python 3.6 or higher is required")
+    """Check if Python version is at least 3.8"""
+    if sys.version_info < (3, 8):
+        print("Error: Python 3.8 or higher is required")
         print(f"Current version: {sys.version}")
         return False
     return True
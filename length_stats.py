@@ -0,0 +1,47 @@
+from math import sqrt
+
+# Quantiles reported for every sender, by name, in percent
+QUANTILES = {'median': 50, 'p90': 90}
+
+
+def quantile_rank(percent, count):
+    """Return the 1-based nearest rank of a percentile among ``count`` values"""
+    # Integer ceiling, since 0.9 * 10 is a little more than 9 in floats
+    return max(1, -(-percent * count // 100))
+
+
+def summarize_lengths(histogram):
+    """Return the statistics of a histogram mapping message lengths to counts.
+
+    The result has the number of messages, the mean, standard deviation,
+    minimum and maximum, and the QUANTILES (nearest rank, so they are
+    lengths that actually occur). Histograms of consecutive parts of a
+    chat can simply be added up, so they double as an exact, mergeable
+    quantile sketch: word counts are small integers, and a sender's
+    histogram only has one entry per distinct length.
+    """
+    lengths = sorted(histogram)
+    count = sum(histogram.values())
+    total = sum(length * messages for length, messages in histogram.items())
+    squares = sum(length * length * messages for length, messages in histogram.items())
+    stats = {
+        'messages': count,
+        'mean': total / count,
+        # Exact in integers, so there is no cancellation for long chats
+        'std': sqrt((count * squares - total * total) / (count * count)),
+        'min': lengths[0],
+        'max': lengths[-1],
+    }
+    ranks = sorted((quantile_rank(percent, count), name) for name, percent in QUANTILES.items())
+    seen = 0
+    for length in lengths:
+        seen += histogram[length]
+        while ranks and ranks[0][0] <= seen:
+            stats[ranks.pop(0)[1]] = length
+    return stats
+
+
+def length_stats(histograms):
+    """Summarize per-sender length histograms, keeping their order"""
+    return {sender: summarize_lengths(histogram) for sender, histogram in histograms.items()
+            if histogram}
@@ -0,0 +1,227 @@
+from collections import Counter, defaultdict
+from datetime import date
+import numpy as np
+from chat_formats import EPOCH_ORDINAL, EPOCH_WEEKDAY, MINUTES_PER_DAY, WEEKDAYS
+from length_stats import length_stats
+from replies import message_times, reply_stats
+
+
+def activity_counts(timestamps):
+    """Return the hourly, weekday and date activity of an array of timestamps"""
+    days, minutes = np.divmod(timestamps, MINUTES_PER_DAY)
+
+    hours = np.bincount(minutes // 60, minlength=24)
+    hourly_activity = Counter({int(hour): int(hours[hour])
+                               for hour in np.flatnonzero(hours)})
+
+    weekdays = np.bincount((days + EPOCH_WEEKDAY) % 7, minlength=7)
+    weekday_activity = Counter({WEEKDAYS[day]: int(weekdays[day])
+                                for day in np.flatnonzero(weekdays)})
+
+    date_activity = defaultdict(int)
+    unique_days, day_counts = np.unique(days, return_counts=True)
+    for day, count in zip(unique_days.tolist(), day_counts.tolist()):
+        date_activity[date.fromordinal(day + EPOCH_ORDINAL).isoformat()] = count
+
+    return hourly_activity, weekday_activity, date_activity
+
+
+def sender_length_stats(senders, sender_ids, word_counts):
+    """Return length_stats() of the messages given by their sender ids and
+    word counts, in sender id order"""
+    pairs, counts = np.unique(sender_ids.astype(np.int64) << 32 | word_counts,
+                              return_counts=True)
+    histograms = {}
+    for pair, count in zip(pairs.tolist(), counts.tolist()):
+        histograms.setdefault(senders[pair >> 32], {})[pair & 0xFFFFFFFF] = count
+    return length_stats(histograms)
+
+
+class MessageStore:
+    """Columnar store with one row per parsed message.
+
+    Senders are interned to int32 ids and every other attribute is kept in
+    its own NumPy array, so a message costs about 21 bytes instead of the
+    dict entries and boxed ints used by the Counter based analysis. The
+    arrays grow in blocks of BLOCK_SIZE rows.
+    """
+
+    BLOCK_SIZE = 65536
+
+    COLUMNS = {
+        'sender_ids': np.int32,
+        'timestamps': np.int64,
+        'word_counts': np.int32,
+        'char_counts': np.int32,
+        'media': np.bool_,
+    }
+
+    def __init__(self):
+        self.senders = []
+        self._sender_index = {}
+        self.size = 0
+        self._capacity = 0
+        self._columns = {name: np.empty(0, dtype)
+                         for name, dtype in self.COLUMNS.items()}
+
+    @classmethod
+    def from_columns(cls, senders, columns):
+        """Wrap existing column arrays, e.g. memory-mapped ones, without
+        copying them. Appending copies them into new arrays."""
+        store = cls()
+        for sender in senders:
+            store.sender_id(sender)
+        store._columns = dict(columns)
+        store.size = store._capacity = len(columns['timestamps'])
+        return store
+
+    def __len__(self):
+        return self.size
+
+    def sender_id(self, sender):
+        """Return the interned id for a sender name, adding it if needed"""
+        sender_id = self._sender_index.get(sender)
+        if sender_id is None:
+            sender_id = len(self.senders)
+            self._sender_index[sender] = sender_id
+            self.senders.append(sender)
+        return sender_id
+
+    def _grow(self):
+        self._capacity += max(self.BLOCK_SIZE, self._capacity // 2
+                              // self.BLOCK_SIZE * self.BLOCK_SIZE)
+        for name, column in self._columns.items():
+            grown = np.empty(self._capacity, column.dtype)
+            grown[:self.size] = column[:self.size]
+            self._columns[name] = grown
+
+    def append(self, sender, timestamp, word_count, char_count, media):
+        """Add one message to the store"""
+        if self.size == self._capacity:
+            self._grow()
+        row = self.size
+        columns = self._columns
+        columns['sender_ids'][row] = self.sender_id(sender)
+        columns['timestamps'][row] = timestamp
+        columns['word_counts'][row] = word_count
+        columns['char_counts'][row] = char_count
+        columns['media'][row] = media
+        self.size = row + 1
+
+    def append_columns(self, senders, timestamps, word_counts, char_counts, media):
+        """Add many messages at once, given as one sequence per column"""
+        count = len(senders)
+        if not count:
+            return
+        sender_id = self.sender_id
+        ids = [sender_id(sender) for sender in senders]
+        while self.size + count > self._capacity:
+            self._grow()
+        rows = slice(self.size, self.size + count)
+        for name, values in (('sender_ids', ids), ('timestamps', timestamps),
+                             ('word_counts', word_counts), ('char_counts', char_counts),
+                             ('media', media)):
+            self._columns[name][rows] = values
+        self.size += count
+
+    def extend(self, other):
+        """Append all messages of another store after the ones in this one"""
+        if not other.size:
+            return
+        # Map the other store's sender ids onto this store's ids
+        remap = np.array([self.sender_id(sender) for sender in other.senders],
+                         dtype=np.int32)
+        while self.size + other.size > self._capacity:
+            self._grow()
+        rows = slice(self.size, self.size + other.size)
+        for name in self.COLUMNS:
+            values = other.column(name)
+            if name == 'sender_ids':
+                values = remap[values]
+            self._columns[name][rows] = values
+        self.size += other.size
+
+    def __getstate__(self):
+        # Only pickle the filled rows, e.g. when sent between processes
+        state = self.__dict__.copy()
+        state['_columns'] = {name: self.column(name) for name in self.COLUMNS}
+        state['_capacity'] = self.size
+        return state
+
+    def column(self, name):
+        """Return a view of the filled part of a column"""
+        return self._columns[name][:self.size]
+
+    @property
+    def sender_ids(self):
+        return self.column('sender_ids')
+
+    @property
+    def timestamps(self):
+        return self.column('timestamps')
+
+    @property
+    def word_counts(self):
+        return self.column('word_counts')
+
+    @property
+    def char_counts(self):
+        return self.column('char_counts')
+
+    @property
+    def media(self):
+        return self.column('media')
+
+    def _sender_counter(self, sender_ids):
+        counts = np.bincount(sender_ids, minlength=len(self.senders))
+        return Counter({self.senders[i]: int(counts[i])
+                        for i in np.flatnonzero(counts)})
+
+    def aggregate(self, mask=None, metrics=None):
+        """Derive the deep analyzer's per-sender and activity statistics.
+
+        ``mask`` is an optional boolean array selecting the messages to
+        include, which makes re-aggregating a subset (e.g. a date range)
+        cheap once the chat has been parsed. ``metrics`` limits the
+        results to those metric names (see metrics.STORE_METRICS); by
+        default all are derived.
+        """
+        sender_ids = self.sender_ids
+        timestamps = self.timestamps
+        word_counts = self.word_counts
+        char_counts = self.char_counts
+        media = self.media
+        if mask is not None:
+            sender_ids = sender_ids[mask]
+            timestamps = timestamps[mask]
+            word_counts = word_counts[mask]
+            char_counts = char_counts[mask]
+            media = media[mask]
+
+        def selected(name):
+            return metrics is None or name in metrics
+
+        data = {}
+        if selected('senders'):
+            data['message_count'] = self._sender_counter(sender_ids)
+        if selected('media'):
+            data['media_count'] = self._sender_counter(sender_ids[media])
+        if selected('hourly') or selected('weekday') or selected('date'):
+            activity = zip(('hourly', 'weekday', 'date'), activity_counts(timestamps))
+            data.update((f'{name}_activity', counts) for name, counts in activity
+                        if selected(name))
+
+        if selected('lengths'):
+            # Average length only covers non-media messages with text
+            with_text = ~media & (char_counts > 0)
+            text_senders = sender_ids[with_text]
+            totals = np.bincount(text_senders, weights=word_counts[with_text],
+                                 minlength=len(self.senders))
+            counts = np.bincount(text_senders, minlength=len(self.senders))
+            data['avg_message_length'] = {self.senders[i]: float(totals[i] / counts[i])
+                                          for i in np.flatnonzero(counts)}
+            data['length_stats'] = sender_length_stats(self.senders, text_senders,
+                                                       word_counts[with_text])
+        if selected('replies'):
+            data['replies'] = reply_stats(message_times(self.senders, sender_ids, timestamps))
+        return data
@@ -0,0 +1,465 @@
+from array import array
+from collections import Counter, defaultdict
+from functools import cached_property
+from itertools import chain, compress
+from chat_formats import EPOCH_ORDINAL, MINUTES_PER_DAY
+from heavy_hitters import make_counter
+from length_stats import length_stats
+
+# Number of parsed messages handed to the collectors at a time
+BATCH_SIZE = 16384
+
+
+class MessageBatch:
+    """Columns of consecutive parsed messages.
+
+    Built from rows of (sender, (ordinal, weekday, ISO date), minute of
+    the day, text). Derived columns (stripped senders, media flags, split
+    words, ...) are computed the first time a collector asks for them and
+    shared by all collectors, so work no selected metric needs is skipped.
+    """
+
+    def __init__(self, rows):
+        self.size = len(rows)
+        self._raw_senders, self.days, self.minutes, self.texts = zip(*rows)
+
+    @cached_property
+    def senders(self):
+        return list(map(str.strip, self._raw_senders))
+
+    @cached_property
+    def media(self):
+        return ["<Media omitted>" in text or "image omitted" in text or "video omitted" in text
+                for text in self.texts]
+
+    @cached_property
+    def words(self):
+        """Words of each non-media message with text, None for the others"""
+        split = str.split
+        return [split(text) if text and not is_media else None
+                for text, is_media in zip(self.texts, self.media)]
+
+    @cached_property
+    def word_counts(self):
+        """Number of words of each message, 0 for media and empty messages"""
+        return [len(words) if words is not None else 0 for words in self.words]
+
+    @cached_property
+    def text_messages(self):
+        """Text of the messages that have words"""
+        return [text for text, words in zip(self.texts, self.words) if words is not None]
+
+    @cached_property
+    def emoji(self):
+        """Emoji sequences of each message with words, None for the others"""
+        from emoji_matcher import get_emoji_matcher
+
+        findall = get_emoji_matcher().findall
+        return [findall(text) if words is not None else None
+                for text, words in zip(self.texts, self.words)]
+
+    @cached_property
+    def timestamps(self):
+        """Minutes since 1970 of each message"""
+        return [(ordinal - EPOCH_ORDINAL) * MINUTES_PER_DAY + minute
+                for (ordinal, _, _), minute in zip(self.days, self.minutes)]
+
+    @cached_property
+    def day_counts(self):
+        return Counter(self.days)
+
+    @cached_property
+    def minute_counts(self):
+        return Counter(self.minutes)
+
+
+# Derived MessageBatch columns in the order they can be computed, with the
+# columns each one is computed from
+BATCH_COLUMNS = {
+    'senders': (),
+    'media': (),
+    'words': ('media',),
+    'word_counts': ('words',),
+    'text_messages': ('words',),
+    'emoji': ('words',),
+    'timestamps': (),
+    'day_counts': (),
+    'minute_counts': (),
+}
+
+
+def batch_columns(collectors):
+    """Return the derived MessageBatch columns the collectors read, and the
+    columns those are computed from, in BATCH_COLUMNS order"""
+    needed = set()
+    for collector in collectors:
+        needed.update(collector.columns)
+    # Columns only depend on earlier ones, so one backwards pass suffices
+    for name in reversed(BATCH_COLUMNS):
+        if name in needed:
+            needed.update(BATCH_COLUMNS[name])
+    return [name for name in BATCH_COLUMNS if name in needed]
+
+
+class MetricCollector:
+    """Base class of the collectors run by the parse engine.
+
+    add() receives every MessageBatch of one part of a chat, merge() folds
+    in the collector of the following part and finalize() writes the
+    metric into the results dict. Collectors are pickled when partial
+    results are sent between processes or saved in checkpoints and caches.
+    """
+
+    # Name used to select the metric, e.g. with --metrics
+    name = None
+
+    # Derived MessageBatch columns add() reads (see BATCH_COLUMNS)
+    columns = ()
+
+    # Whether the metric is computed when none are selected explicitly
+    default = True
+
+    def __init__(self, vocabulary_size=None):
+        pass
+
+    def add(self, batch):
+        raise NotImplementedError
+
+    def merge(self, other):
+        raise NotImplementedError
+
+    def finalize(self, data):
+        raise NotImplementedError
+
+
+# Metric name -> collector class, in the order the metrics are reported
+METRIC_COLLECTORS = {}
+
+
+def register_metric(collector_class):
+    """Class decorator that makes a collector selectable by its name"""
+    METRIC_COLLECTORS[collector_class.name] = collector_class
+    return collector_class
+
+
+class _CounterCollector(MetricCollector):
+    """Collector keeping a single Counter under ``key``"""
+
+    key = None
+
+    def __init__(self, vocabulary_size=None):
+        self.counts = Counter()
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+
+    def finalize(self, data):
+        data[self.key] = self.counts
+
+
+@register_metric
+class SenderCounts(_CounterCollector):
+    """Messages per sender"""
+    name = 'senders'
+    columns = ('senders',)
+    key = 'message_count'
+
+    def add(self, batch):
+        self.counts.update(batch.senders)
+
+
+@register_metric
+class MediaCounts(_CounterCollector):
+    """Media messages per sender"""
+    name = 'media'
+    columns = ('senders', 'media')
+    key = 'media_count'
+
+    def add(self, batch):
+        self.counts.update(compress(batch.senders, batch.media))
+
+
+@register_metric
+class HourlyActivity(_CounterCollector):
+    """Messages per hour of the day"""
+    name = 'hourly'
+    columns = ('minute_counts',)
+    key = 'hourly_activity'
+
+    def add(self, batch):
+        counts = self.counts
+        for minute, count in batch.minute_counts.items():
+            counts[minute // 60] += count
+
+
+@register_metric
+class WeekdayActivity(_CounterCollector):
+    """Messages per day of the week"""
+    name = 'weekday'
+    columns = ('day_counts',)
+    key = 'weekday_activity'
+
+    def add(self, batch):
+        counts = self.counts
+        for (_, weekday, _), count in batch.day_counts.items():
+            counts[weekday] += count
+
+
+@register_metric
+class DateActivity(MetricCollector):
+    """Messages per calendar date"""
+    name = 'date'
+    columns = ('day_counts',)
+
+    def __init__(self, vocabulary_size=None):
+        self.counts = defaultdict(int)
+
+    def add(self, batch):
+        counts = self.counts
+        for (_, _, date_only), count in batch.day_counts.items():
+            counts[date_only] += count
+
+    def merge(self, other):
+        for date_only, count in other.counts.items():
+            self.counts[date_only] += count
+
+    def finalize(self, data):
+        data['date_activity'] = self.counts
+
+
+@register_metric
+class MessageLengths(MetricCollector):
+    """Words per non-media message, by sender: mean, spread and quantiles
+    (see length_stats)"""
+    name = 'lengths'
+    columns = ('senders', 'words', 'word_counts')
+
+    def __init__(self, vocabulary_size=None):
+        # Number of messages of each length, by sender
+        self.histograms = defaultdict(Counter)
+
+    def add(self, batch):
+        histograms = self.histograms
+        lengths = Counter(compress(zip(batch.senders, batch.word_counts),
+                                   [words is not None for words in batch.words]))
+        for (sender, length), count in lengths.items():
+            histograms[sender][length] += count
+
+    def merge(self, other):
+        for sender, histogram in other.histograms.items():
+            self.histograms[sender].update(histogram)
+
+    def finalize(self, data):
+        stats = length_stats(self.histograms)
+        data['avg_message_length'] = {sender: sender_stats['mean']
+                                      for sender, sender_stats in stats.items()}
+        data['length_stats'] = stats
+
+
+@register_metric
+class WordCounts(MetricCollector):
+    """Occurrences of every word, exact or approximate (see heavy_hitters)"""
+    name = 'words'
+    columns = ('words',)
+
+    def __init__(self, vocabulary_size=None):
+        self.counts = make_counter(vocabulary_size)
+
+    def add(self, batch):
+        self.counts.update(chain.from_iterable(words for words in batch.words if words))
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+
+    def finalize(self, data):
+        data['word_count'] = self.counts
+
+
+@register_metric
+class EmojiCounts(WordCounts):
+    """Occurrences of every emoji sequence"""
+    name = 'emoji'
+    columns = ('emoji',)
+
+    def add(self, batch):
+        update = self.counts.update
+        # One update() per message, so bounded counters trim as before
+        for found in batch.emoji:
+            if found:
+                update(found)
+
+    def finalize(self, data):
+        data['emoji_count'] = self.counts
+
+
+@register_metric
+class ReplyTimes(MetricCollector):
+    """Who replies to whom and how fast, and conversation sessions (see replies)"""
+    name = 'replies'
+    columns = ('senders', 'timestamps')
+    # Keeps two values per message, so memory grows with the chat
+    default = False
+
+    def __init__(self, vocabulary_size=None):
+        self._index = {}
+        self.sender_ids = array('i')
+        self.timestamps = array('q')
+
+    def add(self, batch):
+        index = self._index
+        intern = index.setdefault
+        self.sender_ids.extend([intern(sender, len(index)) for sender in batch.senders])
+        self.timestamps.extend(batch.timestamps)
+
+    def merge(self, other):
+        import numpy as np
+
+        # Map the other part's sender ids onto this part's ids
+        index = self._index
+        intern = index.setdefault
+        remap = np.array([intern(sender, len(index)) for sender in other._index], dtype=np.intc)
+        if other.sender_ids:
+            self.sender_ids.frombytes(remap[np.frombuffer(other.sender_ids, np.intc)].tobytes())
+        self.timestamps.extend(other.timestamps)
+
+    def finalize(self, data):
+        from replies import message_times, reply_stats
+
+        times = message_times(self._index, self.sender_ids, self.timestamps)
+        data['message_times'] = times
+        data['replies'] = reply_stats(times)
+
+
+class MessageText(MetricCollector):
+    """Raw text of the messages with words, joined into 'all_text'"""
+    name = 'text'
+    columns = ('text_messages',)
+
+    def __init__(self, vocabulary_size=None):
+        self.texts = []
+
+    def add(self, batch):
+        self.texts.extend(batch.text_messages)
+
+    def merge(self, other):
+        self.texts.extend(other.texts)
+
+    def finalize(self, data):
+        data['all_text'] = ' '.join(self.texts)
+
+
+class MessageRows(MetricCollector):
+    """One MessageStore row per message, for the columnar analysis.
+
+    The store replaces the collectors in STORE_METRICS, which it derives
+    with MessageStore.aggregate(): those named in ``metrics``, or all.
+    """
+    name = 'store'
+    columns = ('senders', 'timestamps', 'word_counts', 'media')
+
+    def __init__(self, vocabulary_size=None, metrics=None):
+        from message_store import MessageStore
+
+        self.store = MessageStore()
+        self.metrics = metrics
+
+    def add(self, batch):
+        self.store.append_columns(batch.senders, batch.timestamps, batch.word_counts,
+                                  list(map(len, batch.texts)), batch.media)
+
+    def merge(self, other):
+        self.store.extend(other.store)
+
+    def finalize(self, data):
+        data.update(self.store.aggregate(metrics=self.metrics))
+        data['store'] = self.store
+
+
+class MessageIndex(MessageRows):
+    """Rows, words and emoji of every message, for range queries.
+
+    Finalized into a chat_index.ChatIndex under 'index'. Words and emoji
+    are only kept when their metric is selected.
+    """
+    name = 'index'
+
+    def __init__(self, words=True, emoji=True):
+        from chat_index import TokenColumn
+
+        super().__init__()
+        self.words = TokenColumn() if words else None
+        self.emoji = TokenColumn() if emoji else None
+        self.columns = MessageRows.columns + ('words',) * words + ('emoji',) * emoji
+
+    def add(self, batch):
+        super().add(batch)
+        if self.words is not None:
+            self.words.append(batch.words)
+        if self.emoji is not None:
+            self.emoji.append(batch.emoji)
+
+    def merge(self, other):
+        super().merge(other)
+        if self.words is not None:
+            self.words.extend(other.words)
+        if self.emoji is not None:
+            self.emoji.extend(other.emoji)
+
+    def finalize(self, data):
+        from chat_index import ChatIndex
+
+        data['index'] = ChatIndex(self.store, self.words, self.emoji)
+
+
+# Metrics the columnar store derives by itself
+STORE_METRICS = ('senders', 'media', 'hourly', 'weekday', 'date', 'lengths', 'replies')
+
+
+def metric_names():
+    """Return the names of all selectable metrics"""
+    return list(METRIC_COLLECTORS)
+
+
+def default_metrics():
+    """Return the names of the metrics computed when none are selected"""
+    return [name for name, collector in METRIC_COLLECTORS.items() if collector.default]
+
+
+def resolve_metrics(metrics=None):
+    """Return the metric names to collect, in registry order.
+
+    ``None`` selects the default metrics: all but those that keep data
+    per message, like replies. Sender counts are always collected, since
+    every report and the empty-chat check rely on them.
+    """
+    if metrics is None:
+        return default_metrics()
+    unknown = set(metrics) - set(METRIC_COLLECTORS)
+    if unknown:
+        raise ValueError(f"unknown metrics: {', '.join(sorted(unknown))}")
+    selected = set(metrics) | {'senders'}
+    return [name for name in METRIC_COLLECTORS if name in selected]
+
+
+def select_metric(metrics, name):
+    """Return the metrics ``metrics`` resolves to, with ``name`` added"""
+    return resolve_metrics(resolve_metrics(metrics) + [name])
+
+
+def make_collectors(metrics=None, columnar=False, keep_text=False, vocabulary_size=None,
+                    index=False):
+    """Create the collectors for one part of a chat, keyed by name"""
+    selected = resolve_metrics(metrics)
+    names = selected
+    collectors = {}
+    if columnar:
+        collectors['store'] = MessageRows(metrics=[name for name in names
+                                                   if name in STORE_METRICS])
+        names = [name for name in names if name not in STORE_METRICS]
+    for name in names:
+        collectors[name] = METRIC_COLLECTORS[name](vocabulary_size)
+    if keep_text:
+        collectors['text'] = MessageText()
+    if index:
+        collectors['index'] = MessageIndex('words' in selected, 'emoji' in selected)
+    return collectors
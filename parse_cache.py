@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import pickle
+from deep_whatsapp_analyzer import CHUNK_SIZE, PARSER_VERSION
+
+# Default upper bound for the total size of cached results
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+# Maps (path, size, mtime) to content hashes so unchanged files are not
+# re-hashed on every run
+INDEX_NAME = 'index.json'
+
+ENTRY_SUFFIX = '.pickle'
+
+
+def default_cache_dir():
+    """Return the per-user cache directory for parsed chats"""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'whatsapp-analyzer')
+
+
+def file_digest(file_path, chunk_size=CHUNK_SIZE):
+    """Return the SHA-256 hex digest of a file's contents"""
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class ParseCache:
+    """Content-addressed cache of analysis results on disk.
+
+    Entries are keyed by the SHA-256 of the export, its size, the parser
+    version and the parse options, and stored as pickles. When the total
+    size exceeds ``max_bytes`` the least recently used entries are removed.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, INDEX_NAME)
+
+    def _load_index(self):
+        try:
+            with open(self._index_path(), 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        # Unique per process, since batch runs share one cache directory
+        temp_path = f'{self._index_path()}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(index, file)
+        os.replace(temp_path, self._index_path())
+
+    def content_digest(self, file_path):
+        """Return the content hash of a file, reusing it while the file's
+        size and modification time are unchanged"""
+        stat = os.stat(file_path)
+        path = os.path.realpath(file_path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        index = self._load_index()
+        entry = index.get(path)
+        if entry and entry['signature'] == signature:
+            return entry['digest']
+        digest = file_digest(file_path)
+        # Forget files that were deleted, so the index does not grow forever
+        index = {other: entry for other, entry in index.items() if os.path.exists(other)}
+        index[path] = {'signature': signature, 'digest': digest}
+        self._save_index(index)
+        return digest
+
+    def key(self, file_path, **options):
+        """Return the cache key for a file parsed with the given options"""
+        parts = [self.content_digest(file_path), str(os.path.getsize(file_path)),
+                 str(PARSER_VERSION)]
+        parts.extend(f'{name}={options[name]!r}' for name in sorted(options))
+        return hashlib.sha256(':'.join(parts).encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        """Return the cached results for a key, or None on a miss"""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as file:
+                data = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+        # Mark the entry as recently used, unless another process evicted it
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, data):
+        """Store results for a key and evict old entries if needed"""
+        path = self._entry_path(key)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as file:
+            pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_bytes"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(ENTRY_SUFFIX):
+                # Another process sharing the directory may have evicted it
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def analyze_cached(file_path, analyze, cache, **options):
+    """Return cached results for a file, running ``analyze()`` on a miss.
+
+    ``options`` are the parse options that change the results and become
+    part of the cache key.
+    """
+    key = cache.key(file_path, **options)
+    data = cache.get(key)
+    if data is None:
+        data = analyze()
+        cache.put(key, data)
+    return data
@@ -0,0 +1,143 @@
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+
+class Profiler:
+    """Record wall time, CPU time, message counts and peak memory per stage.
+
+    Wrap each stage of a run in ``with profiler.stage(name) as record:``
+    and set ``record['messages']`` where it applies. Inside the parse loop,
+    timed() and timed_iter() wrap the callables of each step (matching,
+    timestamp decoding, shared batch columns, each metric collector) to
+    accumulate their wall time and number of calls; this adds per-call
+    overhead, so the steps are only wrapped while profiling.
+
+    ``stats_path`` dumps cProfile stats for stages opened with
+    ``cprofile=True``; the file can be read with pstats or snakeviz.
+    """
+
+    def __init__(self, trace_memory=True, stats_path=None):
+        self.trace_memory = trace_memory
+        self.stats_path = stats_path
+        self.stages = []
+        self.steps = {}
+
+    @contextmanager
+    def stage(self, name, messages=None, cprofile=False):
+        record = {'name': name, 'messages': messages}
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            # reset_peak() is new in Python 3.9; clearing the traces also
+            # resets the peak on older versions
+            getattr(tracemalloc, 'reset_peak', tracemalloc.clear_traces)()
+            memory_start = tracemalloc.get_traced_memory()[0]
+
+        profile = None
+        if cprofile and self.stats_path:
+            import cProfile
+            profile = cProfile.Profile()
+            profile.enable()
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall'] = time.perf_counter() - wall_start
+            record['cpu'] = time.process_time() - cpu_start
+            if profile is not None:
+                profile.disable()
+                profile.dump_stats(self.stats_path)
+            record['peak_bytes'] = None
+            if self.trace_memory:
+                record['peak_bytes'] = max(tracemalloc.get_traced_memory()[1] - memory_start, 0)
+            self.stages.append(record)
+
+    def _step(self, name):
+        return self.steps.setdefault(name, {'wall': 0.0, 'calls': 0})
+
+    def timed(self, name, function):
+        """Return a wrapper of function that adds its run time to a step"""
+        step = self._step(name)
+        clock = time.perf_counter
+
+        def wrapper(*args):
+            start = clock()
+            try:
+                return function(*args)
+            finally:
+                step['wall'] += clock() - start
+                step['calls'] += 1
+
+        return wrapper
+
+    def timed_iter(self, name, iterable):
+        """Wrap an iterable, adding the time spent producing items to a step"""
+        return self._timed_iter(self._step(name), iter(iterable))
+
+    @staticmethod
+    def _timed_iter(step, iterator):
+        clock = time.perf_counter
+        while True:
+            start = clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                step['wall'] += clock() - start
+                return
+            step['wall'] += clock() - start
+            step['calls'] += 1
+            yield item
+
+    def close(self):
+        """Stop memory tracing started by this profiler"""
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def summary(self):
+        """Return the stage and step timings as a table"""
+        lines = [f"{'Stage':30s} {'Wall s':>8s} {'CPU s':>8s} {'Messages':>10s} "
+                 f"{'Msg/s':>10s} {'Peak MB':>8s}"]
+        for record in self.stages:
+            messages = record['messages']
+            peak = record['peak_bytes']
+            rate = messages / record['wall'] if messages and record['wall'] else None
+            lines.append(
+                f"{record['name']:30s} {record['wall']:8.3f} {record['cpu']:8.3f} "
+                f"{'' if messages is None else messages:>10} "
+                f"{'' if rate is None else f'{rate:.0f}':>10s} "
+                f"{'' if peak is None else f'{peak / (1024 * 1024):.1f}':>8s}")
+        if self.steps:
+            lines.append("")
+            lines.append(f"{'Parse step':30s} {'Wall s':>8s} {'Calls':>10s}")
+            for name, step in self.steps.items():
+                lines.append(f"{name:30s} {step['wall']:8.3f} {step['calls']:>10}")
+        lines.append(f"\nTotal wall time: {sum(r['wall'] for r in self.stages):.3f}s")
+        return '\n'.join(lines)
+
+    def to_dict(self):
+        return {'stages': self.stages, 'steps': self.steps}
+
+    def write_json(self, path):
+        """Write the stage and step timings to a JSON file"""
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+
+class NullProfiler:
+    """Profiler stand-in that records nothing and wraps nothing"""
+
+    def stage(self, name, messages=None, cprofile=False):
+        return nullcontext({})
+
+    def timed(self, name, function):
+        return function
+
+    def timed_iter(self, name, iterable):
+        return iterable
+
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+
+# Name of the file in the output directory recording what each chart was drawn from
+MANIFEST_NAME = '.render_cache.json'
+
+# Bump whenever a change to the chart functions changes the images they draw
+RENDER_VERSION = 3
+
+
+def data_digest(chart_name, file_name, values):
+    """Return the SHA-256 hex digest of a chart's inputs.
+
+    Items are hashed in their insertion order, since charts break ties in
+    that order.
+    """
+    hasher = hashlib.sha256(f'{RENDER_VERSION}\0{chart_name}\0{file_name}'.encode('utf-8'))
+    for value in values:
+        items = None if value is None else list(value.items())
+        hasher.update(f'\0{items!r}'.encode('utf-8'))
+    return hasher.hexdigest()
+
+
+class RenderCache:
+    """Skips redrawing charts whose input data has not changed.
+
+    The manifest in the output directory maps each chart's image file to
+    the digest of the results it was drawn from. A chart is reused when
+    its image still exists and the digest of its current input matches.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                self.manifest = json.load(file)
+        except (OSError, ValueError):
+            self.manifest = {}
+        self._pending = {}
+        self.reused = []
+
+    def stale_charts(self, charts, data, chart_inputs, chart_files):
+        """Return the charts that need drawing and remember the others in ``reused``.
+
+        ``chart_inputs(name, data)`` returns the results values a chart is
+        drawn from and ``chart_files`` maps chart names to the image file
+        they write.
+        """
+        stale = []
+        for chart in charts:
+            name = chart.__name__
+            file_name = chart_files[name]
+            digest = data_digest(name, file_name, chart_inputs(name, data))
+            if (self.manifest.get(file_name) == digest
+                    and os.path.exists(os.path.join(self.output_dir, file_name))):
+                self.reused.append(name)
+            else:
+                self._pending[name] = (file_name, digest)
+                stale.append(chart)
+        return stale
+
+    def rendered(self, chart_name):
+        """Record that a chart returned by stale_charts() was drawn"""
+        file_name, digest = self._pending.pop(chart_name)
+        self.manifest[file_name] = digest
+
+    def save(self):
+        """Atomically write the manifest"""
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.manifest, file, indent=2)
+        os.replace(temp_path, self.path)
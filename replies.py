@@ -0,0 +1,114 @@
+from collections import Counter, namedtuple
+import numpy as np
+from length_stats import QUANTILES
+
+# Minutes of silence after which the next message starts a new conversation
+DEFAULT_SESSION_GAP = 60
+
+MessageTimes = namedtuple('MessageTimes', 'senders sender_ids timestamps')
+MessageTimes.__doc__ = """Sender ids and timestamps of a chat's messages in time order"""
+
+
+def message_times(senders, sender_ids, timestamps):
+    """Return a MessageTimes, sorting the messages by time if needed"""
+    sender_ids = np.asarray(sender_ids, dtype=np.int32)
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if np.any(timestamps[1:] < timestamps[:-1]):
+        order = np.argsort(timestamps, kind='stable')
+        sender_ids = sender_ids[order]
+        timestamps = timestamps[order]
+    return MessageTimes(list(senders), sender_ids, timestamps)
+
+
+def data_message_times(data):
+    """Return the MessageTimes behind analysis results, or None.
+
+    They are kept under 'message_times', or derived from the 'store' of
+    columnar results.
+    """
+    if 'message_times' in data:
+        return data['message_times']
+    if 'store' in data:
+        store = data['store']
+        return message_times(store.senders, store.sender_ids, store.timestamps)
+    return None
+
+
+def _group_stats(keys, values, size):
+    """Return the groups present in ``keys`` (ints below ``size``) and the
+    count, mean and QUANTILES of ``values`` in each, as lists"""
+    counts = np.bincount(keys, minlength=size)
+    present = np.flatnonzero(counts)
+    counts = counts[present]
+    sums = np.bincount(keys, weights=values, minlength=size)[present]
+    # Sort by group, then value, so each group is one sorted segment
+    ordered = values[np.lexsort((values, keys))]
+    starts = np.cumsum(counts) - counts
+    stats = {'count': counts.tolist(), 'mean': (sums / np.maximum(counts, 1)).tolist()}
+    for name, percent in QUANTILES.items():
+        ranks = np.maximum(1, -(-percent * counts // 100))
+        stats[name] = ordered[starts + ranks - 1].tolist()
+    return present.tolist(), stats
+
+
+def _summaries(stats, count_name=None):
+    names = ['mean', *QUANTILES]
+    columns = [stats[name] for name in names]
+    if count_name is not None:
+        names.insert(0, count_name)
+        columns.insert(0, stats['count'])
+    return [dict(zip(names, values)) for values in zip(*columns)]
+
+
+def reply_stats(times, session_gap=DEFAULT_SESSION_GAP):
+    """Return reply latency and conversation statistics of a MessageTimes.
+
+    A message from another sender than the previous message is a reply
+    to that sender, unless more than ``session_gap`` minutes passed, which
+    starts a new conversation instead. Latencies are in minutes, with the
+    median and 90th percentile by nearest rank. Everything is computed
+    with array operations over the time-sorted messages, so the cost is
+    linear in the number of messages plus a sort per group.
+    """
+    senders, sender_ids, timestamps = times
+    gaps = np.diff(timestamps)
+    new_session = gaps > session_gap
+
+    # Replies: a change of sender within a conversation
+    reply = (sender_ids[1:] != sender_ids[:-1]) & ~new_session
+    repliers = sender_ids[1:][reply].astype(np.int64)
+    replied_to = sender_ids[:-1][reply].astype(np.int64)
+    latencies = gaps[reply]
+    size = len(senders)
+
+    # Number the pairs that occur, so memory does not grow with senders squared
+    pairs, pair_groups = np.unique(repliers * size + replied_to, return_inverse=True)
+    _, pair_stats = _group_stats(pair_groups.ravel(), latencies, len(pairs))
+    pair_latency = {(senders[pair // size], senders[pair % size]): summary for pair, summary in
+                    zip(pairs.tolist(), _summaries(pair_stats, 'replies'))}
+    present, sender_stats = _group_stats(repliers, latencies, size)
+    sender_latency = {senders[sender_id]: summary for sender_id, summary in
+                      zip(present, _summaries(sender_stats, 'replies'))}
+
+    # Conversations: runs of messages without a gap longer than session_gap
+    sessions = {'sessions': 0}
+    session_starters = Counter()
+    if len(timestamps):
+        starts = np.concatenate(([0], np.flatnonzero(new_session) + 1))
+        ends = np.append(starts[1:], len(timestamps))
+        single = np.zeros(len(starts), np.int64)
+        _, messages = _group_stats(single, ends - starts, 1)
+        _, minutes = _group_stats(single, timestamps[ends - 1] - timestamps[starts], 1)
+        sessions = {'sessions': len(starts), 'messages': _summaries(messages)[0],
+                    'minutes': _summaries(minutes)[0]}
+        starters = np.bincount(sender_ids[starts], minlength=size)
+        session_starters = Counter({senders[sender_id]: int(starters[sender_id])
+                                    for sender_id in np.flatnonzero(starters)})
+
+    return {
+        'session_gap': session_gap,
+        'conversations': sessions,
+        'session_starters': session_starters,
+        'sender_latency': sender_latency,
+        'pair_latency': pair_latency,
+    }
@@ -0,0 +1,559 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter, OrderedDict, deque
+from urllib.parse import parse_qs, unquote, urlsplit
+import chat_formats
+import deep_whatsapp_analyzer
+import heavy_hitters
+import metrics
+from length_stats import QUANTILES, quantile_rank
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Largest export accepted by POST /analyze
+DEFAULT_MAX_UPLOAD = 512 * 1024 * 1024
+
+# Analyses waiting for a worker before new ones are turned away with 503
+DEFAULT_MAX_QUEUE = 16
+
+# Uploads received at the same time; more get 503 before their body is read
+DEFAULT_MAX_UPLOADS = 4
+
+# Analysis results (and their charts) kept for repeated uploads
+DEFAULT_CACHE_ENTRIES = 64
+
+# Recent requests per route whose latencies are summarized by GET /metrics
+LATENCY_WINDOW = 1024
+
+# Words and emojis returned by default
+DEFAULT_TOP = 100
+
+# Longest request line plus headers read before giving up on a request
+MAX_HEADER_BYTES = 64 * 1024
+
+STATUS_REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    411: 'Length Required', 413: 'Payload Too Large', 422: 'Unprocessable Entity',
+    500: 'Internal Server Error', 503: 'Service Unavailable',
+}
+
+CONTENT_TYPES = {'.png': 'image/png', '.json': 'application/json'}
+
+# Routes reported separately by GET /metrics; requests to other paths count as 'other'
+ROUTES = ('analyze', 'results', 'metrics', 'health')
+
+
+class HTTPError(Exception):
+    """An error answered with an HTTP status and a JSON error message"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def counter_items(counter, top):
+    """Return the ``top`` most common items of a counter as [item, count] pairs"""
+    return [[item, count] for item, count in counter.most_common(top)]
+
+
+def results_to_json(data, top=DEFAULT_TOP):
+    """Return the JSON-serializable statistics of analysis results.
+
+    Counters keep their order; word and emoji counts are cut to their
+    ``top`` most common entries. Per-message columns ('store',
+    'message_times', 'index', 'all_text') are left out.
+    """
+    stats = {}
+    for key in ('message_count', 'media_count', 'weekday_activity', 'date_activity',
+                'avg_message_length', 'length_stats'):
+        if key in data:
+            stats[key] = dict(data[key])
+    if 'hourly_activity' in data:
+        stats['hourly_activity'] = {str(hour): count
+                                    for hour, count in sorted(data['hourly_activity'].items())}
+    for key in ('word_count', 'emoji_count'):
+        if key in data:
+            counter = data[key]
+            stats[key] = {
+                'total': heavy_hitters.counter_total(counter),
+                'distinct': len(counter),
+                'approximate': isinstance(counter, heavy_hitters.TopKCounter),
+                'top': counter_items(counter, top),
+            }
+    if 'replies' in data:
+        replies = data['replies']
+        stats['replies'] = {
+            'session_gap': replies['session_gap'],
+            'conversations': replies['conversations'],
+            'session_starters': counter_items(replies['session_starters'], None),
+            'sender_latency': replies['sender_latency'],
+            'pair_latency': [dict(replier=replier, replied_to=replied_to, **summary)
+                             for (replier, replied_to), summary
+                             in replies['pair_latency'].items()],
+        }
+    return stats
+
+
+def _init_worker():
+    # Load the plotting modules once per worker instead of once per request
+    try:
+        import matplotlib.pyplot as plt
+
+        plt.switch_backend('agg')
+    except ImportError:
+        pass
+
+
+def _warm_up():
+    # Run once per worker at start-up, so the first request does not wait
+    # for the worker process and matplotlib to load
+    return os.getpid()
+
+
+def analyze_upload(file_path, output_dir, options):
+    """Analyze an uploaded export in a worker process.
+
+    Returns (status, body): the JSON statistics with the image files of
+    the charts drawn into ``output_dir`` when ``options['charts']`` is set,
+    or an error message for exports without messages.
+    """
+    chat_format = options['dialect']
+    chat_format = None if chat_format == 'auto' else chat_formats.get_chat_format(chat_format)
+    vocabulary_size = options['vocabulary_size']
+    if vocabulary_size is None:
+        vocabulary_size = heavy_hitters.default_capacity(os.path.getsize(file_path))
+    data = deep_whatsapp_analyzer.analyze_whatsapp_chat(
+        file_path, chat_format=chat_format, vocabulary_size=vocabulary_size or None,
+        metrics=options['metrics'])
+    if not data['message_count']:
+        return 422, {'error': 'no messages found or incorrect file format'}
+    if options['session_gap'] is not None and 'replies' in data:
+        import replies
+
+        data['replies'] = replies.reply_stats(replies.data_message_times(data),
+                                              options['session_gap'])
+
+    body = {'stats': results_to_json(data, options['top'])}
+    if options['charts']:
+        os.makedirs(output_dir, exist_ok=True)
+        body['charts'] = {}
+        for name, _, error in deep_whatsapp_analyzer.render_charts(data, output_dir):
+            if error is None:
+                body['charts'][name] = deep_whatsapp_analyzer.CHART_FILES[name]
+    return 200, body
+
+
+def parse_options(query):
+    """Return the analysis options of a POST /analyze query string.
+
+    Raises HTTPError(400) for unknown or invalid values.
+    """
+    values = {name: items[-1] for name, items in parse_qs(query).items()}
+    unknown = set(values) - {'dialect', 'vocabulary_size', 'metrics', 'session_gap',
+                             'charts', 'top'}
+    if unknown:
+        raise HTTPError(400, f"unknown parameters: {', '.join(sorted(unknown))}")
+
+    def integer(name, default):
+        try:
+            value = int(values[name]) if name in values else default
+        except ValueError:
+            raise HTTPError(400, f"{name} must be an integer") from None
+        if value is not None and value < 0:
+            raise HTTPError(400, f"{name} must not be negative")
+        return value
+
+    dialect = values.get('dialect', 'auto')
+    if dialect not in ['auto'] + chat_formats.format_names():
+        raise HTTPError(400, f"unknown dialect: {dialect}")
+    selected = None
+    if 'metrics' in values:
+        selected = [name.strip() for name in values['metrics'].split(',') if name.strip()]
+        try:
+            metrics.resolve_metrics(selected)
+        except ValueError as exc:
+            raise HTTPError(400, str(exc)) from None
+    session_gap = integer('session_gap', None)
+    if session_gap is not None:
+        # The session gap is only used by reply times, so it selects them
+        selected = metrics.select_metric(selected, 'replies')
+    charts = values.get('charts', '0').lower()
+    if charts not in ('0', '1', 'false', 'true'):
+        raise HTTPError(400, "charts must be 0 or 1")
+    return {
+        'dialect': dialect,
+        'vocabulary_size': integer('vocabulary_size', None),
+        'metrics': selected,
+        'session_gap': session_gap,
+        'charts': charts in ('1', 'true'),
+        'top': integer('top', DEFAULT_TOP),
+    }
+
+
+def result_key(digest, options):
+    """Return the cache key of an export's content hash analyzed with ``options``"""
+    parts = [digest, str(deep_whatsapp_analyzer.PARSER_VERSION)]
+    parts.extend(f'{name}={options[name]!r}' for name in sorted(options))
+    return hashlib.sha256(':'.join(parts).encode('utf-8')).hexdigest()
+
+
+class ServerMetrics:
+    """Request counts, latencies and queue depth reported by GET /metrics"""
+
+    def __init__(self, workers, max_queue, max_uploads):
+        self.started = time.time()
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_uploads = max_uploads
+        # Request bodies being received
+        self.uploading = 0
+        # Route -> status -> requests
+        self.requests = {}
+        self.latencies = {}
+        # Analyses waiting for a worker, and running in one
+        self.queued = 0
+        self.running = 0
+        self.peak_queued = 0
+        self.rejected = 0
+        self.cache = Counter()
+
+    def record(self, route, status, seconds):
+        """Count a finished request and remember its latency"""
+        self.requests.setdefault(route, Counter())[str(status)] += 1
+        self.latencies.setdefault(route, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def latency_summary(self, seconds):
+        """Return the mean, QUANTILES and maximum of latencies, in milliseconds"""
+        ordered = sorted(seconds)
+        summary = {'requests': len(ordered), 'mean': 1000 * sum(ordered) / len(ordered)}
+        for name, percent in QUANTILES.items():
+            summary[name] = 1000 * ordered[quantile_rank(percent, len(ordered)) - 1]
+        summary['max'] = 1000 * ordered[-1]
+        return summary
+
+    def report(self, cache_entries):
+        return {
+            'uptime_seconds': time.time() - self.started,
+            'requests': {route: dict(statuses) for route, statuses in self.requests.items()},
+            'latency_ms': {route: self.latency_summary(seconds)
+                           for route, seconds in self.latencies.items()},
+            'queue': {
+                'uploading': self.uploading,
+                'max_uploading': self.max_uploads,
+                'queued': self.queued,
+                'running': self.running,
+                'workers': self.workers,
+                'max_queued': self.max_queue,
+                'peak_queued': self.peak_queued,
+                'rejected': self.rejected,
+            },
+            'cache': {'hits': self.cache['hits'], 'misses': self.cache['misses'],
+                      'entries': cache_entries},
+        }
+
+
+class AnalysisServer:
+    """Local HTTP service that analyzes uploaded chat exports.
+
+    ``POST /analyze`` streams the request body (the export) to a file in
+    ``work_dir`` while hashing it, then runs analyze_upload() in a pool of
+    ``workers`` processes, which keep the parser and matplotlib loaded
+    between requests. At most ``max_queue`` analyses wait for a worker
+    and at most ``max_uploads`` bodies are received at a time; further
+    uploads get 503 before their body is read (clients sending
+    ``Expect: 100-continue`` never send it). Results are cached by the content hash of the
+    export and the analysis options, so uploading the same export again
+    answers from memory, and identical uploads in flight share one
+    analysis. Charts are served from ``GET /results/<key>/<file>``,
+    request latencies and queue depth from ``GET /metrics``.
+    """
+
+    def __init__(self, work_dir, workers=1, max_queue=DEFAULT_MAX_QUEUE,
+                 max_upload=DEFAULT_MAX_UPLOAD, max_uploads=DEFAULT_MAX_UPLOADS,
+                 cache_entries=DEFAULT_CACHE_ENTRIES,
+                 chunk_size=deep_whatsapp_analyzer.CHUNK_SIZE):
+        self.work_dir = work_dir
+        self.upload_dir = os.path.join(work_dir, 'uploads')
+        self.results_dir = os.path.join(work_dir, 'results')
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_upload = max_upload
+        self.cache_entries = cache_entries
+        self.chunk_size = chunk_size
+        self.max_uploads = max_uploads
+        self.metrics = ServerMetrics(workers, max_queue, max_uploads)
+        # Result key -> (status, body), least recently used first
+        self.cache = OrderedDict()
+        self._in_flight = {}
+        self._slots = None
+        self._executor = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Start the worker pool and listen; returns the asyncio server"""
+        from concurrent.futures import ProcessPoolExecutor
+
+        for path in (self.upload_dir, self.results_dir):
+            os.makedirs(path, exist_ok=True)
+        self._slots = asyncio.Semaphore(self.workers)
+        # Spawned, not forked: forked workers would inherit the listening
+        # socket and open client connections and keep them open
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _warm_up)
+                               for _ in range(self.workers)))
+        return await asyncio.start_server(self.handle, host, port, limit=MAX_HEADER_BYTES)
+
+    def close(self):
+        """Shut down the worker pool"""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    async def handle(self, reader, writer):
+        """Answer one request per connection"""
+        start = time.perf_counter()
+        route = 'invalid'
+        try:
+            try:
+                method, target, headers = await self.read_head(reader)
+                url = urlsplit(target)
+                route = url.path.strip('/').split('/')[0]
+                route = route if route in ROUTES else 'other'
+                status, body = await self.dispatch(method, url, headers, reader, writer)
+            except HTTPError as exc:
+                status, body = exc.status, {'error': str(exc)}
+            except (ConnectionError, asyncio.IncompleteReadError):
+                raise
+            except Exception as exc:
+                status, body = 500, {'error': f'{type(exc).__name__}: {exc}'}
+            if isinstance(body, dict):
+                body = (json.dumps(body, ensure_ascii=False) + '\n').encode('utf-8'), '.json'
+            content, extension = body
+            head = [f'HTTP/1.1 {status} {STATUS_REASONS[status]}',
+                    f'Content-Type: {CONTENT_TYPES[extension]}',
+                    f'Content-Length: {len(content)}',
+                    'Connection: close']
+            if status == 503:
+                head.append('Retry-After: 1')
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('ascii') + content)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            status = 'disconnected'
+        finally:
+            writer.close()
+        self.metrics.record(route, status, time.perf_counter() - start)
+
+    async def read_head(self, reader):
+        """Return the method, target and lower-cased headers of a request"""
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            raise HTTPError(400, "request headers too long") from None
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ')
+        except ValueError:
+            raise HTTPError(400, "malformed request line") from None
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            if name:
+                headers[name.strip().lower()] = value.strip()
+        return method, target, headers
+
+    async def dispatch(self, method, url, headers, reader, writer):
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+        if parts == ['analyze']:
+            if method != 'POST':
+                raise HTTPError(405, "use POST with the chat export as the request body")
+            return await self.analyze(url.query, headers, reader, writer)
+        if method != 'GET':
+            raise HTTPError(405, "use GET")
+        if parts == ['metrics']:
+            return 200, self.metrics.report(len(self.cache))
+        if parts == ['health']:
+            return 200, {'status': 'ok'}
+        if len(parts) == 3 and parts[0] == 'results':
+            return self.chart_file(parts[1], parts[2])
+        raise HTTPError(404, "unknown path; use POST /analyze, GET /metrics or GET /health")
+
+    def chart_file(self, key, file_name):
+        """Return a chart image of a cached result"""
+        extension = os.path.splitext(file_name)[1]
+        if (key not in self.cache or file_name not in deep_whatsapp_analyzer.CHART_FILES.values()
+                or extension not in CONTENT_TYPES):
+            raise HTTPError(404, "no such chart")
+        self.cache.move_to_end(key)
+        try:
+            with open(os.path.join(self.results_dir, key, file_name), 'rb') as file:
+                return 200, (file.read(), extension)
+        except FileNotFoundError:
+            raise HTTPError(404, "no such chart") from None
+
+    async def receive_upload(self, headers, reader):
+        """Stream the request body to a file in upload_dir while hashing it.
+
+        Returns the file path and the SHA-256 hex digest of the body.
+        """
+        fd, path = tempfile.mkstemp(suffix='.txt', dir=self.upload_dir)
+        hasher = hashlib.sha256()
+        received = 0
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                async for chunk in self.body_chunks(headers, reader):
+                    received += len(chunk)
+                    if received > self.max_upload:
+                        raise HTTPError(413, f"exports are limited to {self.max_upload} bytes")
+                    hasher.update(chunk)
+                    file.write(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path, hasher.hexdigest()
+
+    def content_length(self, headers):
+        """Return the Content-Length of a request, or None for a chunked body.
+
+        Raises HTTPError if it is missing, malformed or above max_upload.
+        """
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            return None
+        if 'content-length' not in headers:
+            raise HTTPError(411, "send the export with a Content-Length or chunked encoding")
+        try:
+            length = int(headers['content-length'])
+        except ValueError:
+            raise HTTPError(400, "malformed Content-Length") from None
+        if length > self.max_upload:
+            raise HTTPError(413, f"exports are limited to {self.max_upload} bytes")
+        return length
+
+    async def body_chunks(self, headers, reader):
+        """Yield the request body in chunks of at most chunk_size bytes"""
+        remaining = self.content_length(headers)
+        if remaining is None:
+            try:
+                while True:
+                    size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                    if size == 0:
+                        # Skip trailers up to the final empty line
+                        while await reader.readuntil(b'\r\n') != b'\r\n':
+                            pass
+                        return
+                    while size:
+                        chunk = await reader.readexactly(min(size, self.chunk_size))
+                        size -= len(chunk)
+                        yield chunk
+                    await reader.readexactly(2)
+            except (ValueError, asyncio.LimitOverrunError, asyncio.IncompleteReadError):
+                raise HTTPError(400, "malformed chunked body") from None
+        while remaining:
+            chunk = await reader.read(min(remaining, self.chunk_size))
+            if not chunk:
+                raise HTTPError(400, "request body ended early")
+            remaining -= len(chunk)
+            yield chunk
+
+    def busy(self):
+        """Whether every worker is busy and max_queue analyses are waiting"""
+        return self.metrics.queued + self.metrics.running >= self.workers + self.max_queue
+
+    async def analyze(self, query, headers, reader, writer):
+        """Handle POST /analyze: return the statistics of the uploaded export"""
+        options = parse_options(query)
+        # Refuse before reading the body, so an overloaded server stores nothing
+        if self.busy() or self.metrics.uploading >= self.max_uploads:
+            self.metrics.rejected += 1
+            raise HTTPError(503, "too many analyses queued, retry later")
+        self.content_length(headers)
+        if headers.get('expect', '').lower() == '100-continue':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        self.metrics.uploading += 1
+        try:
+            path, digest = await self.receive_upload(headers, reader)
+        finally:
+            self.metrics.uploading -= 1
+        # run_analysis() removes the upload it analyzes once the worker is done
+        started = False
+        try:
+            key = result_key(digest, options)
+            if key in self.cache:
+                self.metrics.cache['hits'] += 1
+                self.cache.move_to_end(key)
+                return self.response(key)
+            if key not in self._in_flight:
+                self.metrics.cache['misses'] += 1
+                # Checked again, since analyses may have started during the upload
+                if self.busy():
+                    self.metrics.rejected += 1
+                    raise HTTPError(503, "too many analyses queued, retry later")
+                self._in_flight[key] = asyncio.ensure_future(self.run_analysis(key, path, options))
+                started = True
+            else:
+                self.metrics.cache['hits'] += 1
+        finally:
+            if not started:
+                os.remove(path)
+        # Shielded, so a client hanging up does not cancel an analysis others wait for
+        await asyncio.shield(self._in_flight[key])
+        return self.response(key)
+
+    async def run_analysis(self, key, path, options):
+        """Run analyze_upload() in the worker pool and cache its result"""
+        output_dir = os.path.join(self.results_dir, key)
+        self.metrics.queued += 1
+        self.metrics.peak_queued = max(self.metrics.peak_queued, self.metrics.queued)
+        try:
+            async with self._slots:
+                self.metrics.queued -= 1
+                self.metrics.running += 1
+                try:
+                    loop = asyncio.get_running_loop()
+                    result = await loop.run_in_executor(self._executor, analyze_upload,
+                                                        path, output_dir, options)
+                finally:
+                    self.metrics.running -= 1
+            self.cache[key] = result
+            self.evict()
+        finally:
+            del self._in_flight[key]
+            os.remove(path)
+
+    def response(self, key):
+        status, body = self.cache[key]
+        body = dict(body, key=key)
+        if 'charts' in body:
+            body['charts'] = {name: f'/results/{key}/{file_name}'
+                              for name, file_name in body['charts'].items()}
+        return status, body
+
+    def evict(self):
+        """Forget the least recently used results beyond cache_entries"""
+        while len(self.cache) > self.cache_entries:
+            key, _ = self.cache.popitem(last=False)
+            shutil.rmtree(os.path.join(self.results_dir, key), ignore_errors=True)
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, work_dir=None, **options):
+    """Run an AnalysisServer until cancelled.
+
+    ``work_dir`` holds uploads and charts; by default a temporary
+    directory that is removed on exit. ``options`` are passed on to
+    AnalysisServer.
+    """
+    with tempfile.TemporaryDirectory(prefix='whatsapp-analyzer-') as temp_dir:
+        server = AnalysisServer(work_dir or temp_dir, **options)
+        listener = await server.start(host, port)
+        try:
+            async with listener:
+                await listener.serve_forever()
+        finally:
+            server.close()
@@ -0,0 +1,199 @@
+import json
+import os
+import shutil
+from array import array
+from collections import Counter
+import numpy as np
+from chat_formats import detect_format
+from deep_whatsapp_analyzer import CHUNK_SIZE, PARSER_VERSION, iter_batches, iter_messages
+from heavy_hitters import TopKCounter
+from message_store import MessageStore
+from metrics import STORE_METRICS, EmojiCounts, MessageRows, WordCounts, resolve_metrics
+
+# Bump when the files of a snapshot change
+SNAPSHOT_VERSION = 1
+
+META_NAME = 'meta.json'
+COUNTS_NAME = 'counts.json'
+TEXT_NAME = 'text.bin'
+TEXT_OFFSETS_NAME = 'text_offsets.npy'
+
+
+def _counts_to_json(counts):
+    state = {'items': dict(counts), 'capacity': None}
+    if isinstance(counts, TopKCounter):
+        state.update(capacity=counts.capacity, error=counts.error, observed=counts.observed)
+    return state
+
+
+def _counts_from_json(state):
+    if state['capacity'] is None:
+        return Counter(state['items'])
+    counts = TopKCounter(state['capacity'])
+    dict.update(counts, state['items'])
+    counts.error = state['error']
+    counts.observed = state['observed']
+    return counts
+
+
+def _check_replaceable(snapshot_dir):
+    """Raise ValueError unless ``snapshot_dir`` is missing, empty or a snapshot"""
+    if not os.path.lexists(snapshot_dir):
+        return
+    if not os.path.isdir(snapshot_dir):
+        raise ValueError(f"{snapshot_dir} exists and is not a directory")
+    names = os.listdir(snapshot_dir)
+    if names and META_NAME not in names:
+        raise ValueError(f"{snapshot_dir} is not empty and is not a snapshot; "
+                         f"choose another directory")
+
+
+def write_snapshot(file_path, snapshot_dir, chat_format=None, chunk_size=CHUNK_SIZE,
+                   vocabulary_size=None):
+    """Parse a chat export into a snapshot directory and return its message count.
+
+    The snapshot holds one .npy file per MessageStore column, the sender
+    names, the word and emoji counts and the UTF-8 text of every message
+    in one blob indexed by ``text_offsets.npy``. It is written next to
+    ``snapshot_dir`` first and then moved into place. An existing
+    ``snapshot_dir`` is only replaced if it is empty or an older snapshot;
+    anything else raises ValueError.
+    """
+    _check_replaceable(snapshot_dir)
+    temp_dir = f'{snapshot_dir}.{os.getpid()}.tmp'
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    try:
+        try:
+            messages = _write_snapshot(file_path, temp_dir, 'utf-8', chat_format, chunk_size,
+                                       vocabulary_size)
+        except UnicodeDecodeError:
+            # If UTF-8 fails, start over with another encoding
+            messages = _write_snapshot(file_path, temp_dir, 'utf-16', chat_format, chunk_size,
+                                       vocabulary_size)
+        # Checked again, since the directory may have changed while parsing
+        _check_replaceable(snapshot_dir)
+        # The old snapshot is moved aside first and only deleted once the
+        # new one is in place
+        old_dir = f'{snapshot_dir}.{os.getpid()}.old'
+        if os.path.lexists(snapshot_dir):
+            os.replace(snapshot_dir, old_dir)
+        try:
+            os.replace(temp_dir, snapshot_dir)
+        except OSError:
+            if os.path.lexists(old_dir):
+                os.replace(old_dir, snapshot_dir)
+            raise
+        shutil.rmtree(old_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return messages
+
+
+def _write_snapshot(file_path, snapshot_dir, encoding, chat_format, chunk_size, vocabulary_size):
+    rows = MessageRows()
+    words = WordCounts(vocabulary_size)
+    emoji = EmojiCounts(vocabulary_size)
+    offsets = array('q', [0])
+    with open(file_path, 'r', encoding=encoding) as file, \
+            open(os.path.join(snapshot_dir, TEXT_NAME), 'wb') as text_file:
+        chat_format = chat_format or detect_format(file)
+        for batch in iter_batches(iter_messages(file, chunk_size, chat_format), chat_format):
+            rows.add(batch)
+            words.add(batch)
+            emoji.add(batch)
+            # The text goes straight to disk instead of being kept in memory
+            encoded = [text.encode('utf-8') for text in batch.texts]
+            text_file.write(b''.join(encoded))
+            position = offsets[-1]
+            for text in encoded:
+                position += len(text)
+                offsets.append(position)
+
+    store = rows.store
+    for name in MessageStore.COLUMNS:
+        np.save(os.path.join(snapshot_dir, f'{name}.npy'), store.column(name))
+    np.save(os.path.join(snapshot_dir, TEXT_OFFSETS_NAME), np.frombuffer(offsets, np.int64))
+    with open(os.path.join(snapshot_dir, COUNTS_NAME), 'w', encoding='utf-8') as counts_file:
+        json.dump({'word_count': _counts_to_json(words.counts),
+                   'emoji_count': _counts_to_json(emoji.counts)}, counts_file, ensure_ascii=False)
+    with open(os.path.join(snapshot_dir, META_NAME), 'w', encoding='utf-8') as meta_file:
+        json.dump({
+            'snapshot_version': SNAPSHOT_VERSION,
+            'parser_version': PARSER_VERSION,
+            'source': os.path.abspath(file_path),
+            'chat_format': chat_format.name,
+            'messages': len(store),
+            'senders': store.senders,
+        }, meta_file, ensure_ascii=False, indent=2)
+    return len(store)
+
+
+class Snapshot:
+    """Read-only view of a snapshot written by write_snapshot().
+
+    The columns and the text blob are memory-mapped, so opening a snapshot
+    costs the same whatever its size and only the pages that are used get
+    read from disk. ``store`` is a MessageStore over the mapped columns.
+    """
+
+    def __init__(self, snapshot_dir):
+        self.path = snapshot_dir
+        with open(os.path.join(snapshot_dir, META_NAME), 'r', encoding='utf-8') as meta_file:
+            self.meta = json.load(meta_file)
+        if self.meta.get('snapshot_version') != SNAPSHOT_VERSION:
+            raise ValueError(f"{snapshot_dir} was written by an incompatible version")
+        columns = {name: np.load(os.path.join(snapshot_dir, f'{name}.npy'), mmap_mode='r')
+                   for name in MessageStore.COLUMNS}
+        self.store = MessageStore.from_columns(self.meta['senders'], columns)
+        self.text_offsets = np.load(os.path.join(snapshot_dir, TEXT_OFFSETS_NAME), mmap_mode='r')
+        text_path = os.path.join(snapshot_dir, TEXT_NAME)
+        if os.path.getsize(text_path):
+            self._text = np.memmap(text_path, dtype=np.uint8, mode='r')
+        else:
+            # Empty files cannot be mapped
+            self._text = np.empty(0, np.uint8)
+
+    def __len__(self):
+        return len(self.store)
+
+    @property
+    def senders(self):
+        return self.store.senders
+
+    def text(self, row):
+        """Return the text of one message"""
+        start, end = self.text_offsets[row:row + 2]
+        return self._text[start:end].tobytes().decode('utf-8')
+
+    def texts(self, start=0, stop=None):
+        """Yield the text of the messages in rows [start, stop)"""
+        stop = len(self) if stop is None else stop
+        for row in range(start, stop):
+            yield self.text(row)
+
+    def counts(self):
+        """Return the word and emoji counts saved with the snapshot"""
+        with open(os.path.join(self.path, COUNTS_NAME), 'r', encoding='utf-8') as counts_file:
+            state = json.load(counts_file)
+        return {key: _counts_from_json(value) for key, value in state.items()}
+
+    def results(self, index=False, metrics=None):
+        """Return the deep analyzer's statistics, with the store under 'store'.
+
+        ``metrics`` selects metric names as metrics.resolve_metrics() does.
+        With ``index=True`` a ChatIndex over the columns (without word and
+        emoji counts) is added under 'index' for range and sender queries.
+        """
+        selected = resolve_metrics(metrics)
+        data = self.store.aggregate(metrics=[name for name in selected if name in STORE_METRICS])
+        counts = self.counts()
+        for name, key in (('words', 'word_count'), ('emoji', 'emoji_count')):
+            if name in selected:
+                data[key] = counts[key]
+        data['store'] = self.store
+        if index:
+            from chat_index import ChatIndex
+
+            data['index'] = ChatIndex(self.store)
+        return data
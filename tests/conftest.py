@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The analyzer modules live at the top of the repository, and the synthetic
+# chat generator in benchmarks/
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks')]
+
+from synthetic_chat import iter_chat_lines  # noqa: E402
+
+
+@pytest.fixture
+def chat_lines():
+    """Messages of a small synthetic chat, a third of them multi-line"""
+    return list(iter_chat_lines(members=6, messages=2000, days=60, multiline_ratio=0.3,
+                                emoji_density=0.1, media_ratio=0.05))
+
+
+@pytest.fixture
+def write_chat(tmp_path):
+    """Return a function that writes messages as an export and returns its path"""
+    def write(lines, newline='\n', name='chat.txt', mode='w'):
+        path = tmp_path / name
+        with open(path, mode, encoding='utf-8', newline='') as file:
+            file.write(''.join(line.replace('\n', newline) + newline for line in lines))
+        return str(path)
+    return write
+
+
+def comparable(data):
+    """Return analysis results with their NumPy columns turned into lists"""
+    data = dict(data)
+    times = data.pop('message_times', None)
+    if times is not None:
+        data['message_times'] = [(times.senders[sender_id], int(timestamp))
+                                 for sender_id, timestamp in zip(times.sender_ids,
+                                                                 times.timestamps)]
+    return data
@@ -0,0 +1,44 @@
+import pytest
+
+from deep_whatsapp_analyzer import analyze_whatsapp_chat
+from metrics import metric_names
+
+# (first, end) message positions of the range, and senders by position in
+# the index's sender list
+QUERIES = [
+    (None, None, None),
+    (500, 1400, None),
+    (1999, None, None),
+    (None, 300, [0]),
+    (250, 1750, [1, 3, 4]),
+]
+
+
+@pytest.fixture
+def indexed_chat(chat_lines, write_chat):
+    path = write_chat(chat_lines, name='full.txt')
+    return analyze_whatsapp_chat(path, index=True, metrics=metric_names())['index']
+
+
+@pytest.mark.parametrize('first, end, sender_ids', QUERIES)
+def test_query_matches_parsing_the_slice(chat_lines, write_chat, indexed_chat,
+                                         first, end, sender_ids):
+    index = indexed_chat
+    # Synthetic messages are in time order, a different minute each
+    since = None if first is None else int(index.timestamps[first])
+    until = None if end is None else int(index.timestamps[end])
+    senders = None if sender_ids is None else [index.senders[i] for i in sender_ids]
+
+    selected = [line for position, line in enumerate(chat_lines[first:end], first or 0)
+                if senders is None or index.senders[index.sender_ids[position]] in senders]
+    expected = analyze_whatsapp_chat(write_chat(selected, name='slice.txt'),
+                                     metrics=metric_names())
+    del expected['message_times']
+    assert index.query(since, until, senders) == expected
+
+
+def test_empty_range(indexed_chat):
+    index = indexed_chat
+    data = index.query(index.end, None)
+    assert not data['message_count']
+    assert not data['word_count']
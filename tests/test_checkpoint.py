@@ -0,0 +1,73 @@
+import pytest
+
+import checkpoint
+from conftest import comparable
+from deep_whatsapp_analyzer import analyze_whatsapp_chat
+from metrics import metric_names
+
+
+@pytest.fixture
+def parsed_ranges(monkeypatch):
+    """Record the (start, end) byte ranges parsed before the last message"""
+    ranges = []
+    parse_range = checkpoint.parse_range
+
+    def record(file_path, start, end, *args):
+        ranges.append((start, end))
+        return parse_range(file_path, start, end, *args)
+
+    monkeypatch.setattr(checkpoint, 'parse_range', record)
+    return ranges
+
+
+def analyze(path, checkpoint_file):
+    return checkpoint.analyze_incremental(path, checkpoint_file, chunk_size=64,
+                                          metrics=metric_names())
+
+
+def test_resume_after_append(chat_lines, write_chat, tmp_path, parsed_ranges):
+    checkpoint_file = str(tmp_path / 'checkpoint.pickle')
+    path = write_chat(chat_lines[:1500])
+    analyze(path, checkpoint_file)
+    resume = checkpoint.load_checkpoint(checkpoint_file)['resume']
+    assert resume > 0
+
+    write_chat(chat_lines[1500:], mode='a')
+    parsed_ranges.clear()
+    data = analyze(path, checkpoint_file)
+    # Only the bytes after the checkpoint are parsed again
+    assert [start for start, _ in parsed_ranges] == [resume]
+    assert comparable(data) == comparable(analyze_whatsapp_chat(path, metrics=metric_names()))
+
+
+def test_resume_when_last_message_grows(chat_lines, write_chat, tmp_path, parsed_ranges):
+    checkpoint_file = str(tmp_path / 'checkpoint.pickle')
+    path = write_chat(chat_lines[:1000])
+    analyze(path, checkpoint_file)
+    resume = checkpoint.load_checkpoint(checkpoint_file)['resume']
+
+    # A continuation line of the last message, then new messages
+    write_chat(['and more words 🎉'] + chat_lines[1000:1200], mode='a')
+    parsed_ranges.clear()
+    data = analyze(path, checkpoint_file)
+    assert [start for start, _ in parsed_ranges] == [resume]
+    assert sum(data['message_count'].values()) == 1200
+    assert comparable(data) == comparable(analyze_whatsapp_chat(path, metrics=metric_names()))
+
+
+def test_rewritten_head_is_parsed_again(chat_lines, write_chat, tmp_path, parsed_ranges):
+    checkpoint_file = str(tmp_path / 'checkpoint.pickle')
+    path = write_chat(chat_lines[:1500])
+    analyze(path, checkpoint_file)
+
+    # Same length, so only the prefix hash tells the exports apart
+    header, _, text = chat_lines[0].partition(': ')
+    word = 'x' * len(text.encode('utf-8'))
+    rewritten = [f'{header}: {word}'] + chat_lines[1:]
+    assert len(rewritten[0].encode('utf-8')) == len(chat_lines[0].encode('utf-8'))
+    write_chat(rewritten)
+    parsed_ranges.clear()
+    data = analyze(path, checkpoint_file)
+    assert [start for start, _ in parsed_ranges] == [0]
+    assert comparable(data) == comparable(analyze_whatsapp_chat(path, metrics=metric_names()))
+    assert data['word_count'][word] == 1
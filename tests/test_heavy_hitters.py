@@ -0,0 +1,67 @@
+import pickle
+import random
+from collections import Counter
+
+import pytest
+
+from heavy_hitters import TopKCounter
+
+CAPACITY = 50
+
+
+@pytest.fixture
+def stream():
+    """Zipf-like words: a few frequent ones and a long tail"""
+    rng = random.Random(0)
+    words = [f'word{rank}' for rank in range(1, 5001)]
+    weights = [1 / rank for rank in range(1, 5001)]
+    return rng.choices(words, weights, k=100000)
+
+
+def assert_within_bound(summary, exact):
+    assert summary.total() == sum(exact.values())
+    assert summary.error <= summary.total() / (summary.capacity + 1)
+    assert len(summary) <= 2 * summary.capacity
+    for item, count in exact.items():
+        # Counts are never above the true count, and at most error below
+        assert count - summary.error <= summary[item] <= count
+        if count > summary.error:
+            assert item in summary
+
+
+def test_error_bound(stream):
+    summary = TopKCounter(CAPACITY)
+    for start in range(0, len(stream), 1000):
+        summary.update(stream[start:start + 1000])
+    assert summary.error > 0
+    assert_within_bound(summary, Counter(stream))
+
+
+def test_error_bound_after_merging(stream):
+    merged = TopKCounter(CAPACITY)
+    for start in range(0, len(stream), 25000):
+        part = TopKCounter(CAPACITY)
+        for offset in range(start, start + 25000, 1000):
+            part.update(stream[offset:offset + 1000])
+        merged.update(part)
+    assert_within_bound(merged, Counter(stream))
+
+
+def test_most_common_matches_exact_counts(stream):
+    summary = TopKCounter(CAPACITY)
+    summary.update(stream)
+    exact = Counter(stream)
+    # The top counts are further apart than twice the error
+    top = exact.most_common(4)
+    assert all(count - next_count > 2 * summary.error
+               for (_, count), (_, next_count) in zip(top, top[1:]))
+    assert [item for item, _ in summary.most_common(3)] == [item for item, _ in top[:3]]
+
+
+def test_pickle_keeps_error(stream):
+    summary = TopKCounter(CAPACITY)
+    summary.update(stream)
+    restored = pickle.loads(pickle.dumps(summary))
+    assert restored == summary
+    assert (restored.capacity, restored.error, restored.total()) == (
+        summary.capacity, summary.error, summary.total())
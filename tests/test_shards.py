@@ -0,0 +1,55 @@
+import pytest
+
+from conftest import comparable
+from deep_whatsapp_analyzer import analyze_whatsapp_chat, find_message_start, shard_boundaries
+from metrics import metric_names
+
+NEWLINES = pytest.mark.parametrize('newline', ['\n', '\r\n'], ids=['lf', 'crlf'])
+
+
+def message_offsets(lines, newline):
+    """Return the byte offset at which each message starts"""
+    offsets = []
+    offset = 0
+    for line in lines:
+        offsets.append(offset)
+        offset += len((line.replace('\n', newline) + newline).encode('utf-8'))
+    return offsets
+
+
+@NEWLINES
+@pytest.mark.parametrize('jobs', [2, 3, 7])
+def test_sharded_results_match_serial(chat_lines, write_chat, newline, jobs):
+    path = write_chat(chat_lines, newline)
+    serial = analyze_whatsapp_chat(path, metrics=metric_names())
+    # Small chunks, so chunk boundaries also fall inside messages
+    sharded = analyze_whatsapp_chat(path, chunk_size=64, jobs=jobs, metrics=metric_names())
+    assert sum(serial['message_count'].values()) == len(chat_lines)
+    assert comparable(sharded) == comparable(serial)
+
+
+@NEWLINES
+def test_shards_start_on_messages(chat_lines, write_chat, newline):
+    path = write_chat(chat_lines, newline)
+    starts = set(message_offsets(chat_lines, newline))
+    shards = shard_boundaries(path, 16, chunk_size=64)
+    assert len(shards) == 16
+    for (start, end), (next_start, _) in zip(shards, shards[1:]):
+        assert start in starts
+        assert next_start in starts
+        assert next_start - end == len(newline)
+
+
+@NEWLINES
+def test_boundary_inside_multiline_message(chat_lines, write_chat, newline):
+    path = write_chat(chat_lines, newline)
+    offsets = message_offsets(chat_lines, newline)
+    with open(path, 'rb') as file:
+        for index, line in enumerate(chat_lines[:-1]):
+            if '\n' not in line:
+                continue
+            # The start of the continuation line is not a message start
+            continuation = offsets[index] + len(line[:line.index('\n') + 1]
+                                                .replace('\n', newline).encode('utf-8'))
+            found = find_message_start(file, continuation, 64)
+            assert found == offsets[index + 1] - len(newline)
@@ -0,0 +1,29 @@
+import pytest
+from wordcloud import WordCloud
+
+from deep_whatsapp_analyzer import WORD_CLOUD_STOPWORDS, analyze_whatsapp_chat, word_frequencies
+
+TRICKY_TEXTS = [
+    "Cats cat CAT cat's Dogs dog's dogs",
+    "The class classes glass's it's don't 123 4ever",
+    "Media omitted, really?! (yes) no... Café café CAFÉ",
+    "नमस्ते दुनिया naïve Naïve re-use well-known",
+]
+
+
+@pytest.fixture
+def chat_path(chat_lines, write_chat):
+    header = chat_lines[0].partition(': ')[0]
+    return write_chat(chat_lines + [f'{header}: {text}' for text in TRICKY_TEXTS])
+
+
+def test_all_text_is_only_kept_on_request(chat_path):
+    assert 'all_text' not in analyze_whatsapp_chat(chat_path)
+    assert 'Dogs dog' in analyze_whatsapp_chat(chat_path, keep_text=True)['all_text']
+
+
+def test_frequencies_match_word_cloud_of_full_text(chat_path):
+    data = analyze_whatsapp_chat(chat_path, keep_text=True)
+    expected = WordCloud(stopwords=WORD_CLOUD_STOPWORDS,
+                         collocations=False).process_text(data['all_text'])
+    assert word_frequencies(data['word_count']) == expected
@@ -0,0 +1,105 @@
+from collections import namedtuple
+import numpy as np
+from chat_formats import MINUTES_PER_DAY
+
+# Bucket sizes, from finest to coarsest: days, weeks starting on Monday, months
+GRANULARITIES = ('day', 'week', 'month')
+
+# Buckets averaged by the rolling overlay of each granularity
+ROLLING_WINDOWS = {'day': 7, 'week': 4, 'month': 3}
+
+# Most buckets drawn before switching to a coarser granularity
+DEFAULT_MAX_POINTS = 400
+
+Timeline = namedtuple('Timeline', 'granularity starts counts rolling window')
+Timeline.__doc__ = """Messages per time bucket.
+
+``starts`` holds the first day of every bucket as datetime64[D] and
+``counts`` the messages in it, with empty buckets included. ``rolling``
+is the trailing mean over ``window`` buckets (NaN until the window is
+full).
+"""
+
+
+def _bucket_starts(days, granularity):
+    """Return the datetime64[D] start of the bucket of each day"""
+    if granularity == 'day':
+        return days
+    if granularity == 'week':
+        # 1970-01-01 was a Thursday, so Monday is 3 days after a multiple of 7
+        offsets = (days.astype(np.int64) + 3) % 7
+        return days - offsets.astype('timedelta64[D]')
+    if granularity == 'month':
+        return days.astype('datetime64[M]').astype('datetime64[D]')
+    raise ValueError(f"unknown granularity {granularity!r}, expected one of: "
+                     f"{', '.join(GRANULARITIES)}")
+
+
+def _bucket_range(first, last, granularity):
+    """Return the start of every bucket from the one holding ``first`` to
+    the one holding ``last``"""
+    if granularity == 'month':
+        months = np.arange(first.astype('datetime64[M]'), last.astype('datetime64[M]') + 1)
+        return months.astype('datetime64[D]')
+    step = 7 if granularity == 'week' else 1
+    first, last = _bucket_starts(np.array([first, last]), granularity)
+    return np.arange(first, last + 1, step)
+
+
+def bucket_count(first, last, granularity):
+    """Return the number of buckets the days [first, last] span"""
+    return len(_bucket_range(np.datetime64(first, 'D'), np.datetime64(last, 'D'), granularity))
+
+
+def choose_granularity(first, last, max_points=DEFAULT_MAX_POINTS):
+    """Return the finest granularity with at most ``max_points`` buckets"""
+    for granularity in GRANULARITIES:
+        if bucket_count(first, last, granularity) <= max_points:
+            return granularity
+    return GRANULARITIES[-1]
+
+
+def rolling_mean(counts, window):
+    """Return the trailing mean over ``window`` values, NaN until it is full"""
+    rolling = np.full(len(counts), np.nan)
+    if len(counts) >= window:
+        sums = np.cumsum(np.concatenate(([0], counts)), dtype=np.float64)
+        rolling[window - 1:] = (sums[window:] - sums[:-window]) / window
+    return rolling
+
+
+def bucket_days(days, weights=None, granularity=None, max_points=DEFAULT_MAX_POINTS):
+    """Count datetime64[D] days (times ``weights``) per bucket.
+
+    ``granularity`` is one of GRANULARITIES, or None to pick the finest
+    one that fits in ``max_points`` buckets.
+    """
+    days = np.asarray(days, dtype='datetime64[D]')
+    if not len(days):
+        granularity = granularity or GRANULARITIES[0]
+        return Timeline(granularity, np.empty(0, 'datetime64[D]'), np.empty(0, np.int64),
+                        np.empty(0), ROLLING_WINDOWS[granularity])
+    first, last = days.min(), days.max()
+    granularity = granularity or choose_granularity(first, last, max_points)
+    starts = _bucket_range(first, last, granularity)
+    positions = np.searchsorted(starts, _bucket_starts(days, granularity))
+    counts = np.bincount(positions, weights=weights, minlength=len(starts)).astype(np.int64)
+    window = ROLLING_WINDOWS[granularity]
+    return Timeline(granularity, starts, counts, rolling_mean(counts, window), window)
+
+
+def bucket_timestamps(timestamps, granularity=None, max_points=DEFAULT_MAX_POINTS):
+    """Count messages per bucket from their timestamps (minutes since 1970),
+    e.g. the ``timestamps`` column of a MessageStore"""
+    days = np.floor_divide(np.asarray(timestamps, dtype=np.int64), MINUTES_PER_DAY)
+    return bucket_days(days.astype('datetime64[D]'), granularity=granularity,
+                       max_points=max_points)
+
+
+def activity_timeline(data, granularity=None, max_points=DEFAULT_MAX_POINTS):
+    """Return the Timeline of analysis results, from their 'date_activity'"""
+    date_activity = data['date_activity']
+    # NumPy parses the ISO dates itself, without a Python call per date
+    days = np.array(list(date_activity), dtype='datetime64[D]')
+    counts = np.fromiter(date_activity.values(), np.int64, len(date_activity))
+    return bucket_days(days, counts, granularity, max_points)
@@ -1,32 +1,18 @@
-import re
-from collections import Counter
 import os
-import matplotlib.pyplot as plt
-
-
-def analyze_whatsapp_chat(file_path):
-    # Updated regular expression to match the format in your file
-    # Format: "DD/MM/YY, HH:MM am/pm - Sender: Message"
-    pattern = r'^(\d+/\d+/\d+,\s\d+:\d+\s[ap]m)\s-\s([^:]+?)(?:\s\(.*?\))?:\s'
-
-    # Counter to store the number of messages per sender
-    message_count = Counter()
-
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            for line in file:
-                match = re.match(pattern, line)
-                if match:
-                    sender = match.group(2).strip()
-                    message_count[sender] += 1
-    except UnicodeDecodeError:
-        # If UTF-8 fails, try with another common encoding
-        with open(file_path, 'r', encoding='utf-16') as file:
-            for line in file:
-                match = re.match(pattern, line)
-                if match:
-                    sender = match.group(2).strip()
-                    message_count[sender] += 1
+from deep_whatsapp_analyzer import analyze_whatsapp_chat as analyze_chat
+
+# The basic analysis only counts messages per sender
+BASIC_METRICS = ('senders',)
+
+
+def analyze_whatsapp_chat(file_path, chat_format=None, profiler=None):
+    # The export format (e.g. "DD/MM/YY, HH:MM am/pm - Sender: Message" or
+    # "[DD/MM/YYYY, HH:MM:SS] Sender: Message") is detected from the first
+    # lines of the file unless given. The chat is parsed by the same engine
+    # as the deep analysis, with only the sender counts enabled. A profiler
+    # (see profiling.Profiler) times the parse steps
+    message_count = analyze_chat(file_path, chat_format=chat_format, profiler=profiler,
+                                 metrics=BASIC_METRICS)['message_count']
 
     # Filter out WhatsApp system messages
     if "Messages and calls are end-to-end encrypted" in message_count:
@@ -59,6 +45,9 @@ def print_results(message_count):
 
 
 def plot_results(message_count):
+    # Imported here so counting messages does not require matplotlib
+    import matplotlib.pyplot as plt
+
     # Sort by number of messages in descending order
     sorted_counts = sorted(message_count.items(),
                            key=lambda x: x[1], reverse=True)